@@ -1,19 +1,87 @@
 import json
-import re
 import threading
+import time
 from collections import deque
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 from uuid import uuid4
 
-import requests
-
+from app.agent_log_sink import agent_log_sink
+from app.agent_status import StatusIndex, new_status, snapshot
+from app.agent_patterns import (
+    BP_PAIR,
+    BP_SINGLE,
+    CODE_FENCE_END,
+    CODE_FENCE_START,
+    DIGIT,
+    UUID,
+    symptom_matcher,
+)
 from app.config import settings
+from app.json_stream import JSONStreamParser
+from app.llm_gateway import llm_gateway
+from app.metrics import agent_iterations, agent_run_duration_seconds
+from app import tracing
+from app.prompt_builder import estimate_tokens, truncate_to_tokens
 from app.supabase_client import get_supabase_client
 
 
+AGENT_TOOLS = [
+    "extract_data",
+    "validate_data",
+    "check_duplicates",
+    "save_to_database",
+    "ask_clarification",
+    "search_knowledge",
+    "calculate_metrics",
+    "get_user_history",
+    "finish",
+]
+
+# JSON schemas for Ollama's structured output (AGENT_LLM_FORMAT=schema). Property
+# order is the generation order: the decision fields come before the free text
+# so a streamed think call can stop as soon as they are complete.
+DECISION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "has_health_data": {"type": "boolean"},
+        "confidence_score": {"type": "number"},
+        "action": {"type": "string", "enum": AGENT_TOOLS},
+        "action_input": {"type": "object"},
+        "reasoning": {"type": "string"},
+        "why_this_action": {"type": "string"},
+    },
+    "required": ["action"],
+}
+DEFAULT_MAX_ITERATIONS = 10
+_HISTORY_WINDOW = 10  # conversation entries the agent sees besides the turn(s) it is processing
+
+_ITEM_LIST = {"type": "array", "items": {"type": "object"}}
+EXTRACTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "health_records": _ITEM_LIST,
+        "medicines": _ITEM_LIST,
+        "appointments": _ITEM_LIST,
+        "symptoms": _ITEM_LIST,
+    },
+    "required": ["health_records", "medicines", "appointments", "symptoms"],
+}
+
+
+def _decision_ready(parser: JSONStreamParser) -> bool:
+    """The think call needs action (+ action_input if the model writes one next), not the prose after it."""
+    if not parser.has_complete("action"):
+        return False
+    if parser.has_complete("action_input"):
+        return True
+    keys = parser.completed_keys()
+    after_action = keys[keys.index("action") + 1 :]
+    return bool(after_action) or (parser.current_key not in (None, "action_input"))
+
+
 class AgentState(Enum):
     IDLE = "IDLE"
     THINKING = "THINKING"
@@ -41,8 +109,8 @@ def _safe_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     if not text:
         return None
     cleaned = text.strip()
-    cleaned = re.sub(r"^```(?:json)?", "", cleaned, flags=re.IGNORECASE).strip()
-    cleaned = re.sub(r"```$", "", cleaned).strip()
+    cleaned = CODE_FENCE_START.sub("", cleaned).strip()
+    cleaned = CODE_FENCE_END.sub("", cleaned).strip()
     # Try direct load
     try:
         return json.loads(cleaned)
@@ -59,6 +127,10 @@ def _safe_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     return None
 
 
+def _empty_extracted() -> Dict[str, List[Dict[str, Any]]]:
+    return {"health_records": [], "medicines": [], "appointments": [], "symptoms": []}
+
+
 def _to_date_str(value: Optional[str]) -> str:
     if not value:
         return datetime.now().strftime("%Y-%m-%d")
@@ -80,10 +152,10 @@ def _parse_bp(value: Any) -> Tuple[Optional[float], Optional[float]]:
     if isinstance(value, (int, float)):
         return float(value), None
     s = str(value)
-    match = re.search(r"(\d{2,3})\s*/\s*(\d{2,3})", s)
+    match = BP_PAIR.search(s)
     if match:
         return float(match.group(1)), float(match.group(2))
-    match = re.search(r"(\d{2,3})", s)
+    match = BP_SINGLE.search(s)
     if match:
         return float(match.group(1)), None
     return None, None
@@ -92,20 +164,13 @@ def _parse_bp(value: Any) -> Tuple[Optional[float], Optional[float]]:
 def _is_uuid(value: Optional[str]) -> bool:
     if not value or not isinstance(value, str):
         return False
-    return bool(re.match(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[1-5][0-9a-fA-F]{3}-[89abAB][0-9a-fA-F]{3}-[0-9a-fA-F]{12}$", value))
-
-
-def _split_symptoms(text: str) -> List[str]:
-    if not text:
-        return []
-    parts = re.split(r",| and | & |;", text)
-    return [p.strip() for p in parts if p.strip()]
+    return UUID.fullmatch(value) is not None
 
 
 def _source_has_number(text: Optional[str]) -> bool:
     if not text:
         return False
-    return bool(re.search(r"\d", text))
+    return DIGIT.search(text) is not None
 
 
 def _normalize_frequency(freq: Optional[str]) -> str:
@@ -124,28 +189,37 @@ class HealthDataAgent:
         self,
         *,
         user_id: str,
-        max_iterations: int = 10,
+        max_iterations: int = DEFAULT_MAX_ITERATIONS,
         confidence_threshold: float = 0.5,
+        pipeline_mode: Optional[str] = None,
     ) -> None:
         self.user_id = user_id
+        # "fast": one extraction call + deterministic steps; "react": LLM picks every step
+        self.pipeline_mode = (pipeline_mode or settings.agent_pipeline_mode).lower()
         self.max_iterations = max_iterations
         self.confidence_threshold = confidence_threshold
         self.min_save_confidence = 0.5
         self.auto_save_confidence = 0.7
         self.current_state = AgentState.IDLE
         self.current_iteration = 0
-        self.conversation_turns = deque(maxlen=10)
-        self.extracted_data: Dict[str, List[Dict[str, Any]]] = {
-            "health_records": [],
-            "medicines": [],
-            "appointments": [],
-            "symptoms": [],
-        }
+        self.conversation_turns: Deque[Dict[str, Any]] = deque(maxlen=_HISTORY_WINDOW)
+        self.extracted_data: Dict[str, List[Dict[str, Any]]] = _empty_extracted()
+        # Counts of extracted items per pipeline state; kept in step with each item's _status
+        self._status_index = StatusIndex(self._should_save_item)
         self.pending_clarifications: List[Dict[str, Any]] = []
         self.execution_trace: List[Dict[str, Any]] = []
         self.action_history: List[str] = []
         self.observations: List[str] = []
         self.last_saved: Dict[str, Any] = {"count": 0, "items": [], "timestamp": None}
+        self.max_serialized_trace = 50
+        # Prompt token budgets for the conversation part of agent prompts
+        self.max_turn_tokens = 300
+        self.reasoning_conversation_budget = 600
+        self.extraction_conversation_budget = 1200
+        self.last_prompt_tokens = 0
+        self.turn_llm_calls = 0
+        self.turn_saved_count = 0
+        self._step_started: Optional[float] = None
         self._lock = threading.Lock()
         self._supabase = get_supabase_client(use_service_role=True)
 
@@ -159,6 +233,7 @@ class HealthDataAgent:
         assistant_response: str,
         member_id: Optional[str] = None,
         conversation_history: Optional[List[Dict[str, str]]] = None,
+        coalesced_turns: int = 0,
     ) -> Dict[str, Any]:
         with self._lock:
             if member_id in ("", "me", "null") or not _is_uuid(member_id):
@@ -168,55 +243,49 @@ class HealthDataAgent:
             session_id = str(uuid4())
 
             if conversation_history:
-                self.conversation_turns.clear()
-                for turn in conversation_history[-10:]:
-                    role = turn.get("role", "user")
-                    content = turn.get("content", "")
-                    self.conversation_turns.append({"role": role, "content": content})
-                # Ensure the latest user message is present
-                if user_message and (not self.conversation_turns or self.conversation_turns[-1].get("content") != user_message):
-                    self.conversation_turns.append({"role": "user", "content": user_message})
+                # Last 10 entries of context, widened so every exchange merged into this turn fits
+                window = _HISTORY_WINDOW + 2 * (coalesced_turns + 1)
+                turns = [
+                    {"role": turn.get("role", "user"), "content": turn.get("content", "")}
+                    for turn in conversation_history[-window:]
+                ]
+                # Ensure the latest exchange closes the history (coalesced turns already carry it)
+                if user_message and {"role": "user", "content": user_message} not in turns[-2:]:
+                    turns.append({"role": "user", "content": user_message})
+                if assistant_response and {"role": "assistant", "content": assistant_response} not in turns[-2:]:
+                    turns.append({"role": "assistant", "content": assistant_response})
+                self.conversation_turns = deque(turns, maxlen=max(_HISTORY_WINDOW, len(turns)))
             else:
+                if self.conversation_turns.maxlen != _HISTORY_WINDOW:
+                    # Back to the normal window after a turn that carried merged exchanges
+                    self.conversation_turns = deque(self.conversation_turns, maxlen=_HISTORY_WINDOW)
                 self.conversation_turns.append({"role": "user", "content": user_message})
                 if assistant_response:
                     self.conversation_turns.append({"role": "assistant", "content": assistant_response})
 
-            saved_count = 0
+            self.turn_saved_count = 0
+            self.turn_llm_calls = 0
             try:
-                while self.current_iteration < self.max_iterations:
-                    self.current_iteration += 1
-                    self.current_state = AgentState.THINKING
-                    decision = self._think()
-                    if decision.action == "finish":
-                        break
-
-                    self.current_state = AgentState.ACTING
-                    observation, delta_saved = self._execute_action(
-                        decision.action,
-                        decision.action_input or {},
-                        member_id,
-                    )
-                    saved_count += delta_saved
-
-                    self.current_state = AgentState.REFLECTING
-                    self._reflect(decision, observation, session_id)
-
-                    if decision.action == "ask_clarification" and self.pending_clarifications:
-                        break
+                with agent_run_duration_seconds.time(mode=self.pipeline_mode):
+                    if self.pipeline_mode == "react":
+                        self._run_react_loop(member_id, session_id)
+                    else:
+                        self._run_fast_pipeline(member_id, session_id)
+                agent_iterations.observe(self.current_iteration, mode=self.pipeline_mode)
 
                 self.current_state = AgentState.COMPLETED
-                extracted_snapshot = json.loads(json.dumps(self.extracted_data))
-                if not self.pending_clarifications:
-                    self.extracted_data = {
-                        "health_records": [],
-                        "medicines": [],
-                        "appointments": [],
-                        "symptoms": [],
-                    }
+                if self.pending_clarifications:
+                    # Items stay live for the clarification round; hand out a copy
+                    extracted_snapshot = snapshot(self.extracted_data)
+                else:
+                    # Nothing touches the old lists after the reset, so no copy is needed
+                    extracted_snapshot = self.extracted_data
+                    self._reset_extracted()
                 return {
                     "success": True,
                     "extracted_data": extracted_snapshot,
-                    "saved_items": saved_count,
+                    "saved_items": self.turn_saved_count,
+                    "llm_calls": self.turn_llm_calls,
                     "clarifications_needed": self.pending_clarifications,
                     "trace": self.execution_trace,
                 }
@@ -232,23 +301,52 @@ class HealthDataAgent:
                     success=False,
                     reasoning="Agent failed during processing.",
                     confidence_score=0.0,
+                    duration_ms=self._step_duration_ms(),
                 )
                 return {
                     "success": False,
                     "error": str(exc),
                     "extracted_data": self.extracted_data,
-                    "saved_items": saved_count,
+                    "saved_items": self.turn_saved_count,
+                    "llm_calls": self.turn_llm_calls,
                     "clarifications_needed": self.pending_clarifications,
                     "trace": self.execution_trace,
                 }
 
-    def reset(self, *, full_reset: bool = False) -> None:
-        self.extracted_data = {
-            "health_records": [],
-            "medicines": [],
-            "appointments": [],
-            "symptoms": [],
+    def to_state(self) -> Dict[str, Any]:
+        """Serialisable snapshot of conversational state (used when the registry evicts an agent)."""
+        return {
+            "user_id": self.user_id,
+            "conversation_turns": list(self.conversation_turns),
+            "extracted_data": self.extracted_data,
+            "pending_clarifications": self.pending_clarifications,
+            "execution_trace": self.execution_trace[-self.max_serialized_trace:],
+            "action_history": self.action_history[-self.max_serialized_trace:],
+            "observations": self.observations[-self.max_serialized_trace:],
+            "last_saved": self.last_saved,
         }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], **kwargs: Any) -> "HealthDataAgent":
+        """Rebuild an agent from to_state() output; unknown or missing keys fall back to defaults."""
+        agent = cls(user_id=state["user_id"], **kwargs)
+        agent.conversation_turns.extend(state.get("conversation_turns") or [])
+        extracted = state.get("extracted_data") or {}
+        for key in agent.extracted_data:
+            agent.extracted_data[key] = list(extracted.get(key) or [])
+        agent._status_index.rebuild(agent.extracted_data)
+        agent.pending_clarifications = list(state.get("pending_clarifications") or [])
+        agent.execution_trace = list(state.get("execution_trace") or [])
+        agent.action_history = list(state.get("action_history") or [])
+        agent.observations = list(state.get("observations") or [])
+        agent.last_saved = state.get("last_saved") or agent.last_saved
+        return agent
+
+    def is_busy(self) -> bool:
+        return self._lock.locked()
+
+    def reset(self, *, full_reset: bool = False) -> None:
+        self._reset_extracted()
         self.pending_clarifications = []
         self.execution_trace = []
         self.action_history = []
@@ -262,9 +360,76 @@ class HealthDataAgent:
     # ----------------------------
     # Core loop
     # ----------------------------
+    def _run_react_loop(self, member_id: Optional[str], session_id: str) -> None:
+        """ReAct mode: one LLM "think" call per step, up to max_iterations."""
+        while self.current_iteration < self.max_iterations:
+            self.current_iteration += 1
+            self._step_started = time.perf_counter()
+            self.current_state = AgentState.THINKING
+            decision = self._think()
+            if decision.action == "finish":
+                break
+
+            self._act_and_reflect(decision, member_id, session_id)
+
+            if decision.action == "ask_clarification" and self.pending_clarifications:
+                break
+
+    def _run_fast_pipeline(self, member_id: Optional[str], session_id: str) -> None:
+        """
+        Fast mode: a single extraction LLM call, then the deterministic steps the
+        ReAct guards would force anyway: validate -> clarify or dedupe -> save.
+        """
+        self._run_step("extract_data", member_id, session_id)
+        if not any(self.extracted_data.values()):
+            return
+        metrics = {
+            (r.get("type") or r.get("metric") or "").lower()
+            for r in self.extracted_data["health_records"]
+        }
+        if {"weight", "height"} <= metrics:
+            self._run_step("calculate_metrics", member_id, session_id)
+        self._run_step("validate_data", member_id, session_id)
+        if self._status_index.needs_clarification:
+            self._run_step("ask_clarification", member_id, session_id)
+            return
+        self._run_step("check_duplicates", member_id, session_id)
+        if self._status_index.saveable:
+            self._run_step("save_to_database", member_id, session_id)
+
+    def _run_step(self, action: str, member_id: Optional[str], session_id: str) -> None:
+        self.current_iteration += 1
+        self._step_started = time.perf_counter()
+        decision = AgentDecision(
+            reasoning="Fast pipeline step.",
+            has_health_data=True,
+            confidence_score=1.0,
+            action=action,
+            action_input={},
+            why_this_action="Deterministic pipeline order.",
+        )
+        self._act_and_reflect(decision, member_id, session_id)
+
+    def _act_and_reflect(self, decision: AgentDecision, member_id: Optional[str], session_id: str) -> None:
+        self.current_state = AgentState.ACTING
+        observation, delta_saved = self._execute_action(
+            decision.action,
+            decision.action_input or {},
+            member_id,
+        )
+        self.turn_saved_count += delta_saved
+
+        self.current_state = AgentState.REFLECTING
+        self._reflect(decision, observation, session_id)
+
     def _think(self) -> AgentDecision:
         prompt = self._build_reasoning_prompt()
-        response = self._call_llm(prompt, system_prompt="You are an autonomous health data agent.")
+        response = self._call_llm(
+            prompt,
+            system_prompt="You are an autonomous health data agent.",
+            schema=DECISION_SCHEMA,
+            stop_when=_decision_ready,
+        )
         data = _safe_json_from_text(response) if response else None
 
         if not data or "action" not in data:
@@ -305,6 +470,7 @@ class HealthDataAgent:
         return "No-op action", 0
 
     def _reflect(self, decision: AgentDecision, observation: str, session_id: str) -> None:
+        duration_ms = self._step_duration_ms()
         self.action_history.append(decision.action)
         self.observations.append(observation)
         self.execution_trace.append(
@@ -313,6 +479,8 @@ class HealthDataAgent:
                 "state": self.current_state.value,
                 "action": decision.action,
                 "observation": observation,
+                "prompt_tokens": self.last_prompt_tokens,
+                "duration_ms": duration_ms,
             }
         )
         self._log_execution(
@@ -325,8 +493,15 @@ class HealthDataAgent:
             success=True,
             reasoning=decision.reasoning,
             confidence_score=decision.confidence_score,
+            duration_ms=duration_ms,
         )
 
+    def _step_duration_ms(self) -> Optional[int]:
+        """Wall time of the current step (think + act + reflect) so far."""
+        if self._step_started is None:
+            return None
+        return int((time.perf_counter() - self._step_started) * 1000)
+
     def _get_last_user_message(self) -> str:
         for turn in reversed(self.conversation_turns):
             if turn.get("role") == "user":
@@ -334,59 +509,17 @@ class HealthDataAgent:
         return ""
 
     def _heuristic_symptom_extract(self, text: str) -> List[str]:
-        if not text:
-            return []
-        lowered = text.lower()
-        # Try to capture symptoms after common phrases
-        patterns = [
-            r"(?:i have|i am having|i'm having|i've been having|suffering from|symptoms?:)\\s*(.+)",
-            r"(?:feeling|feel)\\s*(.+)",
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, lowered)
-            if match:
-                segment = match.group(1)
-                segment = re.split(r"\\s+since\\s+|\\s+for\\s+", segment)[0]
-                return _split_symptoms(segment)
-
-        # Simple keyword fallback
-        common = [
-            "fever",
-            "cold",
-            "cough",
-            "headache",
-            "nausea",
-            "vomiting",
-            "fatigue",
-            "sore throat",
-            "body ache",
-            "diarrhea",
-            "stomach pain",
-            "chills",
-            "dizziness",
-        ]
-        found = [symptom for symptom in common if symptom in lowered]
-        return found
+        # Only known symptom terms: free text after "I have"/"feeling" is too often
+        # not a symptom ("I have a question about my dosage") to save at 0.6 confidence
+        return symptom_matcher.find(text)
 
     def _guard_decision(self, decision: AgentDecision) -> AgentDecision:
-        has_items = any(len(v) > 0 for v in self.extracted_data.values())
+        index = self._status_index
+        has_items = index.total > 0
         recent = self.action_history[-2:]
-        needs_validation = any(
-            not item.get("_status", {}).get("validated", False)
-            for items in self.extracted_data.values()
-            for item in items
-        )
-        needs_duplicates = any(
-            item.get("_status", {}).get("validated", False)
-            and not item.get("_status", {}).get("duplicate_checked", False)
-            for items in self.extracted_data.values()
-            for item in items
-        )
-        has_pending_clarifications = any(
-            item.get("_status", {}).get("needs_clarification", False)
-            for items in self.extracted_data.values()
-            for item in items
-        )
+        needs_validation = index.needs_validation > 0
+        needs_duplicates = index.needs_duplicates > 0
+        has_pending_clarifications = index.needs_clarification > 0
 
         # If we just extracted, move forward (or finish if nothing found)
         if self.action_history and self.action_history[-1] == "extract_data":
@@ -461,7 +594,7 @@ class HealthDataAgent:
                     action_input={},
                     why_this_action="Duplicate check required.",
                 )
-            if any(self._should_save_item(item) for items in self.extracted_data.values() for item in items):
+            if index.saveable:
                 return AgentDecision(
                     reasoning="Ready to save validated items.",
                     has_health_data=True,
@@ -478,38 +611,25 @@ class HealthDataAgent:
     # ----------------------------
     def _tool_extract_data(self, action_input: Dict[str, Any]) -> str:
         prompt = self._build_extraction_prompt()
-        response = self._call_llm(prompt, system_prompt="You extract structured health data.")
+        response = self._call_llm(
+            prompt,
+            system_prompt="You extract structured health data.",
+            schema=EXTRACTION_SCHEMA,
+        )
         data = _safe_json_from_text(response) if response else None
         if not data:
-            self.extracted_data = {
-                "health_records": [],
-                "medicines": [],
-                "appointments": [],
-                "symptoms": [],
-            }
+            self._reset_extracted()
             return "Extraction failed: invalid JSON."
 
         # Reset extracted data to avoid accumulation across turns
-        self.extracted_data = {
-            "health_records": [],
-            "medicines": [],
-            "appointments": [],
-            "symptoms": [],
-        }
+        self._reset_extracted()
 
         for key in ["health_records", "medicines", "appointments", "symptoms"]:
             items = data.get(key, []) or []
             if not isinstance(items, list):
                 continue
             for item in items:
-                item["_status"] = {
-                    "validated": False,
-                    "duplicate_checked": False,
-                    "duplicate": False,
-                    "saved": False,
-                    "needs_clarification": False,
-                    "issues": [],
-                }
+                item["_status"] = new_status()
                 if "confidence" not in item and "confidence_score" in item:
                     item["confidence"] = item.get("confidence_score")
                 self.extracted_data[key].append(item)
@@ -547,14 +667,7 @@ class HealthDataAgent:
                         "start_date": None,
                         "confidence": 0.7,
                         "source_text": f"User mentioned {hinted_name}.",
-                        "_status": {
-                            "validated": False,
-                            "duplicate_checked": False,
-                            "duplicate": False,
-                            "saved": False,
-                            "needs_clarification": False,
-                            "issues": [],
-                        },
+                        "_status": new_status(),
                     }
                 )
         # If LLM suggested a medicine name, keep only matching medicines
@@ -578,14 +691,7 @@ class HealthDataAgent:
                             "started_at": None,
                             "confidence": 0.7,
                             "source_text": f"User mentioned {symptom}.",
-                            "_status": {
-                                "validated": False,
-                                "duplicate_checked": False,
-                                "duplicate": False,
-                                "saved": False,
-                                "needs_clarification": False,
-                                "issues": [],
-                            },
+                            "_status": new_status(),
                         }
                     )
             else:
@@ -614,14 +720,7 @@ class HealthDataAgent:
                             "started_at": None,
                             "confidence": 0.6,
                             "source_text": last_user,
-                            "_status": {
-                                "validated": False,
-                                "duplicate_checked": False,
-                                "duplicate": False,
-                                "saved": False,
-                                "needs_clarification": False,
-                                "issues": [],
-                            },
+                            "_status": new_status(),
                         }
                     )
             elif action_input.get("field") == "symptoms":
@@ -635,17 +734,11 @@ class HealthDataAgent:
                         "started_at": None,
                         "confidence": 0.3,
                         "source_text": last_user,
-                        "_status": {
-                            "validated": False,
-                            "duplicate_checked": False,
-                            "duplicate": False,
-                            "saved": False,
-                            "needs_clarification": False,
-                            "issues": [],
-                        },
+                        "_status": new_status(),
                     }
                 ]
 
+        self._status_index.rebuild(self.extracted_data)
         return (
             f"Extracted {len(self.extracted_data['health_records'])} health records, "
             f"{len(self.extracted_data['medicines'])} medicines, "
@@ -655,175 +748,176 @@ class HealthDataAgent:
 
     def _tool_validate_data(self) -> str:
         total_issues = 0
-
-        for record in self.extracted_data["health_records"]:
-            issues = self._validate_health_record(record)
-            record["_status"]["issues"] = issues
-            record["_status"]["validated"] = len(issues) == 0
-            if issues:
-                record["_status"]["needs_clarification"] = True
-                total_issues += len(issues)
-            if float(record.get("confidence", 0.5) or 0.5) < self.min_save_confidence:
-                record["_status"]["needs_clarification"] = True
-                total_issues += 1
-
-        for medicine in self.extracted_data["medicines"]:
-            issues = self._validate_medicine(medicine)
-            medicine["_status"]["issues"] = issues
-            medicine["_status"]["validated"] = len(issues) == 0
-            if issues:
-                medicine["_status"]["needs_clarification"] = True
-                total_issues += len(issues)
-            if float(medicine.get("confidence", 0.5) or 0.5) < self.min_save_confidence:
-                medicine["_status"]["needs_clarification"] = True
-                total_issues += 1
-
-        for appointment in self.extracted_data["appointments"]:
-            issues = self._validate_appointment(appointment)
-            appointment["_status"]["issues"] = issues
-            appointment["_status"]["validated"] = len(issues) == 0
-            if issues:
-                appointment["_status"]["needs_clarification"] = True
-                total_issues += len(issues)
-            if float(appointment.get("confidence", 0.5) or 0.5) < self.min_save_confidence:
-                appointment["_status"]["needs_clarification"] = True
-                total_issues += 1
-
-        for symptom in self.extracted_data["symptoms"]:
-            issues = self._validate_symptom(symptom)
-            symptom["_status"]["issues"] = issues
-            symptom["_status"]["validated"] = len(issues) == 0
-            if issues:
-                symptom["_status"]["needs_clarification"] = True
-                total_issues += len(issues)
-            if float(symptom.get("confidence", 0.5) or 0.5) < self.min_save_confidence:
-                symptom["_status"]["needs_clarification"] = True
-                total_issues += 1
+        validators = {
+            "health_records": self._validate_health_record,
+            "medicines": self._validate_medicine,
+            "appointments": self._validate_appointment,
+            "symptoms": self._validate_symptom,
+        }
+        for key, validate in validators.items():
+            for item in self.extracted_data[key]:
+                issues = validate(item)
+                low_confidence = float(item.get("confidence", 0.5) or 0.5) < self.min_save_confidence
+                changes: Dict[str, Any] = {"issues": issues, "validated": len(issues) == 0}
+                if issues or low_confidence:
+                    changes["needs_clarification"] = True
+                self._mark(item, **changes)
+                total_issues += len(issues) + (1 if low_confidence else 0)
 
         return "Validation complete. Issues found: " + str(total_issues)
 
     def _tool_check_duplicates(self, member_id: Optional[str]) -> str:
+        """
+        Batched duplicate check: at most one query per entity type (IN on metric/date,
+        a date window for symptoms), then in-memory matching against an index.
+        """
         duplicates = 0
 
-        for record in self.extracted_data["health_records"]:
-            if record["_status"]["duplicate_checked"]:
-                continue
-            metric = record.get("type") or record.get("metric")
-            date = _to_date_str(record.get("recorded_at"))
-            query = self._supabase.table("health_records").select("id").eq("user_id", self.user_id).eq("metric", metric).eq("date", date)
-            res = self._safe_execute(query, allow_retry_without_member=True, member_id=member_id)
-            if res and res.data:
-                record["_status"]["duplicate"] = True
-                duplicates += 1
-            record["_status"]["duplicate_checked"] = True
-
-        for medicine in self.extracted_data["medicines"]:
-            if medicine["_status"]["duplicate_checked"]:
-                continue
-            name = medicine.get("name")
-            if name:
+        records = [r for r in self.extracted_data["health_records"] if not r["_status"]["duplicate_checked"]]
+        if records:
+            keys = [((r.get("type") or r.get("metric")), _to_date_str(r.get("recorded_at"))) for r in records]
+            metrics = sorted({m for m, _ in keys if m})
+            dates = sorted({d for _, d in keys})
+            existing = set()
+            if metrics:
                 query = (
-                    self._supabase.table("medicines")
-                    .select("id")
+                    self._supabase.table("health_records")
+                    .select("metric, date")
                     .eq("user_id", self.user_id)
-                    .ilike("name", f"%{name}%")
-                    .eq("is_active", True)
+                    .in_("metric", metrics)
+                    .in_("date", dates)
                 )
                 res = self._safe_execute(query, allow_retry_without_member=True, member_id=member_id)
-                if res and res.data:
-                    medicine["_status"]["duplicate"] = True
+                existing = {(row.get("metric"), row.get("date")) for row in (res.data if res else None) or []}
+            for record, key in zip(records, keys):
+                if key in existing:
+                    self._mark(record, duplicate=True)
                     duplicates += 1
-            medicine["_status"]["duplicate_checked"] = True
+                self._mark(record, duplicate_checked=True)
 
-        for appointment in self.extracted_data["appointments"]:
-            if appointment["_status"]["duplicate_checked"]:
-                continue
-            date = appointment.get("date")
-            time_slot = appointment.get("time")
+        medicines = [m for m in self.extracted_data["medicines"] if not m["_status"]["duplicate_checked"]]
+        if any(m.get("name") for m in medicines):
+            query = (
+                self._supabase.table("medicines")
+                .select("name")
+                .eq("user_id", self.user_id)
+                .eq("is_active", True)
+            )
+            res = self._safe_execute(query, allow_retry_without_member=True, member_id=member_id)
+            existing_names = [str(row.get("name") or "").lower() for row in (res.data if res else None) or []]
+            for medicine in medicines:
+                name = str(medicine.get("name") or "").lower()
+                # Same semantics as ilike '%name%': an active medicine whose name contains this one
+                if name and any(name in existing for existing in existing_names):
+                    self._mark(medicine, duplicate=True)
+                    duplicates += 1
+        for medicine in medicines:
+            self._mark(medicine, duplicate_checked=True)
+
+        appointments = [a for a in self.extracted_data["appointments"] if not a["_status"]["duplicate_checked"]]
+        if appointments:
+            keys = [(a.get("date") or "", a.get("time") or "") for a in appointments]
             query = (
                 self._supabase.table("appointments")
-                .select("id")
+                .select("date, time_slot")
                 .eq("patient_id", self.user_id)
-                .eq("date", date or "")
-                .eq("time_slot", time_slot or "")
+                .in_("date", sorted({d for d, _ in keys}))
             )
             res = self._safe_execute(query, allow_retry_without_member=False, member_id=member_id)
-            if res and res.data:
-                appointment["_status"]["duplicate"] = True
-                duplicates += 1
-            appointment["_status"]["duplicate_checked"] = True
+            existing = {(row.get("date"), row.get("time_slot")) for row in (res.data if res else None) or []}
+            for appointment, key in zip(appointments, keys):
+                if key in existing:
+                    self._mark(appointment, duplicate=True)
+                    duplicates += 1
+                self._mark(appointment, duplicate_checked=True)
 
-        for symptom in self.extracted_data["symptoms"]:
-            if symptom["_status"]["duplicate_checked"]:
-                continue
-            symptom_name = symptom.get("symptom")
-            if symptom_name:
-                date = _to_date_str(symptom.get("started_at"))
-                query = (
-                    self._supabase.table("health_records")
-                    .select("id")
-                    .eq("user_id", self.user_id)
-                    .eq("metric", "symptom")
-                    .eq("date", date)
-                    .ilike("notes", f"%{symptom_name}%")
-                )
-                res = self._safe_execute(query, allow_retry_without_member=True, member_id=member_id)
-                if res and res.data:
-                    symptom["_status"]["duplicate"] = True
+        symptoms = [s for s in self.extracted_data["symptoms"] if not s["_status"]["duplicate_checked"]]
+        named = [(s, str(s["symptom"]).lower(), _to_date_str(s.get("started_at"))) for s in symptoms if s.get("symptom")]
+        if named:
+            dates = [d for _, _, d in named]
+            query = (
+                self._supabase.table("health_records")
+                .select("date, notes")
+                .eq("user_id", self.user_id)
+                .eq("metric", "symptom")
+                .gte("date", min(dates))
+                .lte("date", max(dates))
+            )
+            res = self._safe_execute(query, allow_retry_without_member=True, member_id=member_id)
+            notes_by_date: Dict[str, List[str]] = {}
+            for row in (res.data if res else None) or []:
+                notes_by_date.setdefault(row.get("date"), []).append(str(row.get("notes") or "").lower())
+            for symptom, name, date in named:
+                if any(name in notes for notes in notes_by_date.get(date, [])):
+                    self._mark(symptom, duplicate=True)
                     duplicates += 1
-            symptom["_status"]["duplicate_checked"] = True
+        for symptom in symptoms:
+            self._mark(symptom, duplicate_checked=True)
 
         return f"Duplicate check complete. Duplicates found: {duplicates}"
 
     def _tool_save_to_database(self, member_id: Optional[str]) -> str:
+        """
+        Unit of work: build rows for every saveable item, then one bulk insert per table.
+        Per-row outcomes are recorded on each item's _status (saved / save_error).
+        """
         saved_items: List[Dict[str, Any]] = []
         failed_items: List[str] = []
+        # table -> [(items the row stands for, failure label, row)]
+        plan: Dict[str, List[Tuple[List[Dict[str, Any]], str, Dict[str, Any]]]] = {
+            "health_records": [],
+            "medicines": [],
+            "appointments": [],
+        }
 
         for record in self.extracted_data["health_records"]:
             if not self._should_save_item(record):
                 continue
-            saved = self._save_health_record(record, member_id)
-            if saved:
-                record["_status"]["saved"] = True
-                saved_items.append(saved)
-            else:
+            row = self._health_record_row(record, member_id)
+            if row is None:
+                self._mark(record, save_error="Unable to parse value.")
                 failed_items.append(f"health_record:{record.get('type')}")
+                continue
+            plan["health_records"].append(([record], f"health_record:{record.get('type')}", row))
+
+        symptom_candidates = [s for s in self.extracted_data["symptoms"] if self._should_save_item(s)]
+        if symptom_candidates:
+            row = self._symptom_group_row(symptom_candidates, member_id)
+            plan["health_records"].append((symptom_candidates, "symptom_group", row))
 
         for medicine in self.extracted_data["medicines"]:
             if not self._should_save_item(medicine):
                 continue
-            saved = self._save_medicine(medicine, member_id)
-            if saved:
-                medicine["_status"]["saved"] = True
-                saved_items.append(saved)
-            else:
-                err = medicine.get("_status", {}).get("save_error")
-                suffix = f":{err}" if err else ""
-                failed_items.append(f"medicine:{medicine.get('name')}{suffix}")
+            row = self._medicine_row(medicine, member_id)
+            plan["medicines"].append(([medicine], f"medicine:{medicine.get('name')}", row))
 
         for appointment in self.extracted_data["appointments"]:
             if not self._should_save_item(appointment):
                 continue
-            saved = self._save_appointment(appointment, member_id)
-            if saved:
-                appointment["_status"]["saved"] = True
-                saved_items.append(saved)
-            else:
-                failed_items.append("appointment")
+            plan["appointments"].append(([appointment], "appointment", self._appointment_row(appointment, member_id)))
 
-        symptom_candidates = [s for s in self.extracted_data["symptoms"] if self._should_save_item(s)]
-        if symptom_candidates:
-            saved = self._save_symptom_group(symptom_candidates, member_id)
-            if saved:
-                for symptom in symptom_candidates:
-                    symptom["_status"]["saved"] = True
-                saved_items.append(saved)
-            else:
-                failed_items.append("symptom_group")
+        for table, entries in plan.items():
+            if not entries:
+                continue
+            results, errors = self._bulk_insert(
+                table,
+                [row for _, _, row in entries],
+                optional_columns=self.SAVE_OPTIONAL_COLUMNS.get(table, ()),
+            )
+            for (items, label, _), saved, error in zip(entries, results, errors):
+                if saved is not None:
+                    for item in items:
+                        self._mark(item, saved=True)
+                    saved_items.append(saved)
+                else:
+                    for item in items:
+                        self._mark(item, save_error=error)
+                    failed_items.append(f"{label}:{error}" if error else label)
 
         self.last_saved = {
             "count": len(saved_items),
             "items": saved_items,
+            "failed": failed_items,
             "timestamp": _now_iso() if saved_items else self.last_saved.get("timestamp"),
         }
 
@@ -885,16 +979,10 @@ class HealthDataAgent:
                     "recorded_at": _now_iso(),
                     "confidence": 0.9,
                     "source_text": "Derived from weight and height",
-                    "_status": {
-                        "validated": True,
-                        "duplicate_checked": False,
-                        "duplicate": False,
-                        "saved": False,
-                        "needs_clarification": False,
-                        "issues": [],
-                    },
+                    "_status": new_status(validated=True),
                 }
                 self.extracted_data["health_records"].append(bmi_record)
+                self._status_index.add(bmi_record)
                 return "Calculated BMI."
         return "No metrics calculated."
 
@@ -1004,6 +1092,17 @@ class HealthDataAgent:
             issues.append("Low confidence.")
         return issues
 
+    # ----------------------------
+    # Status helpers
+    # ----------------------------
+    def _mark(self, item: Dict[str, Any], **changes: Any) -> None:
+        """Update an extracted item's _status (and the status index with it)."""
+        self._status_index.update(item, **changes)
+
+    def _reset_extracted(self) -> None:
+        self.extracted_data = _empty_extracted()
+        self._status_index.rebuild(self.extracted_data)
+
     # ----------------------------
     # Saving helpers
     # ----------------------------
@@ -1020,7 +1119,75 @@ class HealthDataAgent:
         confidence = float(item.get("confidence", 0.5) or 0.5)
         return confidence >= self.min_save_confidence
 
-    def _save_health_record(self, record: Dict[str, Any], member_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    # Columns dropped (once per table, not per row) when a bulk insert fails on an older schema
+    SAVE_OPTIONAL_COLUMNS: Dict[str, Tuple[str, ...]] = {
+        "health_records": ("member_id",),
+        "medicines": ("confidence_score", "source"),
+    }
+
+    def _bulk_insert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        *,
+        optional_columns: Tuple[str, ...] = (),
+    ) -> Tuple[List[Optional[Dict[str, Any]]], List[Optional[str]]]:
+        """
+        Insert rows with one request per distinct set of keys (PostgREST bulk inserts
+        need identical keys, and rows are not padded with nulls so column defaults
+        still apply). If a batch fails, its rows are retried one at a time so each
+        failure is reported against its own row. Returns, aligned with rows, the saved
+        row (or None) and the error message (or None).
+        """
+        saved: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        errors: List[Optional[str]] = [None] * len(rows)
+        groups: Dict[frozenset, List[int]] = {}
+        for index, row in enumerate(rows):
+            groups.setdefault(frozenset(row), []).append(index)
+
+        for indexes in groups.values():
+            batch = [rows[i] for i in indexes]
+            results, error = self._insert_batch(table, batch, optional_columns)
+            if results is not None:
+                for i, result in zip(indexes, results):
+                    saved[i] = result
+                continue
+            if len(batch) == 1:
+                errors[indexes[0]] = error
+                continue
+            for i in indexes:
+                results, error = self._insert_batch(table, [rows[i]], optional_columns)
+                if results is not None:
+                    saved[i] = results[0]
+                else:
+                    errors[i] = error
+        return saved, errors
+
+    def _insert_batch(
+        self,
+        table: str,
+        batch: List[Dict[str, Any]],
+        optional_columns: Tuple[str, ...],
+    ) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        """One insert request (all rows share keys), retried without optional_columns if it fails."""
+        attempts = [batch]
+        if any(column in batch[0] for column in optional_columns):
+            attempts.append([{k: v for k, v in row.items() if k not in optional_columns} for row in batch])
+
+        error: Optional[str] = None
+        for attempt in attempts:
+            try:
+                res = self._supabase.table(table).insert(attempt).execute()
+                data = res.data or []
+                if len(data) == len(attempt):
+                    return list(data), None
+                # Insert succeeded without returning representation: report the rows we sent
+                return list(attempt), None
+            except Exception as e:
+                error = str(e)
+        return None, error
+
+    def _health_record_row(self, record: Dict[str, Any], member_id: Optional[str]) -> Optional[Dict[str, Any]]:
         metric = record.get("type") or record.get("metric")
         date = _to_date_str(record.get("recorded_at"))
         confidence = float(record.get("confidence", 0.5) or 0.5)
@@ -1050,22 +1217,11 @@ class HealthDataAgent:
         }
         if member_id:
             row["member_id"] = member_id
+        return row
 
-        try:
-            res = self._supabase.table("health_records").insert(row).execute()
-            return res.data[0] if res.data else row
-        except Exception:
-            # Retry without member_id if column missing
-            row.pop("member_id", None)
-            try:
-                res = self._supabase.table("health_records").insert(row).execute()
-                return res.data[0] if res.data else row
-            except Exception:
-                return None
-
-    def _save_medicine(self, medicine: Dict[str, Any], member_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    def _medicine_row(self, medicine: Dict[str, Any], member_id: Optional[str]) -> Dict[str, Any]:
         confidence = float(medicine.get("confidence", 0.5) or 0.5)
-        row = {
+        return {
             "user_id": self.user_id,
             "member_id": member_id,
             "name": medicine.get("name"),
@@ -1082,37 +1238,10 @@ class HealthDataAgent:
             "confidence_score": confidence,
             "source": "chat_agent",
         }
-        try:
-            res = self._supabase.table("medicines").insert(row).execute()
-            if res.data:
-                return res.data[0]
-            # If insert succeeded but no data returned, try to fetch the newest match
-            lookup = (
-                self._supabase.table("medicines")
-                .select("*")
-                .eq("user_id", self.user_id)
-                .ilike("name", f"%{medicine.get('name') or ''}%")
-                .order("created_at", desc=True)
-                .limit(1)
-                .execute()
-            )
-            return lookup.data[0] if lookup.data else None
-        except Exception as e:
-            # Retry without optional columns if schema is missing them
-            row.pop("confidence_score", None)
-            row.pop("source", None)
-            try:
-                res = self._supabase.table("medicines").insert(row).execute()
-                if res.data:
-                    return res.data[0]
-            except Exception as e2:
-                medicine["_status"]["save_error"] = str(e2)
-                return None
-            return None
 
-    def _save_appointment(self, appointment: Dict[str, Any], member_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    def _appointment_row(self, appointment: Dict[str, Any], member_id: Optional[str]) -> Dict[str, Any]:
         confidence = float(appointment.get("confidence", 0.5) or 0.5)
-        row = {
+        return {
             "patient_id": self.user_id,
             "member_id": member_id,
             "doctor_id": appointment.get("doctor_id") or "unknown",
@@ -1126,41 +1255,8 @@ class HealthDataAgent:
             "confidence_score": confidence,
             "source": "chat_agent",
         }
-        try:
-            res = self._supabase.table("appointments").insert(row).execute()
-            return res.data[0] if res.data else row
-        except Exception:
-            return None
 
-    def _save_symptom(self, symptom: Dict[str, Any], member_id: Optional[str]) -> Optional[Dict[str, Any]]:
-        notes = symptom.get("notes") or symptom.get("source_text") or ""
-        row = {
-            "user_id": self.user_id,
-            "metric": "symptom",
-            "value": 0,
-            "unit": "text",
-            "date": _to_date_str(symptom.get("started_at")),
-            "notes": f"{symptom.get('symptom')} ({symptom.get('severity')}) {notes}".strip(),
-            "confidence_score": float(symptom.get("confidence", 0.5) or 0.5),
-            "source": "chat_agent",
-            "validated_at": _now_iso(),
-        }
-        if member_id:
-            row["member_id"] = member_id
-        try:
-            res = self._supabase.table("health_records").insert(row).execute()
-            return res.data[0] if res.data else row
-        except Exception:
-            row.pop("member_id", None)
-            try:
-                res = self._supabase.table("health_records").insert(row).execute()
-                return res.data[0] if res.data else row
-            except Exception:
-                return None
-
-    def _save_symptom_group(self, symptoms: List[Dict[str, Any]], member_id: Optional[str]) -> Optional[Dict[str, Any]]:
-        if not symptoms:
-            return None
+    def _symptom_group_row(self, symptoms: List[Dict[str, Any]], member_id: Optional[str]) -> Dict[str, Any]:
         source_text = ""
         parts = []
         max_conf = 0.0
@@ -1192,16 +1288,7 @@ class HealthDataAgent:
         }
         if member_id:
             row["member_id"] = member_id
-        try:
-            res = self._supabase.table("health_records").insert(row).execute()
-            return res.data[0] if res.data else row
-        except Exception:
-            row.pop("member_id", None)
-            try:
-                res = self._supabase.table("health_records").insert(row).execute()
-                return res.data[0] if res.data else row
-            except Exception:
-                return None
+        return row
 
     # ----------------------------
     # Clarification helpers
@@ -1231,23 +1318,18 @@ class HealthDataAgent:
     # ----------------------------
     # Utility helpers
     # ----------------------------
+    def _conversation_block(self, max_turns: int, token_budget: int) -> str:
+        """Last max_turns turns, each capped, then trimmed from the oldest end to token_budget."""
+        lines = [
+            f"{t['role'].capitalize()}: {truncate_to_tokens(str(t['content']), self.max_turn_tokens)}"
+            for t in list(self.conversation_turns)[-max_turns:]
+        ]
+        return truncate_to_tokens("\n".join(lines), token_budget, keep="tail")
+
     def _build_reasoning_prompt(self) -> str:
-        conversation = "\n".join(
-            [f"{t['role'].capitalize()}: {t['content']}" for t in list(self.conversation_turns)[-5:]]
-        )
+        conversation = self._conversation_block(5, self.reasoning_conversation_budget)
         extracted_summary = {k: len(v) for k, v in self.extracted_data.items()}
         recent_actions = self.action_history[-3:]
-        tools = [
-            "extract_data",
-            "validate_data",
-            "check_duplicates",
-            "save_to_database",
-            "ask_clarification",
-            "search_knowledge",
-            "calculate_metrics",
-            "get_user_history",
-            "finish",
-        ]
 
         return f"""
 You are an autonomous health data management agent.
@@ -1262,23 +1344,24 @@ Pending Clarifications: {len(self.pending_clarifications)}
 Recent Actions: {recent_actions}
 
 AVAILABLE TOOLS:
-{tools}
+{AGENT_TOOLS}
 
-Respond ONLY with JSON:
+Respond ONLY with JSON, fields in this order:
 {{
-  "reasoning": "...",
   "has_health_data": true,
   "confidence_score": 0.85,
   "action": "extract_data",
   "action_input": {{}},
+  "reasoning": "...",
   "why_this_action": "..."
 }}
 """.strip()
 
     def _build_extraction_prompt(self) -> str:
-        conversation = "\n".join(
-            [f"{t['role'].capitalize()}: {t['content']}" for t in list(self.conversation_turns)[-10:]]
-        )
+        # Every turn held (more than 10 when queued turns were merged), budget scaled to match
+        max_turns = self.conversation_turns.maxlen or _HISTORY_WINDOW
+        budget = self.extraction_conversation_budget * max_turns // _HISTORY_WINDOW
+        conversation = self._conversation_block(max_turns, budget)
         return f"""
 Extract ALL health-related data from this conversation.
 
@@ -1306,50 +1389,74 @@ Return ONLY valid JSON with this structure:
 }}
 """.strip()
 
-    def _call_llm(self, prompt: str, system_prompt: str) -> str:
+    def _call_llm(
+        self,
+        prompt: str,
+        system_prompt: str,
+        *,
+        schema: Optional[Dict[str, Any]] = None,
+        stop_when: Optional[Callable[[JSONStreamParser], bool]] = None,
+    ) -> str:
+        """
+        Ask Ollama for a JSON answer. When streaming (AGENT_LLM_STREAM), tokens are
+        parsed as they arrive and the request is closed - which stops generation -
+        as soon as the top-level object closes or stop_when(parser) is true.
+        Returns the JSON text (only the completed fields if stopped early).
+        """
+        self.last_prompt_tokens = estimate_tokens(prompt) + estimate_tokens(system_prompt)
+        self.turn_llm_calls += 1
+        stream = settings.agent_llm_stream
         try:
-            payload = {
+            payload: Dict[str, Any] = {
                 "model": settings.ollama_chat_model,
                 "prompt": prompt,
-                "stream": False,
+                "stream": stream,
                 "options": {"temperature": 0.2},
             }
+            llm_format = settings.agent_llm_format.lower()
+            if llm_format == "schema" and schema:
+                payload["format"] = schema
+            elif llm_format in ("json", "schema"):
+                payload["format"] = "json"
             if system_prompt:
                 payload["system"] = system_prompt
-            response = requests.post(
-                f"{settings.ollama_base_url}/api/generate",
-                json=payload,
-                timeout=60,
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data.get("response", "")
+            if not stream:
+                return llm_gateway.ollama_json("/api/generate", payload, timeout=60).get("response", "")
+            with llm_gateway.ollama_stream("/api/generate", payload, timeout=60) as response:
+                return self._read_json_stream(response, stop_when)
         except Exception:
             return ""
 
+    def _read_json_stream(
+        self,
+        response: Any,
+        stop_when: Optional[Callable[[JSONStreamParser], bool]],
+    ) -> str:
+        parser = JSONStreamParser()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+            parser.feed(data.get("response", ""))
+            if data.get("done"):
+                llm_gateway.record_tokens("ollama", data.get("prompt_eval_count"), data.get("eval_count"))
+                break
+            if parser.done:
+                break
+            if stop_when is not None and stop_when(parser):
+                return json.dumps(parser.result())
+        return parser.text
+
     def _fallback_decision(self) -> AgentDecision:
-        has_extracted = any(len(v) > 0 for v in self.extracted_data.values())
-        needs_validation = any(
-            not item.get("_status", {}).get("validated", False)
-            for items in self.extracted_data.values()
-            for item in items
-        )
-        needs_duplicates = any(
-            item.get("_status", {}).get("validated", False)
-            and not item.get("_status", {}).get("duplicate_checked", False)
-            for items in self.extracted_data.values()
-            for item in items
-        )
-        needs_save = any(
-            self._should_save_item(item)
-            for items in self.extracted_data.values()
-            for item in items
-        )
-        needs_clarification = any(
-            item.get("_status", {}).get("needs_clarification", False)
-            for items in self.extracted_data.values()
-            for item in items
-        )
+        index = self._status_index
+        has_extracted = index.total > 0
+        needs_validation = index.needs_validation > 0
+        needs_duplicates = index.needs_duplicates > 0
+        needs_save = index.saveable > 0
+        needs_clarification = index.needs_clarification > 0
 
         if not has_extracted:
             action = "extract_data"
@@ -1409,7 +1516,9 @@ Return ONLY valid JSON with this structure:
         success: bool,
         reasoning: str,
         confidence_score: float,
+        duration_ms: Optional[int] = None,
     ) -> None:
+        """Hand the row to the buffered log sink; it is written in batches off this thread."""
         try:
             row = {
                 "user_id": self.user_id,
@@ -1422,10 +1531,10 @@ Return ONLY valid JSON with this structure:
                 "success": success,
                 "reasoning": reasoning,
                 "confidence_score": confidence_score,
-                "metadata": {},
-                "duration_ms": None,
+                "metadata": {"trace_id": tracing.current_trace_id()},
+                "duration_ms": duration_ms,
                 "created_at": _now_iso(),
             }
-            self._supabase.table("agent_execution_logs").insert(row).execute()
+            agent_log_sink.submit(row)
         except Exception:
             return
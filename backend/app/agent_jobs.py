@@ -0,0 +1,267 @@
+"""
+Durable job queue for out-of-process agent runs (AGENT_WORKER_MODE=external).
+The API enqueues AgentTurns; `python -m app.agent_worker` claims them with a
+lease, renews the lease while a job runs, and acks or fails it. Failed jobs are
+retried with backoff up to a max attempt count; jobs whose worker died (stopped
+renewing) are reclaimed when the lease expires. Like the in-process queue, a user has at most one job running and a
+newer queued turn for the same member absorbs the one still waiting.
+
+The default backend is a local SQLite file shared by the API and the workers on
+one host. Another backend only needs the same methods as SqliteAgentJobStore.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from typing import Any, Dict, Optional, Tuple
+
+from app.agent_queue import AgentTurn
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agent_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    member_id TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    worker_id TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_claim ON agent_jobs(status, available_at, id);
+CREATE INDEX IF NOT EXISTS idx_agent_jobs_user ON agent_jobs(user_id, status);
+"""
+
+
+def turn_to_payload(turn: AgentTurn) -> str:
+    data = asdict(turn)
+    data.pop("enqueued_at", None)  # monotonic clock; meaningless in another process
+    return json.dumps(data)
+
+
+def turn_from_payload(payload: str) -> AgentTurn:
+    return AgentTurn(**json.loads(payload))
+
+
+class SqliteAgentJobStore:
+    """SQLite-backed job queue. Safe across threads and processes on one host (WAL mode)."""
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_attempts: int = 3,
+        lease_seconds: float = 3600.0,
+        retry_backoff_seconds: float = 5.0,
+    ) -> None:
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    # ----------------------------
+    # Producer side (API)
+    # ----------------------------
+    def enqueue(self, turn: AgentTurn) -> int:
+        """Queue a turn; merges into the user's waiting job for the same member if there is one."""
+        now = time.time()
+        with self._tx() as conn:
+            row = conn.execute(
+                "SELECT id, payload FROM agent_jobs WHERE user_id = ? AND member_id IS ? AND status = ? "
+                "AND attempts = 0 ORDER BY id DESC LIMIT 1",
+                (turn.user_id, turn.member_id, QUEUED),
+            ).fetchone()
+            if row:
+                turn.absorb(turn_from_payload(row["payload"]))
+                conn.execute("UPDATE agent_jobs SET payload = ? WHERE id = ?", (turn_to_payload(turn), row["id"]))
+                return row["id"]
+            cur = conn.execute(
+                "INSERT INTO agent_jobs (user_id, member_id, payload, status, available_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (turn.user_id, turn.member_id, turn_to_payload(turn), QUEUED, now, now),
+            )
+            return cur.lastrowid
+
+    def status(self, user_id: str) -> Dict[str, Any]:
+        conn = self._conn()
+        counts = dict(
+            conn.execute(
+                "SELECT status, COUNT(*) FROM agent_jobs WHERE user_id = ? AND status IN (?, ?) GROUP BY status",
+                (user_id, QUEUED, RUNNING),
+            ).fetchall()
+        )
+        last = conn.execute(
+            "SELECT id, status, attempts, result, error, finished_at FROM agent_jobs "
+            "WHERE user_id = ? AND status IN (?, ?) ORDER BY finished_at DESC LIMIT 1",
+            (user_id, DONE, FAILED),
+        ).fetchone()
+        last_job = None
+        if last:
+            last_job = {
+                "id": last["id"],
+                "status": last["status"],
+                "attempts": last["attempts"],
+                "result": json.loads(last["result"]) if last["result"] else None,
+                "error": last["error"],
+                "finished_at": last["finished_at"],
+            }
+        return {
+            "running": bool(counts.get(RUNNING)),
+            "pending": counts.get(QUEUED, 0),
+            "last_job": last_job,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM agent_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    # ----------------------------
+    # Consumer side (worker)
+    # ----------------------------
+    def claim(self, worker_id: str) -> Optional[Tuple[int, AgentTurn]]:
+        """Lease the oldest runnable job whose user has nothing else running."""
+        now = time.time()
+        with self._tx() as conn:
+            # Jobs whose worker died mid-run go back to the queue (or fail if out of attempts)
+            conn.execute(
+                "UPDATE agent_jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = 'lease expired', finished_at = CASE WHEN attempts >= ? THEN ? END "
+                "WHERE status = ? AND lease_until < ?",
+                (self.max_attempts, FAILED, QUEUED, self.max_attempts, now, RUNNING, now),
+            )
+            row = conn.execute(
+                "SELECT id, payload FROM agent_jobs j WHERE status = ? AND available_at <= ? "
+                "AND NOT EXISTS (SELECT 1 FROM agent_jobs r WHERE r.user_id = j.user_id AND r.status = ?) "
+                "ORDER BY id LIMIT 1",
+                (QUEUED, now, RUNNING),
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute(
+                "UPDATE agent_jobs SET status = ?, attempts = attempts + 1, worker_id = ?, "
+                "lease_until = ?, started_at = ? WHERE id = ?",
+                (RUNNING, worker_id, now + self.lease_seconds, now, row["id"]),
+            )
+            return row["id"], turn_from_payload(row["payload"])
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Extend a running job's lease. Returns False if the job is no longer this worker's."""
+        with self._tx() as conn:
+            cur = conn.execute(
+                "UPDATE agent_jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, worker_id, RUNNING),
+            )
+            return cur.rowcount > 0
+
+    def ack(self, job_id: int, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+        """Mark the job done. Returns False (and changes nothing) if the lease was lost to another worker."""
+        with self._tx() as conn:
+            cur = conn.execute(
+                "UPDATE agent_jobs SET status = ?, result = ?, error = NULL, lease_until = NULL, "
+                "finished_at = ? WHERE id = ? AND worker_id = ? AND status = ?",
+                (DONE, json.dumps(result) if result is not None else None, time.time(), job_id, worker_id, RUNNING),
+            )
+            return cur.rowcount > 0
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Record a failed attempt. Returns True if the job will be retried."""
+        now = time.time()
+        with self._tx() as conn:
+            row = conn.execute(
+                "SELECT attempts FROM agent_jobs WHERE id = ? AND worker_id = ? AND status = ?",
+                (job_id, worker_id, RUNNING),
+            ).fetchone()
+            if not row:
+                return False  # lease lost; whoever holds the job now decides its fate
+            attempts = row["attempts"]
+            if attempts >= self.max_attempts:
+                conn.execute(
+                    "UPDATE agent_jobs SET status = ?, error = ?, lease_until = NULL, finished_at = ? WHERE id = ?",
+                    (FAILED, error[:1000], now, job_id),
+                )
+                return False
+            # Exponential backoff with jitter so a flapping dependency is not hammered
+            delay = self.retry_backoff_seconds * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+            conn.execute(
+                "UPDATE agent_jobs SET status = ?, error = ?, lease_until = NULL, available_at = ? WHERE id = ?",
+                (QUEUED, error[:1000], now + delay, job_id),
+            )
+            return True
+
+    def purge(self, older_than_seconds: float) -> int:
+        """Delete finished jobs older than the retention window."""
+        with self._tx() as conn:
+            cur = conn.execute(
+                "DELETE FROM agent_jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, time.time() - older_than_seconds),
+            )
+            return cur.rowcount
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _tx(self) -> "_Transaction":
+        return _Transaction(self._conn())
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so claim/enqueue are atomic across processes."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+_store: Optional[SqliteAgentJobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_agent_job_store() -> SqliteAgentJobStore:
+    """Process-wide job store, opened on first use (inline mode never touches it)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SqliteAgentJobStore(
+                settings.agent_job_db_path,
+                max_attempts=settings.agent_job_max_attempts,
+                lease_seconds=settings.agent_job_lease_seconds,
+            )
+        return _store
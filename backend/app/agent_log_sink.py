@@ -0,0 +1,191 @@
+"""
+Buffered, batched writer for agent_execution_logs.
+The agent hands rows to submit() (never blocks on the network); a background
+thread flushes them in bulk inserts when a batch fills up or the flush interval
+passes. Under backpressure successful-step rows are sampled and, once the
+buffer is full, dropped; error rows are always kept. A batch the database
+rejects is split and retried so one bad row only costs itself. Flushed on app
+shutdown.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_confidence(value: Any) -> Optional[float]:
+    """Fit a confidence into confidence_score DECIMAL(3,2): 0..1, percentages scaled down."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(score):
+        return None
+    if score > 1:
+        score /= 100  # LLMs often answer "85" meaning 85%
+    return round(min(max(score, 0.0), 1.0), 2)
+
+
+class AgentLogSink:
+    def __init__(
+        self,
+        *,
+        table: str = "agent_execution_logs",
+        batch_size: int = 50,
+        flush_interval_seconds: float = 2.0,
+        max_buffer: int = 2000,
+        pressure_sample_every: int = 10,
+        client: Any = None,
+    ) -> None:
+        self.table = table
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffer = max(self.batch_size, max_buffer)
+        # Above this fill level only every Nth successful-step row is kept
+        self.high_watermark = int(self.max_buffer * 0.8)
+        self.pressure_sample_every = max(1, pressure_sample_every)
+        self._client = client
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._sampled = 0
+        self._stats = {"submitted": 0, "written": 0, "dropped": 0, "sampled_out": 0, "failed": 0, "batches": 0}
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    def submit(self, row: Dict[str, Any]) -> None:
+        """Queue one log row. Never raises and never waits on Supabase."""
+        if "confidence_score" in row:
+            row = {**row, "confidence_score": _normalize_confidence(row["confidence_score"])}
+        with self._cond:
+            self._stats["submitted"] += 1
+            if self._closed:
+                self._stats["dropped"] += 1
+                return
+            is_error = row.get("success") is False
+            if not is_error and len(self._buffer) >= self.high_watermark:
+                self._sampled += 1
+                if self._sampled % self.pressure_sample_every:
+                    self._stats["sampled_out"] += 1
+                    return
+            if len(self._buffer) >= self.max_buffer:
+                if not is_error:
+                    self._stats["dropped"] += 1
+                    return
+                self._buffer.popleft()  # make room for the error row
+                self._stats["dropped"] += 1
+            self._buffer.append(row)
+            self._ensure_started()
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def flush(self) -> int:
+        """Write everything buffered now (on the caller's thread). Returns rows written."""
+        written = 0
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Stop the background flusher and write what is left."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self._stats, "buffered": len(self._buffer)}
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _ensure_started(self) -> None:
+        """Start the flusher thread on first use. Call with self._cond held."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="agent-log-sink", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        """Pop up to batch_size rows. Call with self._cond held."""
+        batch = []
+        while self._buffer and len(batch) < self.batch_size:
+            batch.append(self._buffer.popleft())
+        return batch
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.flush_interval_seconds
+        while True:
+            with self._cond:
+                while not self._closed and len(self._buffer) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return  # shutdown() flushes the remainder
+                batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            deadline = time.monotonic() + self.flush_interval_seconds
+
+    def _write(self, batch: List[Dict[str, Any]]) -> int:
+        try:
+            if self._client is None:
+                from app.supabase_client import get_supabase_client
+
+                self._client = get_supabase_client(use_service_role=True)
+        except Exception as e:
+            logger.warning("Agent log flush failed (%d rows dropped): %s", len(batch), e)
+            with self._cond:
+                self._stats["failed"] += len(batch)
+            return 0
+        written, failed, error = self._insert(batch)
+        if failed:
+            # Logging is best-effort: never retry forever or block agent work
+            logger.warning("Agent log flush failed (%d of %d rows dropped): %s", failed, len(batch), error)
+        with self._cond:
+            self._stats["written"] += written
+            self._stats["failed"] += failed
+        return written
+
+    def _insert(self, rows: List[Dict[str, Any]]) -> Tuple[int, int, Optional[Exception]]:
+        """Insert rows, bisecting a rejected batch down to the rows that fail alone.
+
+        Returns (written, failed, last error). A batch is atomic in PostgREST, so
+        one out-of-range value would otherwise drop every row sharing its batch.
+        """
+        try:
+            self._client.table(self.table).insert(rows).execute()
+        except Exception as e:
+            if len(rows) == 1:
+                return 0, 1, e
+            mid = len(rows) // 2
+            left_written, left_failed, left_error = self._insert(rows[:mid])
+            right_written, right_failed, right_error = self._insert(rows[mid:])
+            return left_written + right_written, left_failed + right_failed, right_error or left_error or e
+        with self._cond:
+            self._stats["batches"] += 1
+        return len(rows), 0, None
+
+agent_log_sink = AgentLogSink(
+    batch_size=settings.agent_log_batch_size,
+    flush_interval_seconds=settings.agent_log_flush_interval_seconds,
+    max_buffer=settings.agent_log_max_buffer,
+)
@@ -0,0 +1,86 @@
+"""
+Precompiled patterns and keyword matching for HealthDataAgent helpers.
+Patterns are compiled once at import instead of on every call, and the
+symptom vocabulary is matched in a single pass over the text rather than one
+substring scan per keyword.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Tuple
+
+CODE_FENCE_START = re.compile(r"^```(?:json)?", re.IGNORECASE)
+CODE_FENCE_END = re.compile(r"```$")
+BP_PAIR = re.compile(r"(\d{2,3})\s*/\s*(\d{2,3})")
+BP_SINGLE = re.compile(r"(\d{2,3})")
+UUID = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[1-5][0-9a-fA-F]{3}-[89abAB][0-9a-fA-F]{3}-[0-9a-fA-F]{12}")
+DIGIT = re.compile(r"\d")
+
+SYMPTOM_KEYWORDS: Tuple[str, ...] = (
+    "fever",
+    "cold",
+    "cough",
+    "headache",
+    "nausea",
+    "vomiting",
+    "fatigue",
+    "sore throat",
+    "body ache",
+    "diarrhea",
+    "stomach pain",
+    "chills",
+    "dizziness",
+)
+
+
+class KeywordMatcher:
+    """
+    Single-pass multi-keyword matcher (case-insensitive).
+    The vocabulary is folded into a trie and compiled to one regex
+    (Aho-Corasick-style shared prefixes, e.g. "s(?:ore throat|tomach pain)"),
+    so the text is scanned once inside the C regex engine however many keywords
+    there are. find(text) returns the keywords present in order of first
+    appearance. With whole_words=True a match must start a word ("cold" does
+    not match "scold") but may carry a suffix, so "coughing", "headaches" and
+    "feverish" still count as cough, headache and fever.
+    """
+
+    def __init__(self, keywords: Iterable[str], *, whole_words: bool = True) -> None:
+        self.keywords: List[str] = []
+        for keyword in keywords:
+            keyword = keyword.strip().lower()
+            if keyword and keyword not in self.keywords:
+                self.keywords.append(keyword)
+        trie: Dict[str, Any] = {}
+        for keyword in self.keywords:
+            node = trie
+            for ch in keyword:
+                node = node.setdefault(ch, {})
+            node[_END] = True
+        body = f"({_trie_to_regex(trie) or '(?!)'})"
+        if whole_words:
+            body = rf"(?<!\w){body}\w*"
+        self.pattern = re.compile(body)
+
+    def find(self, text: str) -> List[str]:
+        if not text:
+            return []
+        found: List[str] = []
+        for match in self.pattern.finditer(text.lower()):
+            keyword = match.group(1)
+            if keyword not in found:
+                found.append(keyword)
+        return found
+
+
+_END = ""
+
+
+def _trie_to_regex(node: Dict[str, Any]) -> str:
+    """Regex for a keyword trie; longer continuations are tried before stopping at a shorter keyword."""
+    branches = [re.escape(ch) + _trie_to_regex(child) for ch, child in sorted(node.items()) if ch != _END]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return f"(?:{body})?" if _END in node else body
+
+
+symptom_matcher = KeywordMatcher(SYMPTOM_KEYWORDS)
@@ -0,0 +1,166 @@
+"""
+Per-user serial work queue for background agent runs.
+Each user has at most one agent run in flight; turns that arrive meanwhile wait
+in that user's queue, and a newer turn for the same member supersedes the one
+still pending (its conversation history absorbs the older turn). Runs execute on
+a dedicated thread pool whose size is the global agent concurrency limit, so
+they never hold Starlette's request threadpool while waiting on a lock.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AgentTurn:
+    user_id: str
+    user_message: str
+    assistant_response: str
+    member_id: Optional[str] = None
+    conversation_history: List[Dict[str, Any]] = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    coalesced: int = 0  # how many earlier turns this one absorbed
+    traceparent: Optional[str] = None  # the chat request's span; the agent run continues its trace
+
+    def absorb(self, older: "AgentTurn") -> None:
+        """
+        Fold an older pending turn into this one so its messages still reach the
+        agent: the history becomes older history, the older exchange, this
+        turn's history and this exchange, in order and without repeats.
+        """
+        merged: List[Dict[str, Any]] = []
+        seen = set()
+        older_turns = [
+            {"role": "user", "content": older.user_message},
+            {"role": "assistant", "content": older.assistant_response},
+        ]
+        newest_turns = [
+            {"role": "user", "content": self.user_message},
+            {"role": "assistant", "content": self.assistant_response},
+        ]
+        for turn in older.conversation_history + older_turns + self.conversation_history + newest_turns:
+            content = turn.get("content")
+            key = (turn.get("role"), content)
+            if not content or key in seen:
+                continue
+            seen.add(key)
+            merged.append(turn)
+        self.conversation_history = merged
+        self.enqueued_at = older.enqueued_at
+        self.coalesced += older.coalesced + 1
+
+
+class AgentWorkQueue:
+    def __init__(self, *, max_concurrency: int, max_pending: int) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pending = max(1, max_pending)
+        self._pending: Dict[str, Deque[AgentTurn]] = {}
+        self._running: Dict[str, AgentTurn] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+        self._stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    def submit(self, turn: AgentTurn, handler: Callable[[AgentTurn], Any]) -> bool:
+        """
+        Queue a turn for the user's agent. Returns immediately; False if the
+        queue is shut down or full. handler runs on the agent pool.
+        """
+        with self._lock:
+            self._stats["submitted"] += 1
+            if self._closed:
+                self._stats["rejected"] += 1
+                return False
+            queue = self._pending.setdefault(turn.user_id, deque())
+            if queue and queue[-1].member_id == turn.member_id:
+                turn.absorb(queue.pop())
+                self._stats["coalesced"] += 1
+            elif self._pending_count() >= self.max_pending:
+                self._stats["rejected"] += 1
+                if not queue:
+                    del self._pending[turn.user_id]
+                logger.warning("Agent queue full; dropping turn for user %s", turn.user_id)
+                return False
+            queue.append(turn)
+            if turn.user_id not in self._running:
+                self._start_next(turn.user_id, handler)
+        return True
+
+    def status(self, user_id: str) -> Dict[str, Any]:
+        with self._lock:
+            running = self._running.get(user_id)
+            pending = self._pending.get(user_id) or ()
+            return {
+                "running": running is not None,
+                "pending": len(pending),
+                "coalesced_turns": sum(t.coalesced for t in pending),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "running": len(self._running),
+                "pending": self._pending_count(),
+                "max_concurrency": self.max_concurrency,
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Drop pending turns and stop accepting new ones; in-flight runs finish."""
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+            executor = self._executor
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _pending_count(self) -> int:
+        return sum(len(q) for q in self._pending.values())
+
+    def _start_next(self, user_id: str, handler: Callable[[AgentTurn], Any]) -> None:
+        """Hand the user's oldest pending turn to the pool. Call with self._lock held."""
+        queue = self._pending.get(user_id)
+        if not queue:
+            self._pending.pop(user_id, None)
+            return
+        turn = queue.popleft()
+        if not queue:
+            del self._pending[user_id]
+        self._running[user_id] = turn
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="agent")
+        self._executor.submit(self._run, turn, handler)
+
+    def _run(self, turn: AgentTurn, handler: Callable[[AgentTurn], Any]) -> None:
+        ok = True
+        try:
+            handler(turn)
+        except Exception:
+            ok = False
+            logger.exception("Agent run failed for user %s", turn.user_id)
+        finally:
+            with self._lock:
+                self._stats["completed" if ok else "failed"] += 1
+                self._running.pop(turn.user_id, None)
+                if not self._closed:
+                    self._start_next(turn.user_id, handler)
+
+
+agent_work_queue = AgentWorkQueue(
+    max_concurrency=settings.agent_max_concurrency,
+    max_pending=settings.agent_queue_max_pending,
+)
@@ -0,0 +1,262 @@
+"""
+Bounded registry of HealthDataAgent instances (one per user).
+Agents are evicted by LRU once the registry is full and after an idle TTL.
+Evicted agents are serialised to a state store and rehydrated on next access,
+so pending clarifications and extracted data survive eviction.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.agent import HealthDataAgent
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryAgentStateStore:
+    """Process-local store for evicted agent state. Bounded; oldest entries are dropped first."""
+
+    def __init__(self, max_entries: int = 5000) -> None:
+        self.max_entries = max_entries
+        self._states: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._states.pop(user_id, None)
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._states[user_id] = state
+            self._states.move_to_end(user_id)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+
+    def delete(self, user_id: str) -> None:
+        with self._lock:
+            self._states.pop(user_id, None)
+
+
+class SupabaseAgentStateStore:
+    """Stores evicted agent state in the agent_state_snapshots table. Best-effort; never raises."""
+
+    table = "agent_state_snapshots"
+
+    def __init__(self) -> None:
+        from app.supabase_client import get_supabase_client
+
+        self._supabase = get_supabase_client(use_service_role=True)
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            res = (
+                self._supabase.table(self.table)
+                .select("state")
+                .eq("user_id", user_id)
+                .maybe_single()
+                .execute()
+            )
+            if res and res.data:
+                return res.data.get("state")
+        except Exception as e:
+            logger.warning("Agent state load failed for %s: %s", user_id, e)
+        return None
+
+    def save(self, user_id: str, state: Dict[str, Any]) -> None:
+        try:
+            self._supabase.table(self.table).upsert(
+                {
+                    "user_id": user_id,
+                    "state": state,
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                }
+            ).execute()
+        except Exception as e:
+            logger.warning("Agent state save failed for %s: %s", user_id, e)
+
+    def delete(self, user_id: str) -> None:
+        try:
+            self._supabase.table(self.table).delete().eq("user_id", user_id).execute()
+        except Exception as e:
+            logger.warning("Agent state delete failed for %s: %s", user_id, e)
+
+
+class AgentRegistry:
+    """
+    LRU + idle-TTL cache of live agents.
+    - max_size: hard cap on live agents; least recently used idle agent is evicted first.
+    - idle_ttl_seconds: agents unused for this long are evicted on the next access/sweep.
+    Agents that are mid-run (holding their lock) are never evicted.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int,
+        idle_ttl_seconds: float,
+        state_store: Any,
+        factory: Optional[Callable[[str, Optional[Dict[str, Any]]], HealthDataAgent]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_size = max(1, max_size)
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.state_store = state_store
+        self._factory = factory or _default_factory
+        self._clock = clock
+        # user_id -> (agent, last_used); ordered least -> most recently used
+        self._agents: "OrderedDict[str, Tuple[HealthDataAgent, float]]" = OrderedDict()
+        # States evicted but not yet written to the store (saves happen outside the lock)
+        self._draining: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._evictions = {"lru": 0, "idle": 0}
+        self._rehydrations = 0
+        self._created = 0
+
+    # ----------------------------
+    # Public API
+    # ----------------------------
+    def get_or_create(self, user_id: str) -> HealthDataAgent:
+        with self._lock:
+            now = self._clock()
+            evicted = self._sweep_idle(now)
+            entry = self._agents.get(user_id)
+            if entry:
+                agent = entry[0]
+                self._agents[user_id] = (agent, now)
+                self._agents.move_to_end(user_id)
+                return self._finish(agent, evicted)
+            state = self._draining.pop(user_id, None)
+
+        if state is None:
+            state = self.state_store.load(user_id)
+        agent = self._factory(user_id, state)
+
+        with self._lock:
+            # Another thread may have created the agent while we were loading state
+            entry = self._agents.get(user_id)
+            if entry:
+                self._agents.move_to_end(user_id)
+                return self._finish(entry[0], evicted)
+            if state is not None:
+                self._rehydrations += 1
+            self._created += 1
+            self._agents[user_id] = (agent, self._clock())
+            evicted += self._enforce_size()
+        return self._finish(agent, evicted)
+
+    def get(self, user_id: str) -> Optional[HealthDataAgent]:
+        """Return the live agent for a user without creating or rehydrating one."""
+        with self._lock:
+            entry = self._agents.get(user_id)
+            return entry[0] if entry else None
+
+    def reset(self, user_id: str) -> None:
+        """Fully reset a user's agent, live or evicted."""
+        with self._lock:
+            entry = self._agents.get(user_id)
+            self._draining.pop(user_id, None)
+        if entry:
+            entry[0].reset(full_reset=True)
+        self.state_store.delete(user_id)
+
+    def evict_idle(self) -> int:
+        """Evict all agents past the idle TTL. Returns how many were evicted."""
+        with self._lock:
+            evicted = self._sweep_idle(self._clock())
+        self._persist(evicted)
+        return len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "live_agents": len(self._agents),
+                "max_size": self.max_size,
+                "idle_ttl_seconds": self.idle_ttl_seconds,
+                "evictions": dict(self._evictions),
+                "evictions_total": sum(self._evictions.values()),
+                "rehydrations_total": self._rehydrations,
+                "created_total": self._created,
+            }
+
+    # ----------------------------
+    # Internals (call with self._lock held unless noted)
+    # ----------------------------
+    def _sweep_idle(self, now: float) -> List[Tuple[str, Dict[str, Any]]]:
+        evicted: List[Tuple[str, Dict[str, Any]]] = []
+        if self.idle_ttl_seconds <= 0:
+            return evicted
+        expired = []
+        for user_id, (agent, last_used) in self._agents.items():
+            if now - last_used < self.idle_ttl_seconds:
+                break  # ordered by last use; everything after is fresher
+            if not agent.is_busy():
+                expired.append((user_id, agent))
+        for user_id, agent in expired:
+            evicted.append(self._evict(user_id, agent, "idle"))
+        return evicted
+
+    def _enforce_size(self) -> List[Tuple[str, Dict[str, Any]]]:
+        evicted: List[Tuple[str, Dict[str, Any]]] = []
+        if len(self._agents) <= self.max_size:
+            return evicted
+        excess = len(self._agents) - self.max_size
+        victims = []
+        for user_id, (agent, _) in self._agents.items():
+            if len(victims) >= excess:
+                break
+            if not agent.is_busy():
+                victims.append((user_id, agent))
+        for user_id, agent in victims:
+            evicted.append(self._evict(user_id, agent, "lru"))
+        return evicted
+
+    def _evict(self, user_id: str, agent: HealthDataAgent, reason: str) -> Tuple[str, Dict[str, Any]]:
+        del self._agents[user_id]
+        self._evictions[reason] += 1
+        state = agent.to_state()
+        self._draining[user_id] = state
+        return user_id, state
+
+    def _finish(self, agent: HealthDataAgent, evicted: List[Tuple[str, Dict[str, Any]]]) -> HealthDataAgent:
+        """Persist evicted states off the caller's thread (the store may do network I/O)."""
+        if evicted:
+            threading.Thread(target=self._persist, args=(evicted,), daemon=True).start()
+        return agent
+
+    def _persist(self, evicted: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Write evicted states to the store. Runs without self._lock held."""
+        for user_id, state in evicted:
+            with self._lock:
+                if self._draining.get(user_id) is not state:
+                    continue  # rehydrated or reset in the meantime
+            self.state_store.save(user_id, state)
+            with self._lock:
+                stale = self._draining.get(user_id) is not state
+                if not stale:
+                    del self._draining[user_id]
+            if stale:
+                # Rehydrated or reset while saving: the stored copy must not resurface later
+                self.state_store.delete(user_id)
+
+
+def _default_factory(user_id: str, state: Optional[Dict[str, Any]]) -> HealthDataAgent:
+    if state:
+        return HealthDataAgent.from_state(state)
+    return HealthDataAgent(user_id=user_id)
+
+
+def _build_state_store() -> Any:
+    if settings.agent_state_store.lower() == "supabase":
+        return SupabaseAgentStateStore()
+    return MemoryAgentStateStore()
+
+
+agent_registry = AgentRegistry(
+    max_size=settings.agent_registry_max_size,
+    idle_ttl_seconds=settings.agent_registry_idle_ttl_seconds,
+    state_store=_build_state_store(),
+)
@@ -0,0 +1,109 @@
+"""
+Pipeline status of items extracted by HealthDataAgent.
+Every extracted item carries a `_status` dict; StatusIndex keeps counts of
+items per pipeline state (unvalidated, awaiting duplicate check, needs
+clarification, ready to save) in step with it, so the agent's guard and
+fallback decisions are O(1) instead of rescanning every item on each step.
+Status changes go through StatusIndex.update(); whole-list replacements
+call rebuild().
+"""
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+# (needs_validation, needs_duplicates, needs_clarification, saveable)
+_Flags = Tuple[bool, bool, bool, bool]
+
+
+def new_status(**overrides: Any) -> Dict[str, Any]:
+    status: Dict[str, Any] = {
+        "validated": False,
+        "duplicate_checked": False,
+        "duplicate": False,
+        "saved": False,
+        "needs_clarification": False,
+        "issues": [],
+    }
+    status.update(overrides)
+    return status
+
+
+class StatusIndex:
+    def __init__(self, is_saveable: Callable[[Dict[str, Any]], bool]) -> None:
+        self._is_saveable = is_saveable
+        # id(item) -> (item, flags); holding the item keeps its id from being reused
+        self._entries: Dict[int, Tuple[Dict[str, Any], _Flags]] = {}
+        self._counts: List[int] = [0, 0, 0, 0]
+
+    @property
+    def total(self) -> int:
+        return len(self._entries)
+
+    @property
+    def needs_validation(self) -> int:
+        return self._counts[0]
+
+    @property
+    def needs_duplicates(self) -> int:
+        return self._counts[1]
+
+    @property
+    def needs_clarification(self) -> int:
+        return self._counts[2]
+
+    @property
+    def saveable(self) -> int:
+        return self._counts[3]
+
+    def rebuild(self, extracted_data: Dict[str, Iterable[Dict[str, Any]]]) -> None:
+        self._entries.clear()
+        self._counts = [0, 0, 0, 0]
+        for items in extracted_data.values():
+            for item in items:
+                self.add(item)
+
+    def add(self, item: Dict[str, Any]) -> None:
+        item.setdefault("_status", new_status())
+        self._refresh(item)
+
+    def update(self, item: Dict[str, Any], **changes: Any) -> None:
+        """Apply changes to item["_status"] and move the item between states."""
+        item.setdefault("_status", new_status()).update(changes)
+        self._refresh(item)
+
+    def _refresh(self, item: Dict[str, Any]) -> None:
+        key = id(item)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._apply(entry[1], -1)
+        flags = self._flags(item)
+        self._entries[key] = (item, flags)
+        self._apply(flags, 1)
+
+    def _apply(self, flags: _Flags, delta: int) -> None:
+        for i, flag in enumerate(flags):
+            if flag:
+                self._counts[i] += delta
+
+    def _flags(self, item: Dict[str, Any]) -> _Flags:
+        status = item.get("_status", {})
+        validated = bool(status.get("validated"))
+        return (
+            not validated,
+            validated and not status.get("duplicate_checked"),
+            bool(status.get("needs_clarification")),
+            self._is_saveable(item),
+        )
+
+
+def snapshot(extracted_data: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Copy items and their _status one level deep (enough that later status updates don't leak in)."""
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for key, items in extracted_data.items():
+        copies = []
+        for item in items:
+            copy = dict(item)
+            status = item.get("_status")
+            if isinstance(status, dict):
+                copy["_status"] = {**status, "issues": list(status.get("issues") or [])}
+            copies.append(copy)
+        out[key] = copies
+    return out
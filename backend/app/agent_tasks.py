@@ -0,0 +1,98 @@
+"""
+Background agent work shared by the in-process queue and the external worker:
+run one conversation turn through the user's HealthDataAgent and store any
+clarifications it raised.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.agent_queue import AgentTurn
+from app.agent_registry import agent_registry
+from app import tracing
+from app.llm_gateway import background_work
+from app.supabase_client import get_supabase_client
+
+
+class AgentRunError(RuntimeError):
+    """The agent reported a failed turn; raised so queues can log or retry it."""
+
+
+def store_pending_clarifications(
+    *,
+    user_id: str,
+    member_id: Optional[str],
+    clarifications: List[Dict[str, Any]],
+) -> None:
+    if not clarifications:
+        return
+    supabase_sr = get_supabase_client(use_service_role=True)
+    try:
+        existing = (
+            supabase_sr.table("agent_clarifications")
+            .select("question, context")
+            .eq("user_id", user_id)
+            .eq("status", "pending")
+            .execute()
+        )
+        existing_keys = {(c.get("question"), c.get("context")) for c in (existing.data or [])}
+    except Exception:
+        existing_keys = set()
+
+    rows = []
+    for clarification in clarifications:
+        key = (clarification.get("question"), clarification.get("context"))
+        if key in existing_keys:
+            continue
+        rows.append(
+            {
+                "user_id": user_id,
+                "member_id": member_id,
+                "question": clarification.get("question"),
+                "context": clarification.get("context"),
+                "status": clarification.get("status", "pending"),
+                "priority": clarification.get("priority", 2),
+                "related_item_type": clarification.get("related_item_type"),
+                "related_item_data": clarification.get("related_item_data"),
+                "created_at": datetime.utcnow().isoformat(),
+            }
+        )
+
+    if rows:
+        try:
+            supabase_sr.table("agent_clarifications").insert(rows).execute()
+        except Exception:
+            pass
+
+
+def process_agent_turn(turn: AgentTurn) -> Dict[str, Any]:
+    """Run one queued turn. Returns a small summary; raises AgentRunError if the agent failed."""
+    agent = agent_registry.get_or_create(turn.user_id)
+    parent = tracing.parse_traceparent(turn.traceparent)
+    # Agent LLM calls use the background share of each provider's slots, never chat's reserve
+    with background_work():
+        with tracing.span("agent.turn", parent=parent, **{"agent.coalesced_turns": turn.coalesced}) as span:
+            result = agent.process_conversation_turn(
+                user_message=turn.user_message,
+                assistant_response=turn.assistant_response,
+                member_id=turn.member_id,
+                conversation_history=turn.conversation_history,
+                coalesced_turns=turn.coalesced,
+            )
+            span.set_attribute("agent.llm_calls", result.get("llm_calls", 0))
+            span.set_attribute("agent.saved_items", result.get("saved_items", 0))
+    if not result.get("success"):
+        raise AgentRunError(result.get("error") or "agent run failed")
+    clarifications = result.get("clarifications_needed") or []
+    if clarifications:
+        store_pending_clarifications(
+            user_id=turn.user_id,
+            member_id=turn.member_id,
+            clarifications=clarifications,
+        )
+    return {
+        "saved_items": result.get("saved_items", 0),
+        "llm_calls": result.get("llm_calls", 0),
+        "clarifications": len(clarifications),
+        "coalesced_turns": turn.coalesced,
+        "last_saved": agent.last_saved,
+    }
@@ -0,0 +1,156 @@
+"""
+Out-of-process agent worker. Claims jobs from the agent job store, runs them
+through HealthDataAgent and acks or fails them (failed jobs are retried with
+backoff). Use with AGENT_WORKER_MODE=external on the API so extraction load is
+taken off the API workers:
+
+    cd backend
+    python -m app.agent_worker --concurrency 4
+
+Run several processes for more throughput; jobs are leased (the lease is renewed
+while a job runs), and one user's turns are never processed by two workers at once.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Optional
+
+from app.agent_jobs import SqliteAgentJobStore, get_agent_job_store
+from app.agent_log_sink import agent_log_sink
+from app.agent_tasks import process_agent_turn
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AgentWorker:
+    def __init__(
+        self,
+        store: SqliteAgentJobStore,
+        *,
+        concurrency: int = 1,
+        poll_interval_seconds: float = 0.5,
+        retention_seconds: float = 86400.0,
+        worker_id: Optional[str] = None,
+    ) -> None:
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.poll_interval_seconds = poll_interval_seconds
+        self.retention_seconds = retention_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        """Block until stop() is called; in-flight jobs finish before returning."""
+        threads = [
+            threading.Thread(target=self._loop, args=(f"{self.worker_id}/{i}",), name=f"agent-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        for t in threads:
+            t.start()
+        last_purge = 0.0
+        while not self._stop.wait(self.poll_interval_seconds * 10):
+            if time.monotonic() - last_purge > 3600:
+                last_purge = time.monotonic()
+                try:
+                    self.store.purge(self.retention_seconds)
+                except Exception as e:
+                    logger.warning("Agent job purge failed: %s", e)
+        for t in threads:
+            t.join()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_once(self, worker_id: Optional[str] = None) -> bool:
+        """Claim and process a single job. Returns False if nothing was runnable."""
+        worker_id = worker_id or self.worker_id
+        claimed = self.store.claim(worker_id)
+        if not claimed:
+            return False
+        job_id, turn = claimed
+        with _LeaseHeartbeat(self.store, job_id, worker_id):
+            try:
+                result = process_agent_turn(turn)
+            except Exception as exc:
+                retry = self.store.fail(job_id, worker_id, str(exc))
+                logger.warning("Agent job %s failed (%s): %s", job_id, "will retry" if retry else "giving up", exc)
+                return True
+        if not self.store.ack(job_id, worker_id, result):
+            logger.warning("Agent job %s finished after its lease was lost; result not recorded", job_id)
+        return True
+
+    def _loop(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self.run_once(worker_id):
+                    self._stop.wait(self.poll_interval_seconds)
+            except Exception:
+                logger.exception("Agent worker loop error")
+                self._stop.wait(self.poll_interval_seconds)
+
+
+class _LeaseHeartbeat:
+    """Renews a job's lease in the background while it runs, so long turns are not reclaimed."""
+
+    def __init__(self, store: SqliteAgentJobStore, job_id: int, worker_id: str) -> None:
+        self.store = store
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = max(1.0, min(60.0, store.lease_seconds / 3))
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"agent-lease-{job_id}", daemon=True)
+
+    def __enter__(self) -> "_LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._done.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._done.wait(self.interval):
+            try:
+                if not self.store.heartbeat(self.job_id, self.worker_id):
+                    logger.warning("Agent job %s: lease lost to another worker", self.job_id)
+                    return
+            except Exception as e:
+                logger.warning("Agent job %s: lease renewal failed: %s", self.job_id, e)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run background agent jobs outside the API process.")
+    parser.add_argument("--concurrency", type=int, default=settings.agent_max_concurrency)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    worker = AgentWorker(
+        get_agent_job_store(),
+        concurrency=args.concurrency,
+        poll_interval_seconds=args.poll_interval,
+        retention_seconds=settings.agent_job_retention_seconds,
+    )
+
+    def _handle_signal(signum, _frame):
+        logger.info("Signal %s received; finishing in-flight agent jobs...", signum)
+        worker.stop()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+    logger.info("Agent worker %s started (concurrency=%d, db=%s)", worker.worker_id, worker.concurrency, worker.store.path)
+    worker.run()
+    agent_log_sink.shutdown()
+    logger.info("Agent worker stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Per-user, per-conversation chat history for prompt building.
+Each conversation is a bounded ring buffer in memory; the number of conversations
+held in memory is capped (least recently used dropped first). Optionally every
+message is also persisted to the chat_messages table and reloaded on a cold start.
+"""
+import logging
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONVERSATION = "default"
+
+
+class ChatHistoryStore:
+    def __init__(
+        self,
+        *,
+        max_turns: int,
+        max_conversations: int,
+        persist: bool = False,
+    ) -> None:
+        self.max_turns = max(1, max_turns)
+        self.max_conversations = max(1, max_conversations)
+        self.persist = persist
+        self._conversations: "OrderedDict[Tuple[str, str], Deque[Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._supabase = None
+
+    def append(self, user_id: str, conversation_id: Optional[str], role: str, content: str) -> None:
+        if not content:
+            return
+        key = (user_id, conversation_id or DEFAULT_CONVERSATION)
+        message = {"role": role, "content": content}
+        with self._lock:
+            buffer = self._conversations.get(key)
+        if buffer is None:
+            buffer = self._load(key)
+        with self._lock:
+            buffer = self._conversations.setdefault(key, buffer)
+            buffer.append(message)
+            self._touch(key)
+        if self.persist:
+            self._persist(key, message)
+
+    def recent(
+        self,
+        user_id: str,
+        conversation_id: Optional[str],
+        *,
+        token_budget: Optional[int] = None,
+    ) -> List[Dict[str, str]]:
+        """Most recent turns (oldest first) that fit within token_budget."""
+        key = (user_id, conversation_id or DEFAULT_CONVERSATION)
+        with self._lock:
+            buffer = self._conversations.get(key)
+        if buffer is None:
+            buffer = self._load(key)
+            if not buffer:
+                return []
+            with self._lock:
+                buffer = self._conversations.setdefault(key, buffer)
+                self._touch(key)
+        with self._lock:
+            turns = list(buffer)
+
+        if token_budget is None:
+            return turns
+        kept: List[Dict[str, str]] = []
+        used = 0
+        for turn in reversed(turns):
+            cost = estimate_tokens(turn["content"])
+            if used + cost > token_budget:
+                break
+            kept.append(turn)
+            used += cost
+        kept.reverse()
+        return kept
+
+    def clear(self, user_id: str, conversation_id: Optional[str] = None) -> None:
+        """Forget one conversation (or all of the user's), including persisted chat_messages rows."""
+        with self._lock:
+            if conversation_id:
+                self._conversations.pop((user_id, conversation_id), None)
+            else:
+                for key in [k for k in self._conversations if k[0] == user_id]:
+                    del self._conversations[key]
+        if self.persist:
+            try:
+                query = self._client().table("chat_messages").delete().eq("user_id", user_id)
+                if conversation_id:
+                    query = query.eq("conversation_id", conversation_id)
+                query.execute()
+            except Exception as e:
+                logger.warning("Chat history delete failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "messages": sum(len(b) for b in self._conversations.values()),
+            }
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _touch(self, key: Tuple[str, str]) -> None:
+        """Mark key most recently used and drop the oldest conversations. Call with lock held."""
+        self._conversations.move_to_end(key)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    def _client(self):
+        if self._supabase is None:
+            from app.supabase_client import get_supabase_client
+
+            self._supabase = get_supabase_client(use_service_role=True)
+        return self._supabase
+
+    def _load(self, key: Tuple[str, str]) -> Deque[Dict[str, str]]:
+        buffer: Deque[Dict[str, str]] = deque(maxlen=self.max_turns)
+        if not self.persist:
+            return buffer
+        user_id, conversation_id = key
+        try:
+            res = (
+                self._client().table("chat_messages")
+                .select("role, content")
+                .eq("user_id", user_id)
+                .eq("conversation_id", conversation_id)
+                .order("created_at", desc=True)
+                .limit(self.max_turns)
+                .execute()
+            )
+            for row in reversed(res.data or []):
+                buffer.append({"role": row.get("role"), "content": row.get("content") or ""})
+        except Exception as e:
+            logger.warning("Chat history load failed: %s", e)
+        return buffer
+
+    def _persist(self, key: Tuple[str, str], message: Dict[str, str]) -> None:
+        user_id, conversation_id = key
+        try:
+            self._client().table("chat_messages").insert(
+                {
+                    "user_id": user_id,
+                    "conversation_id": conversation_id,
+                    "role": message["role"],
+                    "content": message["content"],
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                }
+            ).execute()
+        except Exception as e:
+            logger.warning("Chat history persist failed: %s", e)
+
+
+chat_history_store = ChatHistoryStore(
+    max_turns=settings.chat_history_max_turns,
+    max_conversations=settings.chat_history_max_conversations,
+    persist=settings.chat_history_persist,
+)
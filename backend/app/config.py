@@ -22,10 +22,89 @@ class Settings(BaseSettings):
     # AI (no default API keys; set in .env)
     groq_api_key: str = ""
     gemini_api_key: str = ""
+    gemini_api_endpoint: str = ""  # e.g. "http://127.0.0.1:18003" (load-test stand-in, REST transport); empty = Google
     ollama_base_url: str = "http://localhost:11434"
     ollama_chat_model: str = "mistral"
     ollama_embed_model: str = "nomic-embed-text"
     openrouter_api_key: str | None = None
+    openrouter_base_url: str = "https://openrouter.ai/api/v1"
+    openrouter_timeout_seconds: float = 60.0
+
+    # LLM gateway: per-provider concurrency, retries on transient errors, circuit breaker
+    llm_max_concurrency_ollama: int = 4  # match the server's OLLAMA_NUM_PARALLEL
+    llm_max_concurrency_openrouter: int = 8
+    llm_max_concurrency_gemini: int = 4
+    # Of those, what background work (agent runs) may hold; the rest is kept for chat
+    llm_background_concurrency_ollama: int = 2
+    llm_background_concurrency_openrouter: int = 4
+    llm_background_concurrency_gemini: int = 2
+    llm_acquire_timeout_seconds: float = 120.0
+    llm_background_acquire_timeout_seconds: float = 600.0
+    llm_max_retries: int = 2
+    llm_retry_backoff_seconds: float = 0.5
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_seconds: float = 30.0
+    # match_patient_documents / match_document_chunks: tenants up to this many rows are
+    # searched exactly, larger ones through HNSW with this ef_search (higher = better recall, slower)
+    rag_exact_scan_limit: int = 5000
+    rag_ef_search: int = 40
+    # RAG search backend: supabase (RPC per query) | local (per-user in-process index, RPC for larger tenants)
+    rag_vector_index: str = "supabase"
+    rag_local_index_max_users: int = 200
+    rag_local_index_ttl_seconds: int = 600  # reload a user's documents after this (other workers' inserts)
+    # Chat RAG: documents in the prompt; hybrid = vector + keyword search fused by reciprocal rank
+    rag_match_count: int = 4
+    rag_hybrid: bool = True
+    rag_candidate_count: int = 20  # per leg, before fusion
+    rag_rrf_k: int = 60
+    rag_rerank: bool = False  # re-order fused candidates by query-term coverage
+    # Report embedding chunks (estimated tokens): target size, hard cap, overlap, smallest chunk kept on its own
+    rag_chunk_target_tokens: int = 750
+    rag_chunk_max_tokens: int = 1000
+    rag_chunk_overlap_tokens: int = 60
+    rag_chunk_min_tokens: int = 100
+    # Report summaries: one call up to this many estimated tokens, map-reduce over word chunks beyond it
+    summary_max_input_tokens: int = 2500
+    summary_chunk_words: int = 1500
+    summary_chunk_overlap_words: int = 50
+    summary_cache_size: int = 512  # cached chunk summaries (LRU)
+
+    # GET /metrics (Prometheus text format) and the request/dependency timing behind it
+    metrics_enabled: bool = True
+    # Request tracing spans (chat -> context -> RAG -> LLM -> agent): none | console | file (JSON lines)
+    tracing_exporter: str = "none"
+    tracing_file_path: str = "data/traces.jsonl"
+
+    # Chat agent registry: live HealthDataAgent cap, idle eviction, and where evicted state goes
+    agent_registry_max_size: int = 500
+    agent_registry_idle_ttl_seconds: int = 1800
+    agent_state_store: str = "memory"  # memory | supabase (agent_state_snapshots table)
+    agent_pipeline_mode: str = "fast"  # fast (1 LLM call per turn) | react (LLM picks each step)
+    # Stream agent LLM calls and stop once the needed JSON fields are complete
+    agent_llm_stream: bool = True
+    agent_llm_format: str = "json"  # json | schema (Ollama >= 0.5 structured output) | none
+    # agent_execution_logs are buffered and written in batches (by size or interval)
+    agent_log_batch_size: int = 50
+    agent_log_flush_interval_seconds: float = 2.0
+    agent_log_max_buffer: int = 2000
+    # Background agent runs: global concurrency and total queued turns (one run per user at a time)
+    agent_max_concurrency: int = 4
+    agent_queue_max_pending: int = 1000
+    # inline = run on the API's agent pool; external = enqueue to agent_jobs for `python -m app.agent_worker`
+    agent_worker_mode: str = "inline"
+    agent_job_db_path: str = "data/agent_jobs.sqlite3"
+    agent_job_max_attempts: int = 3
+    agent_job_lease_seconds: float = 3600.0  # renewed while a job runs; only a dead worker lets it lapse
+    agent_job_retention_seconds: float = 86400.0
+
+    # Chat history: ring buffer per user/conversation; optional persistence to chat_messages
+    chat_history_max_turns: int = 20
+    chat_history_max_conversations: int = 10000
+    chat_history_token_budget: int = 1000
+    chat_history_persist: bool = False
+
+    # Upper bound on estimated prompt tokens for /chat (sections are trimmed by priority)
+    chat_prompt_token_budget: int = 2500
 
     # Server
     host: str = "0.0.0.0"
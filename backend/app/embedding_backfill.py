@@ -0,0 +1,204 @@
+"""
+Backfill or rebuild patient_documents embeddings:
+
+    cd backend
+    python -m app.embedding_backfill                # rows with no embedding or another model's
+    python -m app.embedding_backfill --all          # re-embed everything (e.g. after changing
+                                                    # OLLAMA_EMBED_MODEL to one of the same size)
+    python -m app.embedding_backfill --dry-run      # just count what would be done
+
+Rows are read in pages ordered by id (keyset, so the scan never slows down
+with offset), embedded in batches through Ollama's /api/embed with several
+batches in flight, and written back with one upsert per batch. Each row's
+metadata.embed_model records the model, which is how stale rows are found.
+After every page the last id is saved to a checkpoint file, so an interrupted
+run continues where it stopped (--restart ignores the checkpoint); a run that
+reaches the end removes it. A failed batch is logged and skipped; its rows
+still match, so the next run retries them.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.llm_gateway import llm_gateway
+from app.supabase_client import supabase
+
+logger = logging.getLogger(__name__)
+
+TABLE = "patient_documents"
+COLUMNS = "id, user_id, member_id, content, metadata"
+
+
+class EmbeddingBackfill:
+    def __init__(
+        self,
+        *,
+        model: str,
+        batch_size: int = 64,
+        concurrency: int = 4,
+        reembed_all: bool = False,
+        checkpoint_path: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> None:
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.reembed_all = reembed_all
+        self.checkpoint_path = checkpoint_path
+        self.limit = limit
+        self.embedded = 0
+        self.failed = 0
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def count(self) -> int:
+        res = self._query("id", count="exact").limit(1).execute()
+        return res.count or 0
+
+    def run(self, last_id: Optional[str] = None) -> Dict[str, Any]:
+        """Embed matching rows with id > last_id; returns counts and throughput."""
+        page_size = self.batch_size * self.concurrency
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backfill") as pool:
+            while not self._stop.is_set():
+                if self.limit is not None and self.embedded + self.failed >= self.limit:
+                    break
+                rows = self._page(last_id, page_size)
+                if not rows:
+                    self._clear_checkpoint()  # finished: the next run starts over (and retries failures)
+                    break
+                batches = [rows[i : i + self.batch_size] for i in range(0, len(rows), self.batch_size)]
+                for ok, n in pool.map(self._embed_batch, batches):
+                    if ok:
+                        self.embedded += n
+                    else:
+                        self.failed += n
+                last_id = rows[-1]["id"]
+                self._save_checkpoint(last_id)
+                elapsed = time.monotonic() - started
+                logger.info(
+                    "Embedded %d rows (%d failed) in %.0fs, %.1f rows/s",
+                    self.embedded, self.failed, elapsed, self.embedded / max(elapsed, 1e-9),
+                )
+        elapsed = time.monotonic() - started
+        return {
+            "embedded": self.embedded,
+            "failed": self.failed,
+            "seconds": round(elapsed, 1),
+            "rows_per_second": round(self.embedded / max(elapsed, 1e-9), 1),
+            "last_id": last_id,
+        }
+
+    def load_checkpoint(self) -> Optional[str]:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", self.checkpoint_path, e)
+            return None
+        if data.get("model") != self.model or data.get("all") != self.reembed_all:
+            return None  # a different run
+        return data.get("last_id")
+
+    def _save_checkpoint(self, last_id: str) -> None:
+        if not self.checkpoint_path:
+            return
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"model": self.model, "all": self.reembed_all, "last_id": last_id}, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _clear_checkpoint(self) -> None:
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _query(self, columns: str, **kwargs: Any) -> Any:
+        query = supabase.table(TABLE).select(columns, **kwargs)
+        if not self.reembed_all:
+            query = query.or_(
+                f'embedding.is.null,metadata->>embed_model.is.null,metadata->>embed_model.neq."{self.model}"'
+            )
+        return query
+
+    def _page(self, last_id: Optional[str], size: int) -> List[Dict[str, Any]]:
+        if self.limit is not None:
+            size = min(size, self.limit - self.embedded - self.failed)
+        query = self._query(COLUMNS)
+        if last_id:
+            query = query.gt("id", last_id)
+        return query.order("id").limit(size).execute().data or []
+
+    def _embed_batch(self, rows: List[Dict[str, Any]]) -> Tuple[bool, int]:
+        try:
+            embeddings = llm_gateway.ollama_embed_batch([r.get("content") or "" for r in rows])
+            updates = [
+                {
+                    "id": r["id"],
+                    "user_id": r["user_id"],
+                    "member_id": r.get("member_id"),
+                    "content": r["content"],
+                    "metadata": {**(r.get("metadata") or {}), "embed_model": self.model},
+                    "embedding": embedding,
+                }
+                for r, embedding in zip(rows, embeddings)
+            ]
+            supabase.table(TABLE).upsert(updates, on_conflict="id").execute()
+            return True, len(rows)
+        except Exception as e:
+            logger.warning("Batch of %d rows starting at %s failed: %s", len(rows), rows[0]["id"], e)
+            return False, len(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embed patient_documents rows that are missing or stale.")
+    parser.add_argument("--all", action="store_true", help="Re-embed every row, not only missing/stale ones")
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per Ollama request")
+    parser.add_argument("--concurrency", type=int, default=settings.llm_max_concurrency_ollama)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many rows")
+    parser.add_argument("--checkpoint", default=".embedding_backfill.json")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Count matching rows and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    backfill = EmbeddingBackfill(
+        model=settings.ollama_embed_model,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        reembed_all=args.all,
+        checkpoint_path=args.checkpoint,
+        limit=args.limit,
+    )
+    if args.dry_run:
+        logger.info("%d rows to embed with %s", backfill.count(), backfill.model)
+        return
+
+    def _handle_signal(signum, _frame):
+        logger.info("Signal %s received; finishing the current page...", signum)
+        backfill.stop()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+    last_id = None if args.restart else backfill.load_checkpoint()
+    if last_id:
+        logger.info("Resuming after id %s", last_id)
+    result = backfill.run(last_id)
+    logger.info("Backfill done: %s", result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Incremental parser for a JSON object arriving in chunks (streamed LLM output).
+It tracks the top-level object only: which keys have a complete value so far,
+which key is being written now, and whether the object has closed. That is
+enough to stop generation as soon as the fields we need are in, without
+waiting for the model to finish (or to stop rambling after the closing brace).
+
+    parser = JSONStreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.has_complete("action"):
+            break
+    parser.result()  # {"action": ...} - only the completed fields
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class JSONStreamParser:
+    def __init__(self) -> None:
+        self.text = ""
+        self.done = False  # the top-level object has closed
+        self.current_key: Optional[str] = None  # top-level key whose value is being written
+        self._pos = 0
+        self._root_start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_start = -1
+        self._value_start = -1
+        self._fields: List[Tuple[str, int, int]] = []  # (key, value start, value end) in text
+        self._completed: Dict[str, int] = {}
+
+    def feed(self, chunk: str) -> None:
+        if self.done or not chunk:
+            return
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            if self._root_start < 0:
+                # Skip any preamble (```json fences, prose) before the object
+                if ch == "{":
+                    self._root_start = self._pos
+                    self._depth = 1
+                    self._expect_key = True
+                self._pos += 1
+                continue
+            if self._in_string:
+                self._on_string_char(ch)
+            else:
+                self._on_char(ch)
+            self._pos += 1
+
+    def has_complete(self, *keys: str) -> bool:
+        return all(key in self._completed for key in keys)
+
+    def completed_keys(self) -> List[str]:
+        return [key for key, _, _ in self._fields]
+
+    def result(self) -> Dict[str, Any]:
+        """Completed top-level fields (the whole object once it has closed)."""
+        if self.done:
+            try:
+                return json.loads(self.text[self._root_start : self._pos])
+            except ValueError:
+                pass
+        out: Dict[str, Any] = {}
+        for key, start, end in self._fields:
+            try:
+                out[key] = json.loads(self.text[start:end])
+            except ValueError:
+                continue
+        return out
+
+    # ----------------------------
+    # Internals
+    # ----------------------------
+    def _on_string_char(self, ch: str) -> None:
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._depth == 1 and self._key_start >= 0:
+                # Closing quote of a top-level key
+                try:
+                    self.current_key = json.loads(self.text[self._key_start : self._pos + 1])
+                except ValueError:
+                    self.current_key = None
+                self._key_start = -1
+            elif self._depth == 1 and self.current_key is not None:
+                # Closing quote of a top-level string value
+                self._finish_value(self._pos + 1)
+
+    def _on_char(self, ch: str) -> None:
+        if ch == '"':
+            self._in_string = True
+            if self._depth == 1 and self._expect_key:
+                self._key_start = self._pos
+                self._expect_key = False
+            elif self._depth == 1 and self._value_start < 0:
+                self._value_start = self._pos
+            return
+        if ch == ":" and self._depth == 1:
+            self._value_start = -1
+            return
+        if ch in "{[":
+            if self._depth == 1 and self._value_start < 0:
+                self._value_start = self._pos
+            self._depth += 1
+            return
+        if ch in "}]":
+            self._depth -= 1
+            if self._depth == 1 and self.current_key is not None:
+                self._finish_value(self._pos + 1)
+            elif self._depth == 0:
+                self._finish_value(self._pos)
+                self.done = True
+            return
+        if self._depth != 1:
+            return
+        if ch == ",":
+            self._finish_value(self._pos)
+            self._expect_key = True
+        elif not ch.isspace() and self._value_start < 0 and self.current_key is not None:
+            self._value_start = self._pos  # number / true / false / null
+
+    def _finish_value(self, end: int) -> None:
+        """Record the current key's value as complete (idempotent per key)."""
+        key = self.current_key
+        if key is None or self._value_start < 0 or key in self._completed:
+            return
+        self._completed[key] = len(self._fields)
+        self._fields.append((key, self._value_start, end))
+        self.current_key = None
+        self._value_start = -1
@@ -0,0 +1,606 @@
+"""
+Single exit point for LLM and embedding traffic (Ollama, OpenRouter, Gemini).
+Per provider it keeps:
+- pooled clients: one requests.Session (keep-alive, bounded pool) for Ollama,
+  one OpenAI and one AsyncOpenAI client for OpenRouter, cached GenerativeModel
+  objects for Gemini;
+- a concurrency limit (callers wait up to llm_acquire_timeout_seconds for a slot),
+  of which background work (agent runs, inside background_work()) may hold only
+  llm_background_concurrency_<provider>, so the rest stays free for chat;
+- retries with jittered exponential backoff on transport errors, timeouts and 5xx;
+- a circuit breaker: after N consecutive failures calls fail fast for a cool-down,
+  then one trial call decides whether to close it again;
+- uniform stats: calls, errors, retries, rejections, latency and token counts,
+  plus a trace span and a latency histogram (/metrics) per provider/model/operation.
+Client errors (4xx, including 429 quota) are returned to the caller unchanged and
+do not trip the breaker, so per-model fallbacks keep working.
+"""
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+from app import tracing
+from app.metrics import llm_request_duration_seconds
+
+logger = logging.getLogger(__name__)
+
+_TRANSIENT_ERRORS = {
+    # requests
+    "ConnectionError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "Timeout",
+    "ChunkedEncodingError",
+    # openai
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    # google.api_core
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+}
+
+
+class LLMUnavailableError(RuntimeError):
+    """Provider circuit is open or all of its slots stayed busy; the call was not attempted."""
+
+
+_background: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_background", default=False)
+
+
+@contextmanager
+def background_work() -> Iterator[None]:
+    """Calls made inside count against the providers' background limits, not chat's reserved slots."""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        response = getattr(exc, "response", None)
+        code = getattr(response, "status_code", None)
+    if code is None and isinstance(getattr(exc, "code", None), int):
+        code = exc.code
+    return code if isinstance(code, int) else None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Worth retrying and counted against the breaker: network trouble, timeouts, 5xx."""
+    code = _status_code(exc)
+    if code is not None:
+        return code >= 500
+    return type(exc).__name__ in _TRANSIENT_ERRORS
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout_seconds: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self.state = "closed"  # closed | open | half_open
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout_seconds:
+                    return False
+                self.state = "half_open"  # let one trial call through
+                return True
+            if self.state == "half_open":
+                return False  # trial call in flight
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self.state = "closed"
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("LLM circuit opened after %d failures", self._failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """The half-open trial was never sent (no free slot): let the next call try."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"  # _opened_at is unchanged, so allow() goes half-open again
+
+
+class Provider:
+    def __init__(self, name: str, *, max_concurrency: int, background_concurrency: Optional[int] = None) -> None:
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        if background_concurrency is None:
+            background_concurrency = self.max_concurrency
+        self.background_concurrency = max(1, min(background_concurrency, self.max_concurrency))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._background_slots = threading.BoundedSemaphore(self.background_concurrency)
+        self.breaker = CircuitBreaker(
+            settings.llm_breaker_failure_threshold,
+            settings.llm_breaker_reset_seconds,
+        )
+        self._lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "background_in_flight": 0,
+            "latency_ms_total": 0.0,
+            "latency_ms_max": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    def call(self, fn: Callable[[], Any], *, retries: Optional[int] = None) -> Any:
+        """Run fn inside a concurrency slot with retries and the breaker."""
+        with self.slot():
+            return self.attempt(fn, retries=retries)
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], *, retries: Optional[int] = None) -> Any:
+        """Async call(): fn returns a coroutine; waiting and backoff never block the event loop."""
+        async with self.aslot():
+            attempt = 0
+            while True:
+                started = time.perf_counter()
+                try:
+                    result = await fn()
+                except Exception as exc:
+                    delay = self._after_failure(exc, started, attempt, retries)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                self._after_success(started)
+                return result
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        self._check_breaker()
+        background = _background.get()
+        if not self._acquire(background, blocking=True):
+            self._reject_busy()
+        with self._holding(background), self._trial_guard():
+            yield
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """
+        Same slots as slot(), so sync and async callers share one limit. A free
+        slot is taken inline; otherwise the wait happens on an executor thread.
+        """
+        self._check_breaker()
+        background = _background.get()
+        if not self._acquire(background, blocking=False):
+            ctx = contextvars.copy_context()
+            waiter = asyncio.get_running_loop().run_in_executor(None, ctx.run, self._acquire, background, True)
+            try:
+                acquired = await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                # Give the slot back if the thread gets it after we stopped waiting
+                waiter.add_done_callback(lambda f: f.result() and self._release(background))
+                self.breaker.release_trial()
+                raise
+            if not acquired:
+                self._reject_busy()
+        with self._holding(background), self._trial_guard():
+            yield
+
+    @contextmanager
+    def _trial_guard(self) -> Iterator[None]:
+        """
+        A call ended by cancellation (client gone, task cancelled) or interrupt
+        records neither success nor failure; if it was the half-open trial, hand
+        the trial back so the breaker does not stay half-open for good.
+        """
+        try:
+            yield
+        except Exception:
+            raise
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+    def _acquire(self, background: bool, blocking: bool) -> bool:
+        """
+        Take a slot. Background callers first take one of the background slots,
+        so they can never fill the slots left for chat; they also wait longer,
+        since nobody is watching a spinner.
+        """
+        if not background:
+            return self._slots.acquire(blocking, settings.llm_acquire_timeout_seconds if blocking else None)
+        timeout = settings.llm_background_acquire_timeout_seconds
+        deadline = time.monotonic() + timeout
+        if not self._background_slots.acquire(blocking, timeout if blocking else None):
+            return False
+        remaining = max(0.0, deadline - time.monotonic())
+        if self._slots.acquire(blocking, remaining if blocking else None):
+            return True
+        self._background_slots.release()
+        return False
+
+    def _release(self, background: bool) -> None:
+        self._slots.release()
+        if background:
+            self._background_slots.release()
+
+    @contextmanager
+    def _holding(self, background: bool) -> Iterator[None]:
+        self._bump("in_flight")
+        if background:
+            self._bump("background_in_flight")
+        try:
+            yield
+        finally:
+            self._bump("in_flight", -1)
+            if background:
+                self._bump("background_in_flight", -1)
+            self._release(background)
+
+    def attempt(self, fn: Callable[[], Any], *, retries: Optional[int] = None) -> Any:
+        """Call fn, retrying transient failures with jittered exponential backoff."""
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as exc:
+                delay = self._after_failure(exc, started, attempt, retries)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._after_success(started)
+            return result
+
+    def record_tokens(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+        with self._lock:
+            self._stats["prompt_tokens"] += int(prompt_tokens or 0)
+            self._stats["completion_tokens"] += int(completion_tokens or 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        attempts = stats["calls"] + stats["retries"]
+        stats["latency_ms_avg"] = round(stats.pop("latency_ms_total") / attempts, 1) if attempts else 0.0
+        stats["latency_ms_max"] = round(stats["latency_ms_max"], 1)
+        stats["circuit"] = self.breaker.state
+        stats["max_concurrency"] = self.max_concurrency
+        stats["background_concurrency"] = self.background_concurrency
+        return stats
+
+    def _check_breaker(self) -> None:
+        if not self.breaker.allow():
+            self._bump("rejected")
+            raise LLMUnavailableError(f"{self.name} circuit is open")
+
+    def _reject_busy(self) -> None:
+        self.breaker.release_trial()
+        self._bump("rejected")
+        raise LLMUnavailableError(f"{self.name} is at its concurrency limit")
+
+    def _after_success(self, started: float) -> None:
+        self._record_latency(started)
+        self._bump_call(error=False)
+        self.breaker.record_success()
+
+    def _after_failure(self, exc: Exception, started: float, attempt: int, retries: Optional[int]) -> Optional[float]:
+        """Record a failed attempt; return the backoff before retrying, or None to give up."""
+        self._record_latency(started)
+        retries = settings.llm_max_retries if retries is None else retries
+        if not is_transient(exc):
+            self._bump_call(error=True)
+            self.breaker.record_success()  # the provider answered; the request was bad
+            return None
+        if attempt >= retries:
+            self._bump_call(error=True)
+            self.breaker.record_failure()
+            return None
+        self._bump("retries")
+        delay = settings.llm_retry_backoff_seconds * (2 ** attempt)
+        return random.uniform(0, delay * 2)  # full jitter around the backoff
+
+    def _bump(self, key: str, delta: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += delta
+
+    def _bump_call(self, *, error: bool) -> None:
+        with self._lock:
+            self._stats["calls"] += 1
+            if error:
+                self._stats["errors"] += 1
+
+    def _record_latency(self, started: float) -> None:
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["latency_ms_total"] += elapsed
+            self._stats["latency_ms_max"] = max(self._stats["latency_ms_max"], elapsed)
+
+
+@contextmanager
+def _observed(*, provider: str, model: str, operation: str) -> Iterator[None]:
+    """Trace span and latency histogram around one gateway call."""
+    with tracing.span(f"llm.{provider}.{operation}", **{"llm.provider": provider, "llm.model": model}):
+        with llm_request_duration_seconds.time(provider=provider, model=model, operation=operation):
+            yield
+
+
+def _ollama_operation(path: str) -> str:
+    """"/api/generate" -> "generate"; both embedding endpoints -> "embed"."""
+    operation = path.rsplit("/", 1)[-1]
+    return "embed" if operation.startswith("embed") else operation
+
+
+class LLMGateway:
+    def __init__(self) -> None:
+        self.providers: Dict[str, Provider] = {
+            "ollama": Provider(
+                "ollama",
+                max_concurrency=settings.llm_max_concurrency_ollama,
+                background_concurrency=settings.llm_background_concurrency_ollama,
+            ),
+            "openrouter": Provider(
+                "openrouter",
+                max_concurrency=settings.llm_max_concurrency_openrouter,
+                background_concurrency=settings.llm_background_concurrency_openrouter,
+            ),
+            "gemini": Provider(
+                "gemini",
+                max_concurrency=settings.llm_max_concurrency_gemini,
+                background_concurrency=settings.llm_background_concurrency_gemini,
+            ),
+        }
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._openrouter: Any = None
+        self._openrouter_async: Any = None
+        self._gemini_models: Dict[str, Any] = {}
+        self._gemini_configured = False
+        self._ollama_models: Optional[List[str]] = None
+        self._ollama_models_at = 0.0
+
+    # ----------------------------
+    # Ollama
+    # ----------------------------
+    def ollama_json(self, path: str, payload: Dict[str, Any], *, timeout: float) -> Dict[str, Any]:
+        """POST to Ollama and return the JSON body (non-streaming)."""
+        provider = self.providers["ollama"]
+
+        def _post() -> Dict[str, Any]:
+            response = self._ollama_session().post(f"{settings.ollama_base_url}{path}", json=payload, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        with _observed(
+            provider="ollama", model=payload.get("model", ""), operation=_ollama_operation(path)
+        ):
+            data = provider.call(_post)
+        provider.record_tokens(data.get("prompt_eval_count"), data.get("eval_count"))
+        return data
+
+    @contextmanager
+    def ollama_stream(self, path: str, payload: Dict[str, Any], *, timeout: float) -> Iterator[requests.Response]:
+        """
+        Streaming POST to Ollama. The slot is held while the caller reads; only
+        opening the stream is retried. Closing the response stops generation.
+        """
+        provider = self.providers["ollama"]
+
+        def _open() -> requests.Response:
+            response = self._ollama_session().post(
+                f"{settings.ollama_base_url}{path}", json=payload, stream=True, timeout=timeout
+            )
+            try:
+                response.raise_for_status()
+            except Exception:
+                response.close()
+                raise
+            return response
+
+        timer = _observed(
+            provider="ollama", model=payload.get("model", ""), operation=_ollama_operation(path)
+        )
+        with timer, provider.slot():
+            response = provider.attempt(_open)
+            try:
+                yield response
+            finally:
+                response.close()
+
+    def ollama_embed(self, text: str, *, timeout: float = 30) -> Optional[List[float]]:
+        """Embedding from OLLAMA_EMBED_MODEL, or None on any failure."""
+        try:
+            data = self.ollama_json(
+                "/api/embeddings",
+                {"model": settings.ollama_embed_model, "prompt": text},
+                timeout=timeout,
+            )
+            return data.get("embedding")
+        except Exception as e:
+            logger.debug("Ollama embedding failed: %s", e)
+            return None
+
+    def ollama_embed_batch(self, texts: List[str], *, timeout: float = 120) -> List[List[float]]:
+        """Embeddings for several texts in one request (/api/embed). Raises on failure."""
+        data = self.ollama_json(
+            "/api/embed",
+            {"model": settings.ollama_embed_model, "input": texts},
+            timeout=timeout,
+        )
+        embeddings = data.get("embeddings") or []
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} inputs")
+        return embeddings
+
+    def ollama_models(self, *, timeout: float = 2, ttl_seconds: float = 60) -> List[str]:
+        """Locally available model names (cached briefly; [] if Ollama is unreachable)."""
+        now = time.monotonic()
+        if self._ollama_models is not None and now - self._ollama_models_at < ttl_seconds:
+            return self._ollama_models
+        try:
+            response = self._ollama_session().get(f"{settings.ollama_base_url}/api/tags", timeout=timeout)
+            response.raise_for_status()
+            models = [m["name"] for m in response.json().get("models", [])]
+        except Exception:
+            models = []
+        self._ollama_models, self._ollama_models_at = models, now
+        return models
+
+    def record_tokens(self, provider: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+        """For streamed calls, where token counts arrive in the caller's final chunk."""
+        self.providers[provider].record_tokens(prompt_tokens, completion_tokens)
+
+    # ----------------------------
+    # OpenRouter (OpenAI-compatible)
+    # ----------------------------
+    def openrouter_chat(self, messages: List[Dict[str, Any]], *, model: str, **kwargs: Any) -> str:
+        provider = self.providers["openrouter"]
+        with _observed(provider="openrouter", model=model, operation="chat"):
+            completion = provider.call(
+                lambda: self._openrouter_client().chat.completions.create(model=model, messages=messages, **kwargs)
+            )
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            provider.record_tokens(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+        return (completion.choices[0].message.content or "").strip()
+
+    async def openrouter_chat_async(self, messages: List[Dict[str, Any]], *, model: str, **kwargs: Any) -> str:
+        """openrouter_chat for async endpoints (AsyncOpenAI; same limits, breaker and stats)."""
+        provider = self.providers["openrouter"]
+        client = self._openrouter_async_client()
+        with _observed(provider="openrouter", model=model, operation="chat"):
+            completion = await provider.acall(
+                lambda: client.chat.completions.create(model=model, messages=messages, **kwargs)
+            )
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            provider.record_tokens(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+        return (completion.choices[0].message.content or "").strip()
+
+    def openrouter_embed(self, text: str, *, model: str, dimensions: Optional[int] = None) -> List[float]:
+        provider = self.providers["openrouter"]
+        kwargs: Dict[str, Any] = {"model": model, "input": text}
+        if dimensions:
+            kwargs["dimensions"] = dimensions
+        with _observed(provider="openrouter", model=model, operation="embed"):
+            response = provider.call(lambda: self._openrouter_client().embeddings.create(**kwargs))
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            provider.record_tokens(getattr(usage, "prompt_tokens", 0), 0)
+        return response.data[0].embedding
+
+    # ----------------------------
+    # Gemini
+    # ----------------------------
+    def gemini_generate(self, model_name: str, contents: Any, **kwargs: Any) -> Any:
+        """
+        generate_content on a cached GenerativeModel. Errors (incl. 429 quota)
+        propagate without a retry: callers already fall back across models.
+        """
+        provider = self.providers["gemini"]
+        model = self._gemini_model(model_name)
+        with _observed(provider="gemini", model=model_name, operation="generate"):
+            response = provider.call(lambda: model.generate_content(contents, **kwargs), retries=0)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            provider.record_tokens(
+                getattr(usage, "prompt_token_count", 0),
+                getattr(usage, "candidates_token_count", 0),
+            )
+        return response
+
+    # ----------------------------
+    # Stats
+    # ----------------------------
+    def stats(self) -> Dict[str, Any]:
+        return {name: provider.stats() for name, provider in self.providers.items()}
+
+    # ----------------------------
+    # Clients (created once, on first use)
+    # ----------------------------
+    def _ollama_session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    pool = self.providers["ollama"].max_concurrency + 2
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def _openrouter_client(self) -> Any:
+        if self._openrouter is None:
+            with self._lock:
+                if self._openrouter is None:
+                    from openai import OpenAI
+
+                    self._openrouter = OpenAI(
+                        base_url=settings.openrouter_base_url,
+                        api_key=settings.openrouter_api_key or "sk-or-v1-missing",
+                        timeout=settings.openrouter_timeout_seconds,
+                        max_retries=0,  # retries happen here, with the breaker in the loop
+                    )
+        return self._openrouter
+
+    def _openrouter_async_client(self) -> Any:
+        if self._openrouter_async is None:
+            with self._lock:
+                if self._openrouter_async is None:
+                    from openai import AsyncOpenAI
+
+                    self._openrouter_async = AsyncOpenAI(
+                        base_url=settings.openrouter_base_url,
+                        api_key=settings.openrouter_api_key or "sk-or-v1-missing",
+                        timeout=settings.openrouter_timeout_seconds,
+                        max_retries=0,
+                    )
+        return self._openrouter_async
+
+    def _gemini_model(self, model_name: str) -> Any:
+        with self._lock:
+            model = self._gemini_models.get(model_name)
+            if model is None:
+                import google.generativeai as genai
+
+                if not self._gemini_configured:
+                    if settings.gemini_api_endpoint:
+                        genai.configure(
+                            api_key=settings.gemini_api_key,
+                            transport="rest",
+                            client_options={"api_endpoint": settings.gemini_api_endpoint},
+                        )
+                    else:
+                        genai.configure(api_key=settings.gemini_api_key)
+                    self._gemini_configured = True
+                model = genai.GenerativeModel(model_name)
+                self._gemini_models[model_name] = model
+            return model
+
+
+llm_gateway = LLMGateway()
@@ -5,9 +5,14 @@ Database: Supabase only. No MongoDB.
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import settings
+from app.agent_log_sink import agent_log_sink
+from app.agent_queue import agent_work_queue
+from app.metrics import MetricsMiddleware, registry
+from app.tracing import TracingMiddleware
 from app.routers import health, auth, health_records, reports, medicines, appointments, chat, members, doctors
 
 logging.basicConfig(
@@ -23,6 +28,8 @@ async def lifespan(app: FastAPI):
     logger.info("Starting MediSaathi API...")
     yield
     logger.info("Shutting down MediSaathi API...")
+    agent_work_queue.shutdown()
+    agent_log_sink.shutdown()
 
 
 # Initialize FastAPI application
@@ -42,6 +49,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so CORS preflights and errors are counted (and traced) too
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(health.router, prefix=settings.api_v1_prefix, tags=["Health"])
 app.include_router(auth.router, prefix=settings.api_v1_prefix, tags=["Auth"])
@@ -58,6 +70,14 @@ app.include_router(members.router, prefix=settings.api_v1_prefix, tags=["Members
 app.include_router(doctors.router, prefix=settings.api_v1_prefix, tags=["Doctors"])
 
 
+if settings.metrics_enabled:
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus text exposition (per process)."""
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
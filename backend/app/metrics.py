@@ -0,0 +1,251 @@
+"""
+In-process metrics in the Prometheus text format, served at GET /metrics.
+
+Counters, gauges and histograms with labels, kept per process (with several
+uvicorn/gunicorn workers, scrape each one or put them behind a per-worker
+port). Recorded:
+- every HTTP request by method and route template (not raw path), plus the
+  number in flight (MetricsMiddleware);
+- every Supabase table operation / RPC (the instrumented client in
+  app.supabase_client);
+- every LLM and embedding call by provider, model and operation (LLMGateway);
+- PDF text extraction, chat prompt building and agent runs (duration and
+  iterations);
+- streamed chat replies: time to first token, inter-token gaps, tokens/sec
+  and token counts (app.stream_stats).
+Histograms with an "outcome" label get "ok" or "error" filled in by time().
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args: Any, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the block in seconds (and its outcome, if labelled)."""
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            if "outcome" in self.labelnames:
+                labels["outcome"] = outcome
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(counts), total[0]) for k, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            cumulative += counts[-1]
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._labels(key, inf)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_num(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+registry = Registry()
+
+http_requests_total = registry.register(
+    Counter("http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+)
+http_request_duration_seconds = registry.register(
+    Histogram("http_request_duration_seconds", "HTTP request duration, including streamed bodies.", ("method", "route"))
+)
+http_requests_in_flight = registry.register(Gauge("http_requests_in_flight", "HTTP requests being served."))
+supabase_request_duration_seconds = registry.register(
+    Histogram(
+        "supabase_request_duration_seconds",
+        "Supabase (PostgREST) calls by table or RPC and operation.",
+        ("table", "operation", "outcome"),
+    )
+)
+llm_request_duration_seconds = registry.register(
+    Histogram(
+        "llm_request_duration_seconds",
+        "LLM and embedding calls (including queueing for a slot and retries).",
+        ("provider", "model", "operation", "outcome"),
+    )
+)
+pdf_parse_duration_seconds = registry.register(
+    Histogram("pdf_parse_duration_seconds", "PDF text extraction.", ("source",))
+)
+chat_prompt_build_duration_seconds = registry.register(
+    Histogram("chat_prompt_build_duration_seconds", "Chat context queries, RAG retrieval and prompt assembly.")
+)
+agent_run_duration_seconds = registry.register(
+    Histogram("agent_run_duration_seconds", "Background agent runs.", ("mode", "outcome"))
+)
+agent_iterations = registry.register(
+    Histogram("agent_iterations", "LLM iterations per agent run.", ("mode",), buckets=(1, 2, 3, 4, 5, 6, 8, 10))
+)
+
+chat_time_to_first_token_seconds = registry.register(
+    Histogram("chat_time_to_first_token_seconds", "Chat stream start (incl. prompt build) to first token.", ("model",))
+)
+chat_inter_token_seconds = registry.register(
+    Histogram(
+        "chat_inter_token_seconds",
+        "Gap between streamed chat chunks.",
+        ("model",),
+        buckets=(0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5),
+    )
+)
+chat_tokens_per_second = registry.register(
+    Histogram(
+        "chat_tokens_per_second",
+        "Chat generation speed (Ollama eval_count / eval_duration).",
+        ("model",),
+        buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 250),
+    )
+)
+chat_tokens_total = registry.register(
+    Counter("chat_tokens_total", "Chat tokens by kind (prompt, completion), as counted by Ollama.", ("model", "kind"))
+)
+chat_prompt_tokens = registry.register(
+    Histogram(
+        "chat_prompt_tokens",
+        "Estimated chat prompt size.",
+        buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000),
+    )
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request count, duration (until the last body chunk) and in-flight gauge."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status: Optional[int] = None
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            status = 500
+            raise
+        finally:
+            http_requests_in_flight.dec()
+            # The router puts the matched route in the scope; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_request_duration_seconds.observe(time.perf_counter() - started, method=method, route=route)
+            http_requests_total.inc(method=method, route=route, status=status or 0)
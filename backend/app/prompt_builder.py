@@ -0,0 +1,182 @@
+"""
+Token-budgeted prompt assembly for chat and agent prompts.
+Sections get their own token budget and a priority; when the whole prompt is
+over budget, the lowest-priority sections are trimmed first. Row data is
+projected down to a few fields instead of pasting raw rows.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Rough chars-per-token for English text; conservative enough for budgeting
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int, *, keep: str = "head") -> str:
+    """
+    Trim text to about max_tokens, cutting on line boundaries where possible.
+    keep="head" keeps the beginning (documents, lists); keep="tail" keeps the end (conversations).
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    lines = text.split("\n")
+    if keep == "tail":
+        lines.reverse()
+    kept: List[str] = []
+    used = 0
+    for line in lines:
+        cost = len(line) + 1
+        if used + cost > max_chars:
+            if not kept:
+                # The first line kept is longer than the budget: hard cut it
+                kept.append(line[-max_chars:] if keep == "tail" else line[:max_chars])
+            break
+        kept.append(line)
+        used += cost
+    if keep == "tail":
+        kept.reverse()
+    return "\n".join(kept)
+
+
+def project_rows(rows: Iterable[Dict[str, Any]], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """Keep only the given fields of each row, dropping empty values."""
+    out = []
+    for row in rows or []:
+        projected = {f: row.get(f) for f in fields if row.get(f) not in (None, "", [], {})}
+        if projected:
+            out.append(projected)
+    return out
+
+
+def format_row(row: Dict[str, Any], fields: Sequence[str]) -> str:
+    """Compact 'v1 | v2 | v3' for one row, in field order, skipping empty values."""
+    return " | ".join(str(row[f]) for f in fields if row.get(f) not in (None, "", [], {}))
+
+
+def format_rows(rows: Iterable[Dict[str, Any]], fields: Sequence[str]) -> str:
+    """One compact line per row: '- v1 | v2 | v3' in field order."""
+    return "\n".join("- " + format_row(row, fields) for row in project_rows(rows, fields))
+
+
+@dataclass
+class PromptSection:
+    name: str
+    text: str
+    title: Optional[str] = None  # rendered as "\n{title}:\n" above the text; never truncated
+    budget: Optional[int] = None  # per-section token cap (None = no cap)
+    priority: int = 50  # lower = more important; higher priorities are trimmed first
+    keep: str = "head"
+    required: bool = False  # never trimmed by the total budget
+
+
+@dataclass
+class PromptStats:
+    total_tokens: int = 0
+    sections: Dict[str, int] = field(default_factory=dict)
+    truncated: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_tokens": self.total_tokens,
+            "sections": dict(self.sections),
+            "truncated": list(self.truncated),
+        }
+
+
+class PromptBuilder:
+    """
+    Collects sections in output order and renders them within total_budget tokens.
+    Usage:
+        builder = PromptBuilder(total_budget=2500)
+        builder.add("header", HEADER, required=True)
+        builder.add("records", records_text, budget=300, priority=30)
+        prompt = builder.build()
+        builder.stats.total_tokens
+    """
+
+    def __init__(self, total_budget: int, *, separator: str = "\n") -> None:
+        self.total_budget = total_budget
+        self.separator = separator
+        self.sections: List[PromptSection] = []
+        self.stats = PromptStats()
+
+    def add(
+        self,
+        name: str,
+        text: str,
+        *,
+        title: Optional[str] = None,
+        budget: Optional[int] = None,
+        priority: int = 50,
+        keep: str = "head",
+        required: bool = False,
+    ) -> "PromptBuilder":
+        if text:
+            self.sections.append(
+                PromptSection(
+                    name=name,
+                    text=text,
+                    title=title,
+                    budget=budget,
+                    priority=priority,
+                    keep=keep,
+                    required=required,
+                )
+            )
+        return self
+
+    def build(self) -> str:
+        stats = PromptStats()
+        bodies: List[str] = []
+        for section in self.sections:
+            text = section.text
+            if section.budget is not None and estimate_tokens(text) > section.budget:
+                text = truncate_to_tokens(text, section.budget, keep=section.keep)
+                stats.truncated.append(section.name)
+            bodies.append(text)
+
+        costs = [self._cost(s, b) for s, b in zip(self.sections, bodies)]
+        total = sum(costs)
+        if total > self.total_budget:
+            # Trim least important sections first until the prompt fits
+            order = sorted(
+                (i for i, s in enumerate(self.sections) if not s.required),
+                key=lambda i: self.sections[i].priority,
+                reverse=True,
+            )
+            for idx in order:
+                if total <= self.total_budget:
+                    break
+                section = self.sections[idx]
+                allowed = estimate_tokens(bodies[idx]) - (total - self.total_budget)
+                bodies[idx] = truncate_to_tokens(bodies[idx], allowed, keep=section.keep)
+                new_cost = self._cost(section, bodies[idx])
+                total += new_cost - costs[idx]
+                costs[idx] = new_cost
+                if section.name not in stats.truncated:
+                    stats.truncated.append(section.name)
+
+        parts = []
+        for section, body, cost in zip(self.sections, bodies, costs):
+            if body:
+                parts.append(self._render(section, body))
+                stats.sections[section.name] = cost
+        prompt = self.separator.join(parts)
+        stats.total_tokens = estimate_tokens(prompt)
+        self.stats = stats
+        return prompt
+
+    @staticmethod
+    def _render(section: PromptSection, body: str) -> str:
+        return f"\n{section.title}:\n{body}" if section.title else body
+
+    def _cost(self, section: PromptSection, body: str) -> int:
+        return estimate_tokens(self._render(section, body)) if body else 0
@@ -1,22 +1,9 @@
-from typing import Optional, Dict, Any, List
-import requests
+from typing import Optional, Dict, Any
 
 from app.config import settings
+from app.llm_gateway import llm_gateway
 from app.supabase_client import supabase
-
-
-def _ollama_embed(text: str) -> Optional[List[float]]:
-    try:
-        r = requests.post(
-            f"{settings.ollama_base_url}/api/embeddings",
-            json={"model": settings.ollama_embed_model, "prompt": text},
-            timeout=30,
-        )
-        r.raise_for_status()
-        data = r.json()
-        return data.get("embedding")
-    except Exception:
-        return None
+from app.vector_index import vector_index
 
 
 def store_patient_document(
@@ -33,17 +20,22 @@ def store_patient_document(
         clean_member_id = member_id
         if clean_member_id in ("", "me", "null"):
             clean_member_id = None
-        embedding = _ollama_embed(content)
-        if not embedding:
-            return
+        # Stored even if embedding fails: the row is still keyword-searchable and
+        # `python -m app.embedding_backfill` fills in the missing embedding later.
+        embedding = llm_gateway.ollama_embed(content)
+        row_metadata = dict(metadata or {})
+        if embedding:
+            row_metadata["embed_model"] = settings.ollama_embed_model
         row = {
             "user_id": user_id,
             "member_id": clean_member_id,
             "content": str(content).strip()[:50000],
-            "metadata": metadata or {},
-            "embedding": embedding,
+            "metadata": row_metadata,
+            "embedding": embedding or None,
         }
-        supabase.table("patient_documents").insert(row).execute()
+        res = supabase.table("patient_documents").insert(row).execute()
+        if res.data and embedding:
+            vector_index.add(user_id, clean_member_id, {**row, "id": res.data[0].get("id")})
     except Exception:
         # Never block core flows if RAG insert fails.
         return
@@ -9,6 +9,7 @@ import fitz
 
 logger = logging.getLogger(__name__)
 
+from app.metrics import pdf_parse_duration_seconds
 from app.supabase_client import get_supabase_client
 
 
@@ -52,11 +53,12 @@ def get_report_full_text(report_row: dict) -> str:
         return ""
 
     try:
-        doc = fitz.open(stream=raw, filetype="pdf")
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
+        with pdf_parse_duration_seconds.time(source="stored_report"):
+            doc = fitz.open(stream=raw, filetype="pdf")
+            text = ""
+            for page in doc:
+                text += page.get_text()
+            doc.close()
         return text[:50000]
     except Exception as e:
         logger.warning("PDF text extraction error: %s", e)
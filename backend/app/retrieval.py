@@ -0,0 +1,104 @@
+"""
+Hybrid document retrieval for chat RAG.
+
+Two rankings of the user's patient_documents are fetched at the same time:
+dense (query embedding through vector_index) and keyword (Postgres full-text
+search, search_patient_documents_text), which catches exact medicine names
+and lab values that embeddings blur. The rankings are merged with reciprocal
+rank fusion: each document scores sum(1 / (RAG_RRF_K + rank)) over the lists
+it appears in, so no score calibration between the two is needed. With
+RAG_RERANK the fused candidates are re-ordered by how many of the query's
+terms (numbers count double) they contain. Either leg failing just leaves
+the other's results.
+"""
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.llm_gateway import llm_gateway
+from app.supabase_client import supabase
+from app import tracing
+from app.vector_index import vector_index
+
+logger = logging.getLogger(__name__)
+
+# Keyword searches run here while the calling thread embeds and runs the vector search
+_keyword_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-keyword")
+
+_TERM = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_STOP_WORDS = frozenset(
+    "a an and are as at be by do does for from had has have how i in is it its me my of on or "
+    "should the their there this to was what when where which who why will with you your".split()
+)
+_RERANK_WEIGHT = 0.05  # coverage 1.0 is worth about three first places in RRF terms (1/61 each)
+
+
+def retrieve_documents(user_id: str, member_id: Optional[str], query: str) -> List[Dict[str, Any]]:
+    """Top RAG_MATCH_COUNT documents for query, best first. Never raises."""
+    k = settings.rag_match_count
+    if not settings.rag_hybrid:
+        return _dense(user_id, member_id, query, k)
+
+    candidates = max(k, settings.rag_candidate_count)
+    keyword = _keyword_pool.submit(tracing.in_current_context(_keyword), user_id, member_id, query, candidates)
+    dense = _dense(user_id, member_id, query, candidates)
+    try:
+        lexical = keyword.result()
+    except Exception:
+        lexical = []
+
+    fused = reciprocal_rank_fusion([dense, lexical], settings.rag_rrf_k)
+    if settings.rag_rerank:
+        fused = rerank(query, fused)
+    return fused[:k]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], rrf_k: int) -> List[Dict[str, Any]]:
+    """Merge ranked lists by sum(1 / (rrf_k + rank)); each document keeps its first-seen fields."""
+    docs: Dict[Any, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = doc.get("id") or doc.get("content")
+            if key not in docs:
+                docs[key] = {**doc, "score": 0.0}
+            docs[key]["score"] += 1.0 / (rrf_k + rank)
+    return sorted(docs.values(), key=lambda d: d["score"], reverse=True)
+
+
+def rerank(query: str, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Re-order by fused score plus the share of query terms each document contains."""
+    terms = _terms(query)
+    if not terms:
+        return docs
+    weights = {t: 2.0 if t[0].isdigit() else 1.0 for t in terms}
+    total = sum(weights.values())
+    for doc in docs:
+        present = _terms(doc.get("content") or "")
+        coverage = sum(w for t, w in weights.items() if t in present) / total
+        doc["score"] = doc.get("score", 0.0) + _RERANK_WEIGHT * coverage
+    return sorted(docs, key=lambda d: d["score"], reverse=True)
+
+
+def _terms(text: str) -> set:
+    return {t for t in _TERM.findall(text.lower()) if t not in _STOP_WORDS}
+
+
+def _dense(user_id: str, member_id: Optional[str], query: str, k: int) -> List[Dict[str, Any]]:
+    with tracing.span("rag.dense"):
+        embedding = llm_gateway.ollama_embed(query)
+        if not embedding:
+            return []
+        return vector_index.search(user_id, member_id, embedding, k)
+
+
+def _keyword(user_id: str, member_id: Optional[str], query: str, k: int) -> List[Dict[str, Any]]:
+    try:
+        with tracing.span("rag.keyword"):
+            payload = {"query_text": query, "match_count": k, "user_id": user_id, "member_id": member_id}
+            res = supabase.rpc("search_patient_documents_text", payload).execute()
+        return res.data or []
+    except Exception as e:
+        logger.debug("Keyword document search failed: %s", e)
+        return []
@@ -1,7 +1,8 @@
+import logging
 from fastapi import APIRouter, Header, BackgroundTasks, Body, Depends
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import requests
 import json
 from datetime import datetime
@@ -10,38 +11,33 @@ from app.config import settings
 from app.supabase_client import supabase
 from app.supabase_client import get_supabase_client
 from app.controllers.auth_controller import get_current_user
-from app.agent import HealthDataAgent, AgentState
+from app.agent import DEFAULT_MAX_ITERATIONS, HealthDataAgent, AgentState
+from app.agent_registry import agent_registry
+from app.agent_queue import AgentTurn, agent_work_queue
+from app.agent_jobs import get_agent_job_store
+from app.agent_tasks import process_agent_turn
+from app.chat_history import chat_history_store
+from app.llm_gateway import LLMUnavailableError, llm_gateway
+from app.metrics import chat_prompt_build_duration_seconds
+from app import tracing
+from app.stream_stats import STREAM_STATS_PREFIX, StreamStats
+from app.retrieval import retrieve_documents
+from app.prompt_builder import PromptBuilder, PromptStats, format_row, format_rows, truncate_to_tokens
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class ChatRequest(BaseModel):
     message: str
     member_id: Optional[str] = None
+    conversation_id: Optional[str] = None
     conversation_history: Optional[List[Dict[str, Any]]] = None
     enable_agent: bool = True
-
-chat_history = [
-    {
-        "role": "system",
-        "content": (
-            "You are MediSaathi, a responsible medical AI assistant. "
-            "Provide general medical information only. "
-            "Do not diagnose or prescribe. "
-            "Encourage consulting healthcare professionals. "
-            "If the user mentions medications or measurements, acknowledge that the system can automatically save them "
-            "and politely ask for missing details (dosage, frequency, start date) instead of asking the user to save manually."
-        )
-    }
-]
-
-# In-memory agent instances per user
-_agent_instances: Dict[str, HealthDataAgent] = {}
+    include_stats: bool = False  # end the stream with a STREAM_STATS_PREFIX + JSON timing line
 
 
 def get_or_create_agent(user_id: str) -> HealthDataAgent:
-    if user_id not in _agent_instances:
-        _agent_instances[user_id] = HealthDataAgent(user_id=user_id)
-    return _agent_instances[user_id]
+    return agent_registry.get_or_create(user_id)
 
 def _get_optional_user(authorization: Optional[str]) -> Optional[Any]:
     if not authorization:
@@ -56,121 +52,117 @@ def _get_optional_user(authorization: Optional[str]) -> Optional[Any]:
     return None
 
 
-def _ollama_embed(text: str) -> Optional[List[float]]:
-    try:
-        r = requests.post(
-            f"{settings.ollama_base_url}/api/embeddings",
-            json={"model": settings.ollama_embed_model, "prompt": text},
-            timeout=30,
-        )
-        r.raise_for_status()
-        data = r.json()
-        return data.get("embedding")
-    except Exception:
-        return None
+def _match_documents(user_id: str, member_id: Optional[str], query: str) -> List[Dict[str, Any]]:
+    return retrieve_documents(user_id, member_id, query)
 
 
-def _match_documents(user_id: str, member_id: Optional[str], query: str) -> List[Dict[str, Any]]:
-    embedding = _ollama_embed(query)
-    if not embedding:
-        return []
-    try:
-        payload = {
-            "query_embedding": embedding,
-            "match_count": 4,
-            "user_id": user_id,
-            "member_id": member_id,
-        }
-        res = supabase.rpc("match_patient_documents", payload).execute()
-        return res.data or []
-    except Exception:
-        return []
+# Compact projections: only the fields the model needs, not whole rows with ids/timestamps
+PROFILE_FIELDS = ("full_name", "age", "gender", "health_profile")
+MEMBER_FIELDS = ("name", "relationship")
+MEDICINE_FIELDS = ("name", "dosage", "frequency")
+RECORD_FIELDS = ("metric", "value", "unit", "date")
 
+PROMPT_HEADER = "\n".join([
+    "You are MediSaathi, a responsible medical AI assistant.",
+    "Provide general medical information only.",
+    "Do not diagnose or prescribe.",
+    "Encourage consulting healthcare professionals.",
+])
 
-def _format_patient_context(user: Any, member_id: Optional[str]) -> str:
+
+def _format_patient_context(user: Any, member_id: Optional[str]) -> Dict[str, str]:
+    """Patient context as compact text sections: profile, medicines, records."""
     if not user:
-        return ""
+        return {}
 
-    context_parts: List[str] = []
+    sections: Dict[str, str] = {}
 
     if member_id and member_id != "me":
         try:
             member = (
                 supabase.table("members")
-                .select("*")
+                .select(", ".join(MEMBER_FIELDS))
                 .eq("id", member_id)
                 .eq("user_id", user.id)
                 .maybe_single()
                 .execute()
             )
             if member and member.data:
-                context_parts.append(f"Member profile: {member.data}")
+                sections["profile"] = "Member: " + format_row(member.data, MEMBER_FIELDS)
         except Exception:
             pass
     else:
         try:
             profile = (
                 supabase.table("profiles")
-                .select("*")
+                .select(", ".join(PROFILE_FIELDS))
                 .eq("user_id", user.id)
                 .maybe_single()
                 .execute()
             )
             if profile and profile.data:
-                context_parts.append(f"User profile: {profile.data}")
+                sections["profile"] = "User: " + format_row(profile.data, PROFILE_FIELDS)
         except Exception:
             pass
 
-    meds_query = supabase.table("medicines").select("*").eq("user_id", user.id)
+    meds_query = supabase.table("medicines").select(", ".join(MEDICINE_FIELDS)).eq("user_id", user.id)
     if member_id and member_id != "me":
         meds_query = meds_query.eq("member_id", member_id)
     else:
         meds_query = meds_query.is_("member_id", "null")
     meds = meds_query.limit(25).execute()
     if meds.data:
-        context_parts.append(f"Medicines: {meds.data}")
+        sections["medicines"] = format_rows(meds.data, MEDICINE_FIELDS)
 
     records = (
         supabase.table("health_records")
-        .select("*")
+        .select(", ".join(RECORD_FIELDS))
         .eq("user_id", user.id)
         .order("created_at", desc=True)
         .limit(20)
         .execute()
     )
     if records.data:
-        context_parts.append(f"Recent health records: {records.data}")
+        sections["records"] = format_rows(records.data, RECORD_FIELDS)
 
-    return "\n".join(context_parts)
+    return sections
 
 
-def _build_prompt(user: Any, member_id: Optional[str], question: str) -> str:
-    context = _format_patient_context(user, member_id)
+def _build_prompt(
+    user: Any,
+    member_id: Optional[str],
+    question: str,
+    history: Optional[List[Dict[str, str]]] = None,
+) -> Tuple[str, PromptStats]:
+    with tracing.span("chat.context"):
+        context = _format_patient_context(user, member_id)
     docs = []
     if user:
-        docs = _match_documents(user.id, member_id if member_id != "me" else None, question)
+        with tracing.span("rag.retrieve"):
+            docs = _match_documents(user.id, member_id if member_id != "me" else None, question)
     doc_snippets = []
     for d in docs:
         content = d.get("content") or d.get("chunk") or ""
         if content:
             doc_snippets.append(content)
 
-    doc_block = "\n".join(doc_snippets[:4])
-
-    prompt_parts = [
-        "You are MediSaathi, a responsible medical AI assistant.",
-        "Provide general medical information only.",
-        "Do not diagnose or prescribe.",
-        "Encourage consulting healthcare professionals.",
-    ]
-
-    if context:
-        prompt_parts.append(f"\nPatient context:\n{context}")
-    if doc_block:
-        prompt_parts.append(f"\nRetrieved documents:\n{doc_block}")
-
-    prompt_parts.append(f"\nUser question: {question}\nAnswer:")
-    return "\n".join(prompt_parts)
+    turns = "\n".join(f"{t['role'].capitalize()}: {t['content']}" for t in history or [])
+
+    # Lower priority number = trimmed last when the prompt is over budget
+    builder = PromptBuilder(settings.chat_prompt_token_budget)
+    builder.add("header", PROMPT_HEADER, required=True)
+    builder.add("profile", context.get("profile", ""), title="Patient profile", budget=150, priority=20)
+    builder.add("medicines", context.get("medicines", ""), title="Medicines", budget=300, priority=30)
+    builder.add("records", context.get("records", ""), title="Recent health records", budget=300, priority=40)
+    builder.add("documents", "\n".join(doc_snippets[: settings.rag_match_count]), title="Retrieved documents", budget=800, priority=50)
+    builder.add("history", turns, title="Conversation so far", budget=600, priority=60, keep="tail")
+    builder.add(
+        "question",
+        f"\nUser question: {truncate_to_tokens(question, 500)}\nAnswer:",
+        required=True,
+    )
+    prompt = builder.build()
+    return prompt, builder.stats
 
 
 @router.post("/chat")
@@ -180,43 +172,50 @@ def chat(
     authorization: Optional[str] = Header(None),
 ):
     user = _get_optional_user(authorization)
-    chat_history.append({
-        "role": "user",
-        "content": req.message
-    })
+    history: List[Dict[str, str]] = []
+    if user:
+        history = chat_history_store.recent(
+            user.id,
+            req.conversation_id,
+            token_budget=settings.chat_history_token_budget,
+        )
+        chat_history_store.append(user.id, req.conversation_id, "user", req.message)
 
-    response_holder: Dict[str, str] = {"text": ""}
+    response_holder: Dict[str, Any] = {"text": ""}
+    # The body is generated after this handler returns, so the request's span is passed in
+    request_span = tracing.current_context()
 
     def stream():
         full_response: List[str] = []
+        completed = False
+        stats: Optional[StreamStats] = None
         try:
             # Auto-select model if configured model isn't available locally
             model = settings.ollama_chat_model
-            try:
-                res = requests.get(f"{settings.ollama_base_url}/api/tags", timeout=2)
-                if res.status_code == 200:
-                    models = [m["name"] for m in res.json().get("models", [])]
-                    if not any(model in m for m in models):
-                        if any("mistral" in m for m in models):
-                            model = "mistral"
-                        elif any("llava" in m for m in models):
-                            model = "llava"
-            except Exception:
-                pass
-
-            prompt = _build_prompt(user, req.member_id, req.message)
-
-            with requests.post(
-                f"{settings.ollama_base_url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": True
-                },
-                stream=True,
-                timeout=120
+            models = llm_gateway.ollama_models(timeout=2)
+            if models and not any(model in m for m in models):
+                if any("mistral" in m for m in models):
+                    model = "mistral"
+                elif any("llava" in m for m in models):
+                    model = "llava"
+            stats = StreamStats(model)
+
+            with chat_prompt_build_duration_seconds.time():
+                prompt, prompt_stats = _build_prompt(user, req.member_id, req.message, history)
+            response_holder["prompt_tokens"] = prompt_stats.total_tokens
+            stats.prompt_tokens_estimate = prompt_stats.total_tokens
+            logger.info(
+                "chat prompt tokens=%d sections=%s truncated=%s",
+                prompt_stats.total_tokens,
+                prompt_stats.sections,
+                prompt_stats.truncated,
+            )
+
+            with llm_gateway.ollama_stream(
+                "/api/generate",
+                {"model": model, "prompt": prompt, "stream": True},
+                timeout=120,
             ) as r:
-                r.raise_for_status()
                 for line in r.iter_lines():
                     if not line:
                         continue
@@ -231,11 +230,20 @@ def chat(
                         break
                     if "response" in data:
                         chunk = data["response"]
+                        if chunk:
+                            stats.chunk()
                         full_response.append(chunk)
                         yield chunk
                     if data.get("done"):
+                        completed = True
+                        stats.done(data)
+                        llm_gateway.record_tokens("ollama", data.get("prompt_eval_count"), data.get("eval_count"))
                         break
-        except requests.exceptions.ConnectError:
+        except LLMUnavailableError:
+            msg = "The AI model is busy or temporarily unavailable. Please try again shortly."
+            full_response.append(msg)
+            yield msg
+        except requests.exceptions.ConnectionError:
             msg = "Cannot reach the AI model (Ollama). Is Ollama running?"
             full_response.append(msg)
             yield msg
@@ -253,8 +261,21 @@ def chat(
             yield msg
         finally:
             response_holder["text"] = "".join(full_response)
-
-    response = StreamingResponse(stream(), media_type="text/plain")
+            if user and completed and response_holder["text"]:
+                chat_history_store.append(user.id, req.conversation_id, "assistant", response_holder["text"])
+            if stats is not None and stats.chunks:
+                response_holder["stream_stats"] = stats.observe()
+                logger.info("chat stream %s", response_holder["stream_stats"])
+        if req.include_stats and "stream_stats" in response_holder:
+            yield STREAM_STATS_PREFIX + json.dumps(response_holder["stream_stats"])
+
+    def traced_stream():
+        with tracing.span("chat.stream", parent=request_span) as span:
+            yield from stream()
+            for key, value in response_holder.get("stream_stats", {}).items():
+                span.set_attribute(f"chat.{key}", value)
+
+    response = StreamingResponse(traced_stream(), media_type="text/plain")
 
     # Trigger agent after streaming completes
     if req.enable_agent and user and background_tasks is not None:
@@ -265,6 +286,7 @@ def chat(
             assistant_response_holder=response_holder,
             member_id=req.member_id,
             conversation_history=req.conversation_history or [],
+            traceparent=request_span.traceparent if request_span else None,
         )
         response.background = background_tasks
 
@@ -280,84 +302,60 @@ def chat_stream(
     return chat(req, background_tasks, authorization)
 
 
-def _store_pending_clarifications(
-    *,
-    user_id: str,
-    member_id: Optional[str],
-    clarifications: List[Dict[str, Any]],
-) -> None:
-    if not clarifications:
-        return
-    supabase_sr = get_supabase_client(use_service_role=True)
-    try:
-        existing = (
-            supabase_sr.table("agent_clarifications")
-            .select("question, context")
-            .eq("user_id", user_id)
-            .eq("status", "pending")
-            .execute()
-        )
-        existing_keys = {(c.get("question"), c.get("context")) for c in (existing.data or [])}
-    except Exception:
-        existing_keys = set()
-
-    rows = []
-    for clarification in clarifications:
-        key = (clarification.get("question"), clarification.get("context"))
-        if key in existing_keys:
-            continue
-        rows.append(
-            {
-                "user_id": user_id,
-                "member_id": member_id,
-                "question": clarification.get("question"),
-                "context": clarification.get("context"),
-                "status": clarification.get("status", "pending"),
-                "priority": clarification.get("priority", 2),
-                "related_item_type": clarification.get("related_item_type"),
-                "related_item_data": clarification.get("related_item_data"),
-                "created_at": datetime.utcnow().isoformat(),
-            }
-        )
-
-    if rows:
-        try:
-            supabase_sr.table("agent_clarifications").insert(rows).execute()
-        except Exception:
-            pass
-
-
 def run_agent_autonomously(
     *,
     user_id: str,
     user_message: str,
-    assistant_response_holder: Dict[str, str],
+    assistant_response_holder: Dict[str, Any],
     member_id: Optional[str],
     conversation_history: List[Dict[str, Any]],
+    traceparent: Optional[str] = None,
 ) -> None:
-    try:
-        agent = get_or_create_agent(user_id)
-        result = agent.process_conversation_turn(
-            user_message=user_message,
-            assistant_response=assistant_response_holder.get("text", ""),
-            member_id=member_id,
-            conversation_history=conversation_history,
-        )
-        if result.get("success") and result.get("clarifications_needed"):
-            _store_pending_clarifications(
-                user_id=user_id,
-                member_id=member_id,
-                clarifications=result.get("clarifications_needed", []),
-            )
-    except Exception:
+    """Background task after a chat response: enqueue the turn and return at once."""
+    turn = AgentTurn(
+        user_id=user_id,
+        user_message=user_message,
+        assistant_response=assistant_response_holder.get("text", ""),
+        member_id=member_id,
+        conversation_history=list(conversation_history or []),
+        traceparent=traceparent,
+    )
+    if _external_worker():
+        try:
+            get_agent_job_store().enqueue(turn)
+        except Exception:
+            logger.exception("Failed to enqueue agent job for user %s", user_id)
         return
+    agent_work_queue.submit(turn, process_agent_turn)
+
+
+def _external_worker() -> bool:
+    return settings.agent_worker_mode.lower() == "external"
+
+
+def _queue_status(user_id: str) -> Dict[str, Any]:
+    if _external_worker():
+        try:
+            return {"mode": "external", **get_agent_job_store().status(user_id)}
+        except Exception as e:
+            logger.warning("Agent job status unavailable: %s", e)
+            return {"mode": "external", "running": False, "pending": 0, "error": "unavailable"}
+    return {"mode": "inline", **agent_work_queue.status(user_id)}
 
 
 @router.get("/chat/agent-status")
 async def get_agent_status(user=Depends(get_current_user)):
-    agent = get_or_create_agent(user.id)
+    queue_status = _queue_status(user.id)
+    if queue_status["mode"] == "external":
+        # The agent runs in a worker process; this process's agent never moves, so report the job store
+        return _external_agent_status(queue_status)
+    # Polling must not refresh LRU recency or rehydrate an evicted agent; no live agent means idle
+    agent = agent_registry.get(user.id)
+    if agent is None:
+        return _idle_agent_status(queue_status)
     return {
-        "agent_active": agent.current_state not in (AgentState.IDLE, AgentState.COMPLETED),
+        "agent_active": queue_status["running"]
+        or agent.current_state not in (AgentState.IDLE, AgentState.COMPLETED),
         "current_state": agent.current_state.value,
         "current_iteration": agent.current_iteration,
         "max_iterations": agent.max_iterations,
@@ -367,6 +365,45 @@ async def get_agent_status(user=Depends(get_current_user)):
         },
         "last_action": agent.execution_trace[-1] if agent.execution_trace else None,
         "last_saved": agent.last_saved,
+        "queue": queue_status,
+    }
+
+
+def _idle_agent_status(queue_status: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "agent_active": queue_status["running"],
+        "current_state": (AgentState.THINKING if queue_status["running"] else AgentState.IDLE).value,
+        "current_iteration": 0,
+        "max_iterations": DEFAULT_MAX_ITERATIONS,
+        "pending_clarifications": [],  # see /chat/pending-clarifications
+        "extracted_data_summary": {},
+        "last_action": None,
+        "last_saved": {"count": 0, "items": [], "timestamp": None},
+        "queue": queue_status,
+    }
+
+
+def _external_agent_status(queue_status: Dict[str, Any]) -> Dict[str, Any]:
+    last_job = queue_status.get("last_job") or {}
+    result = last_job.get("result") or {}
+    if queue_status["running"]:
+        state = AgentState.THINKING
+    elif last_job.get("status") == "failed":
+        state = AgentState.ERROR
+    elif last_job:
+        state = AgentState.COMPLETED
+    else:
+        state = AgentState.IDLE
+    return {
+        "agent_active": queue_status["running"],
+        "current_state": state.value,
+        "current_iteration": 0,
+        "max_iterations": DEFAULT_MAX_ITERATIONS,
+        "pending_clarifications": [],  # see /chat/pending-clarifications
+        "extracted_data_summary": {},
+        "last_action": None,
+        "last_saved": result.get("last_saved") or {"count": 0, "items": [], "timestamp": None},
+        "queue": queue_status,
     }
 
 
@@ -425,8 +462,10 @@ async def get_agent_execution_log(
     except Exception:
         pass
 
-    # Fallback to in-memory trace if DB logging isn't available yet
-    agent = get_or_create_agent(user.id)
+    # Fallback to in-memory trace if DB logging isn't available yet (live agents only)
+    agent = agent_registry.get(user.id)
+    if agent is None:
+        return {"log_entries": [], "total_entries": 0}
     fallback = [
         {
             "id": f"inmem-{idx}",
@@ -443,8 +482,8 @@ async def get_agent_execution_log(
 
 @router.post("/chat/reset-agent")
 async def reset_agent(user=Depends(get_current_user)):
-    if user.id in _agent_instances:
-        _agent_instances[user.id].reset(full_reset=True)
+    agent_registry.reset(user.id)
+    chat_history_store.clear(user.id)
     supabase_sr = get_supabase_client(use_service_role=True)
     supabase_sr.table("agent_clarifications") \
         .update({"status": "dismissed"}) \
@@ -9,6 +9,7 @@ from datetime import datetime
 
 from app.supabase_client import supabase
 from app.controllers.auth_controller import get_current_user
+from app.summarizer import summarize_text, summarizer_available
 
 router = APIRouter(prefix="/doctors", tags=["Doctors"])
 
@@ -353,22 +354,11 @@ async def get_report_summary(
 
 
 def has_report_summary_llm():
-    try:
-        from app.config import settings
-        return bool(getattr(settings, "openrouter_api_key", None))
-    except Exception:
-        return False
+    return summarizer_available()
 
 
 async def generate_summary_llm(text: str) -> str:
     try:
-        from openai import OpenAI
-        from app.config import settings
-        client = OpenAI(base_url="https://openrouter.ai/api/v1", api_key=settings.openrouter_api_key or "")
-        completion = client.chat.completions.create(
-            model="google/gemini-2.0-flash-001",
-            messages=[{"role": "user", "content": f"Summarize the following medical text concisely:\n\n{text}"}],
-        )
-        return completion.choices[0].message.content or "Summary generation failed."
+        return await summarize_text(text) or "Summary generation failed."
     except Exception as e:
         return f"Summary generation failed: {e}"
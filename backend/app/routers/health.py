@@ -8,6 +8,12 @@ from fastapi import APIRouter, HTTPException
 
 from app.config import settings
 from app.supabase_client import supabase
+from app.agent_registry import agent_registry
+from app.agent_log_sink import agent_log_sink
+from app.agent_queue import agent_work_queue
+from app.llm_gateway import llm_gateway
+from app.summarizer import chunk_summary_cache
+from app.vector_index import vector_index
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -40,3 +46,25 @@ async def database_health_check():
             status_code=503,
             detail="Database unavailable",
         )
+
+
+@router.get("/health/agents")
+async def agent_registry_health():
+    """Chat agent gauges: live agents, evictions, rehydrations, work queue, log sink buffer."""
+    return {
+        **agent_registry.stats(),
+        "log_sink": agent_log_sink.stats(),
+        "work_queue": agent_work_queue.stats(),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+@router.get("/health/llm")
+async def llm_gateway_health():
+    """LLM gateway per provider (calls, errors, retries, latency, tokens, circuit), summary cache and RAG index."""
+    return {
+        "providers": llm_gateway.stats(),
+        "summary_cache": chunk_summary_cache.stats(),
+        "rag_index": vector_index.stats(),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
@@ -9,16 +9,13 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from PIL import Image
-import google.generativeai as genai
 
 from app.config import settings
+from app.llm_gateway import llm_gateway
 from app.supabase_client import supabase
 from app.controllers.auth_controller import get_current_user
 from app.rag_store import store_patient_document
 
-if (settings.gemini_api_key or "").strip():
-    genai.configure(api_key=settings.gemini_api_key)
-
 logger = logging.getLogger(__name__)
 
 # List of models to try in order of preference (Lite models first for better quota)
@@ -175,8 +172,8 @@ IMPORTANT: Return ONLY the JSON array. No other text. If the image is not a pres
 
     for model_name in FALLBACK_MODELS:
         try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(
+            response = llm_gateway.gemini_generate(
+                model_name,
                 [prompt, image],
                 safety_settings=safety_settings,
             )
@@ -571,10 +568,9 @@ async def get_medicine_info(
     for model_name in FALLBACK_MODELS:
         try:
             logger.debug("Attempting with model: %s", model_name)
-            current_model = genai.GenerativeModel(model_name)
-            
             # Relax safety settings for medical context
-            response = current_model.generate_content(
+            response = llm_gateway.gemini_generate(
+                model_name,
                 prompt,
                 safety_settings=[
                     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
@@ -4,6 +4,7 @@ from typing import Optional, Dict
 from datetime import datetime
 from app.supabase_client import supabase
 from app.controllers.auth_controller import get_current_user
+from app.vector_index import vector_index
 
 router = APIRouter()
 
@@ -106,6 +107,8 @@ async def delete_member(member_id: str, current_user=Depends(get_current_user)):
             .execute()
         if not res.data:
             raise HTTPException(status_code=404, detail="Member not found")
+        # patient_documents.member_id is SET NULL: the member's documents now belong to the user
+        vector_index.invalidate(current_user.id)
         return {"success": True, "deleted": res.data[0]}
     except Exception as e:
         # If invalid ObjectId, return 404
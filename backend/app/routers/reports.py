@@ -11,10 +11,13 @@ from typing import Optional
 import uuid
 import base64
 import fitz
-from openai import OpenAI
 
 from app.supabase_client import supabase, get_supabase_client
 from app.config import settings
+from app.llm_gateway import llm_gateway
+from app.metrics import pdf_parse_duration_seconds
+from app.summarizer import summarize_text, summarizer_available
+from app.text_chunking import iter_chunks
 from app.controllers.auth_controller import get_current_user
 from app.report_encryption import encrypt_pdf
 from app.report_content import get_report_full_text, get_report_raw_bytes
@@ -22,12 +25,7 @@ from app.report_content import get_report_full_text, get_report_raw_bytes
 router = APIRouter(prefix="/reports", tags=["Reports"])
 logger = logging.getLogger(__name__)
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=settings.openrouter_api_key or "sk-or-v1-missing",
-)
 EMBEDDING_MODEL = "text-embedding-3-small"
-CHAT_MODEL = "google/gemini-2.0-flash-001"
 
 
 class QueryRequest(BaseModel):
@@ -37,39 +35,18 @@ class QueryRequest(BaseModel):
 
 def get_embedding(text: str):
     try:
-        response = client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=text,
-            dimensions=768,
-        )
-        return response.data[0].embedding
+        return llm_gateway.openrouter_embed(text, model=EMBEDDING_MODEL, dimensions=768)
     except Exception as e:
         logger.warning("Embedding failed: %s", e)
         raise e
 
 
-def chunk_text(text: str, size: int = 500, overlap: int = 100):
-    words = text.split()
-    chunks = []
-    i = 0
-    while i < len(words):
-        chunk = words[i : i + size]
-        chunks.append(" ".join(chunk))
-        i += size - overlap
-    return chunks
-
-
-def _generate_summary_llm(full_text: str) -> str:
+async def _generate_summary_llm(full_text: str) -> str:
     """Generate summary from full text (on-demand, not stored)."""
-    if not full_text or not (settings.openrouter_api_key or "").strip():
+    if not full_text or not summarizer_available():
         return "Summary not available."
     try:
-        prompt = f"Summarize the following medical text concisely:\n\n{full_text[:10000]}"
-        completion = client.chat.completions.create(
-            model=CHAT_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-        )
-        return (completion.choices[0].message.content or "").strip() or "Summary not available."
+        return await summarize_text(full_text) or "Summary not available."
     except Exception as e:
         logger.warning("Summary generation error: %s", e)
         return "Summary generation failed."
@@ -115,20 +92,30 @@ async def upload_report(
 
     # Extract text (from original content for embeddings)
     try:
-        doc = fitz.open(stream=content, filetype="pdf")
-        full_text = ""
-        for page in doc:
-            full_text += page.get_text()
-        doc.close()
+        with pdf_parse_duration_seconds.time(source="upload"):
+            doc = fitz.open(stream=content, filetype="pdf")
+            pages = [page.get_text() for page in doc]
+            doc.close()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to parse PDF: {str(e)}")
 
-    chunks = chunk_text(full_text)
+    chunks = iter_chunks(
+        pages,
+        target_tokens=settings.rag_chunk_target_tokens,
+        max_tokens=settings.rag_chunk_max_tokens,
+        overlap_tokens=settings.rag_chunk_overlap_tokens,
+        min_tokens=settings.rag_chunk_min_tokens,
+    )
     embeddings_data = []
+    chunk_count = 0
     for chunk in chunks:
+        chunk_count += 1
         try:
             embedding = get_embedding(chunk)
             embeddings_data.append({
+                "user_id": user.id,
+                "member_id": member_id,
+                "report_id": report_id,
                 "filename": file.filename,
                 "content": chunk,
                 "embedding": embedding,
@@ -160,7 +147,7 @@ async def upload_report(
 
     return {
         "filename": file.filename,
-        "chunks": len(chunks),
+        "chunks": chunk_count,
         "message": "Report stored securely. Use view endpoint to generate summary on demand.",
         "storage_path": path,
         "report_id": report_id,
@@ -222,7 +209,7 @@ async def view_report(report_id: str, user=Depends(get_current_user)):
     summary = (row.get("summary") or "").strip()
     full_text = get_report_full_text(row)
     if not summary and full_text:
-        summary = _generate_summary_llm(full_text)
+        summary = await _generate_summary_llm(full_text)
 
     if not summary:
         summary = "Summary not available."
@@ -262,14 +249,29 @@ async def query_report(
     member_id: Optional[str] = Query(None),
     user=Depends(get_current_user),
 ):
+    if member_id:
+        member_check = (
+            supabase.table("members")
+            .select("id")
+            .eq("id", member_id)
+            .eq("user_id", user.id)
+            .execute()
+        )
+        if not member_check.data:
+            raise HTTPException(status_code=404, detail="Member not found")
+
     try:
         query_embedding = get_embedding(req.query)
         response = supabase.rpc(
-            "match_documents",
+            "match_document_chunks",
             {
                 "query_embedding": query_embedding,
-                "match_threshold": 0.4,
                 "match_count": req.topK,
+                "match_threshold": 0.4,
+                "user_id": user.id,
+                "member_id": member_id,
+                "ef_search": settings.rag_ef_search,
+                "exact_scan_limit": settings.rag_exact_scan_limit,
             },
         ).execute()
         return {"results": response.data}
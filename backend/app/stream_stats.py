@@ -0,0 +1,98 @@
+"""
+Timing for one streamed chat reply: time to first token, gaps between
+chunks, and generation speed. Ollama's final `done` message carries its own
+counts and durations (eval_count / eval_duration for the reply,
+prompt_eval_* for reading the prompt, load_duration for loading the model);
+those are used when present, since a streamed chunk is not always one token.
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+from app.metrics import (
+    chat_inter_token_seconds,
+    chat_prompt_tokens,
+    chat_time_to_first_token_seconds,
+    chat_tokens_per_second,
+    chat_tokens_total,
+)
+
+# The last line of a stream when the client asked for stats (ChatRequest.include_stats)
+STREAM_STATS_PREFIX = "\n[[stats]]"
+
+_NS = 1e9
+
+
+class StreamStats:
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.started = time.perf_counter()
+        self.prompt_tokens_estimate = 0
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.chunks = 0
+        self.gaps: List[float] = []
+        self.ollama: Dict[str, Any] = {}
+
+    def chunk(self) -> None:
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.gaps.append(now - self.last_token_at)
+        self.last_token_at = now
+        self.chunks += 1
+
+    def done(self, message: Dict[str, Any]) -> None:
+        """Keep Ollama's counters from the final `done` message."""
+        self.ollama = {
+            k: message.get(k)
+            for k in ("eval_count", "eval_duration", "prompt_eval_count", "prompt_eval_duration", "load_duration", "total_duration")
+            if message.get(k) is not None
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        completion_tokens = self.ollama.get("eval_count", self.chunks)
+        if self.ollama.get("eval_duration"):
+            generation_seconds = self.ollama["eval_duration"] / _NS
+        elif self.first_token_at is not None and self.last_token_at is not None:
+            generation_seconds = self.last_token_at - self.first_token_at
+        else:
+            generation_seconds = 0.0
+        gaps = sorted(self.gaps)
+        summary: Dict[str, Any] = {
+            "model": self.model,
+            "ttft_ms": _ms(self.first_token_at - self.started) if self.first_token_at is not None else None,
+            "total_ms": _ms((self.last_token_at or time.perf_counter()) - self.started),
+            "inter_token_ms_avg": _ms(sum(gaps) / len(gaps)) if gaps else None,
+            "inter_token_ms_p95": _ms(gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))]) if gaps else None,
+            "chunks": self.chunks,
+            "completion_tokens": completion_tokens,
+            "tokens_per_second": round(completion_tokens / generation_seconds, 1) if generation_seconds > 0 else None,
+            "prompt_tokens": self.ollama.get("prompt_eval_count"),
+            "prompt_tokens_estimate": self.prompt_tokens_estimate,
+        }
+        if "prompt_eval_duration" in self.ollama:
+            summary["prompt_eval_ms"] = _ms(self.ollama["prompt_eval_duration"] / _NS)
+        if "load_duration" in self.ollama:
+            summary["load_ms"] = _ms(self.ollama["load_duration"] / _NS)
+        return summary
+
+    def observe(self) -> Dict[str, Any]:
+        """Record the reply in /metrics; returns summary()."""
+        summary = self.summary()
+        if self.first_token_at is not None:
+            chat_time_to_first_token_seconds.observe(self.first_token_at - self.started, model=self.model)
+        for gap in self.gaps:
+            chat_inter_token_seconds.observe(gap, model=self.model)
+        if summary["tokens_per_second"] is not None:
+            chat_tokens_per_second.observe(summary["tokens_per_second"], model=self.model)
+        chat_tokens_total.inc(summary["completion_tokens"], model=self.model, kind="completion")
+        if summary["prompt_tokens"] is not None:
+            chat_tokens_total.inc(summary["prompt_tokens"], model=self.model, kind="prompt")
+        if self.prompt_tokens_estimate:
+            chat_prompt_tokens.observe(self.prompt_tokens_estimate)
+        return summary
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
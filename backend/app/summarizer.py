@@ -0,0 +1,161 @@
+"""
+On-demand summaries of medical report text (doctors and reports endpoints).
+Calls go through the LLM gateway's async OpenRouter client, so a summary
+request waits on the network without blocking the event loop.
+
+Text that fits in SUMMARY_MAX_INPUT_TOKENS is summarised in one call. Longer
+text is map-reduced: it is split with chunk_text, every chunk is summarised
+concurrently (the gateway caps how many run at once), and the partial
+summaries are combined; if they are still too long they are chunked and
+reduced again. Latency grows with the depth of that tree, not the page count,
+and nothing past page 3 is dropped. Chunk summaries are kept in an LRU cache
+keyed by content, so re-opening a report (or a second viewer) only pays for
+the final reduce.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.llm_gateway import llm_gateway
+from app.prompt_builder import estimate_tokens, truncate_to_tokens
+from app.text_chunking import chunk_text
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MODEL = "google/gemini-2.0-flash-001"
+SUMMARY_PROMPT = "Summarize the following medical text concisely:\n\n{text}"
+MAP_PROMPT = (
+    "This is part {part} of {total} of a medical report. Summarize it concisely, keeping every "
+    "diagnosis, test result with its value and unit, medication with its dose, and date:\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "These are summaries of consecutive parts of one medical report. Combine them into a single "
+    "concise summary, merging repeated findings and keeping values, doses and dates:\n\n{text}"
+)
+MAX_REDUCE_DEPTH = 3
+
+
+class ChunkSummaryCache:
+    """LRU of chunk summaries keyed by (model, prompt, chunk text) hash."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt: str) -> str:
+        return hashlib.sha256(f"{SUMMARY_MODEL}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+chunk_summary_cache = ChunkSummaryCache(settings.summary_cache_size)
+# Chunk summaries being generated right now, so concurrent requests for one report share them
+_in_flight: Dict[str, "asyncio.Future[str]"] = {}
+
+
+def summarizer_available() -> bool:
+    return bool((settings.openrouter_api_key or "").strip())
+
+
+async def summarize_text(text: str) -> str:
+    """Summary of text ("" if the model returned nothing). Raises on LLM errors."""
+    text = (text or "").strip()
+    if not text:
+        return ""
+    if estimate_tokens(text) <= settings.summary_max_input_tokens:
+        return await _complete(SUMMARY_PROMPT.format(text=text))
+    partials = await _map(text)
+    return await _reduce(partials, depth=1)
+
+
+async def _map(text: str) -> List[str]:
+    chunks = chunk_text(text, size=settings.summary_chunk_words, overlap=settings.summary_chunk_overlap_words)
+    total = len(chunks)
+    results = await asyncio.gather(
+        *[_cached_complete(MAP_PROMPT.format(part=i + 1, total=total, text=chunk)) for i, chunk in enumerate(chunks)],
+        return_exceptions=True,
+    )
+    partials = [r for r in results if isinstance(r, str) and r]
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        if not partials:
+            raise errors[0]
+        logger.warning("Summary: %d of %d chunks failed; summarising the rest", len(errors), total)
+    return partials
+
+
+async def _reduce(partials: List[str], depth: int) -> str:
+    combined = "\n\n".join(partials)
+    if len(partials) <= 1 and estimate_tokens(combined) <= settings.summary_max_input_tokens:
+        return combined
+    if estimate_tokens(combined) > settings.summary_max_input_tokens:
+        if depth >= MAX_REDUCE_DEPTH:
+            combined = truncate_to_tokens(combined, settings.summary_max_input_tokens)
+        else:
+            return await _reduce(await _map(combined), depth + 1)
+    return await _complete(REDUCE_PROMPT.format(text=combined))
+
+
+async def _cached_complete(prompt: str) -> str:
+    key = ChunkSummaryCache.key(prompt)
+    cached = chunk_summary_cache.get(key)
+    if cached is not None:
+        return cached
+    pending = _in_flight.get(key)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            return await _complete(prompt)  # the request we were sharing was cancelled
+    future: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        summary = await _complete(prompt)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved; waiters (if any) still get it
+        raise
+    finally:
+        _in_flight.pop(key, None)
+    if summary:
+        chunk_summary_cache.put(key, summary)
+    future.set_result(summary)
+    return summary
+
+
+async def _complete(prompt: str) -> str:
+    return await llm_gateway.openrouter_chat_async([{"role": "user", "content": prompt}], model=SUMMARY_MODEL)
@@ -1,13 +1,65 @@
 """Supabase client singleton for the app.
 This keeps Supabase initialization separate to avoid circular imports.
 Uses service_role key when set so backend can bypass RLS (anon key has auth.uid() = null).
+Clients are wrapped so every table query / RPC execute() is timed by table and
+operation (supabase_request_duration_seconds in /metrics, plus a trace span); everything else
+(auth, storage) passes through untouched.
 """
+from typing import Any
+
 from supabase import create_client, Client
 from app.config import settings
+from app import tracing
+from app.metrics import supabase_request_duration_seconds
+
+_OPERATIONS = {"select", "insert", "update", "upsert", "delete"}
+
+
+class _TimedQuery:
+    """A PostgREST request builder whose execute() is timed; chained calls stay wrapped."""
+
+    def __init__(self, builder: Any, table: str, operation: str) -> None:
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+
+    def execute(self) -> Any:
+        with tracing.span(f"db.{self._operation} {self._table}", **{"db.table": self._table}):
+            with supabase_request_duration_seconds.time(table=self._table, operation=self._operation):
+                return self._builder.execute()
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._builder, name)
+        operation = name if name in _OPERATIONS else self._operation
+        if not callable(attr):
+            return _TimedQuery(attr, self._table, operation) if hasattr(attr, "execute") else attr  # e.g. .not_
+
+        def chained(*args: Any, **kwargs: Any) -> Any:
+            result = attr(*args, **kwargs)
+            return _TimedQuery(result, self._table, operation) if hasattr(result, "execute") else result
+
+        return chained
+
+
+class _InstrumentedClient:
+    def __init__(self, client: Client) -> None:
+        self._client = client
+
+    def table(self, name: str) -> Any:
+        return _TimedQuery(self._client.table(name), name, "select")
+
+    from_ = table
+
+    def rpc(self, fn: str, params: Any = None, *args: Any, **kwargs: Any) -> Any:
+        return _TimedQuery(self._client.rpc(fn, params or {}, *args, **kwargs), fn, "rpc")
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
 
 # Prefer service_role key so inserts/updates from the API are not blocked by RLS
 _key = settings.supabase_service_role_key or settings.supabase_key
-supabase: Client = create_client(settings.supabase_url, _key)
+supabase: Client = _InstrumentedClient(create_client(settings.supabase_url, _key))
 
 
 def get_supabase_client(*, use_service_role: bool = False) -> Client:
@@ -20,4 +72,4 @@ def get_supabase_client(*, use_service_role: bool = False) -> Client:
         key = settings.supabase_service_role_key
     else:
         key = settings.supabase_key
-    return create_client(settings.supabase_url, key)
+    return _InstrumentedClient(create_client(settings.supabase_url, key))
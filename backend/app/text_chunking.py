@@ -0,0 +1,274 @@
+"""
+Splitting long document text into chunks (report embeddings and map-reduce
+summaries).
+
+chunk_text cuts fixed word windows. iter_chunks is the one used for report
+embeddings: it reads page by page and yields chunks as it goes, targeting an
+estimated token count and cutting at sentence, line and section boundaries.
+Table rows are never split, a small trailing chunk is folded into the one
+before it, and headers and footers repeated on every page, as well as
+near-identical chunks, are dropped so they are not embedded over and over.
+"""
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Set, Union
+
+from app.prompt_builder import CHARS_PER_TOKEN
+
+# Sentence ends: ., ! or ? then whitespace and an upper-case letter/digit/bracket,
+# except after common abbreviations ("Dr. Rao", "e.g. 5 mg")
+_SENTENCE_END = re.compile(
+    r"(?<!\bDr\.)(?<!\bMr\.)(?<!\bMs\.)(?<!\bMrs\.)(?<!\bvs\.)(?<!\bNo\.)(?<!\be\.g\.)(?<!\bi\.e\.)"
+    r"(?<=[.!?])\s+(?=[A-Z0-9(\[\"'])"
+)
+# Table-like rows: tabs, pipes, or two or more runs of 2+ spaces between cells
+_TABLE_ROW = re.compile(r"\t|\||\S {2,}\S.* {2,}\S")
+_DIGITS = re.compile(r"\d")
+# Page-number footers ("Page 3", "Page 3 of 10", "3 of 10"): the only edge lines with digits treated as boilerplate
+_PAGE_NUMBER = re.compile(r"^(page\s*\d+(\s*(of|/)\s*\d+)?|\d+\s+of\s+\d+)$", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+_WORD = re.compile(r"\w+")
+
+# Lines this close to the top or bottom of a page are header/footer candidates
+_EDGE_LINES = 3
+_EDGE_MAX_WORDS = 12
+_HEADING_MAX_WORDS = 8
+_SHINGLE = 3
+
+
+def chunk_text(text: str, size: int = 500, overlap: int = 100) -> List[str]:
+    """Windows of `size` words, each starting `size - overlap` words after the previous one."""
+    words = text.split()
+    step = max(1, size - overlap)
+    chunks = []
+    i = 0
+    while i < len(words):
+        chunk = words[i : i + size]
+        chunks.append(" ".join(chunk))
+        i += step
+    return chunks
+
+
+@dataclass
+class _Unit:
+    text: str
+    sep: str = " "  # joins this unit to the previous one in a chunk
+    section_start: bool = False
+
+    @property
+    def tokens(self) -> float:
+        # Fractional, so many short units add up to the estimate for the joined text
+        return (len(self.sep) + len(self.text)) / CHARS_PER_TOKEN
+
+
+@dataclass
+class _Chunk:
+    units: List[_Unit] = field(default_factory=list)
+    overlap: int = 0  # leading units carried over from the previous chunk
+    tokens: float = 0.0
+
+    def add(self, unit: _Unit) -> None:
+        self.units.append(unit)
+        self.tokens += unit.tokens
+
+    def text(self) -> str:
+        if not self.units:
+            return ""
+        parts = [self.units[0].text]
+        for unit in self.units[1:]:
+            parts.append(unit.sep)
+            parts.append(unit.text)
+        return "".join(parts).strip()
+
+
+def iter_chunks(
+    source: Union[str, Iterable[str]],
+    *,
+    target_tokens: int = 600,
+    max_tokens: int = 800,
+    overlap_tokens: int = 60,
+    min_tokens: int = 100,
+    dedupe_threshold: float = 0.9,
+) -> Iterator[str]:
+    """
+    Yield chunks of about target_tokens (never more than max_tokens unless a
+    single table row is longer) from a string or an iterable of page texts.
+    A string is split into pages on form feeds. Consecutive chunks share up to
+    overlap_tokens of trailing sentences/rows; a new section starts a new chunk
+    once the current one is at least 3/4 of the target. Chunks whose word-trigram
+    overlap with an earlier chunk is >= dedupe_threshold are skipped (1.0 = exact only).
+    """
+    pages = source.split("\f") if isinstance(source, str) else source
+    target_tokens = max(1, min(target_tokens, max_tokens))
+    dedupe = _Deduper(dedupe_threshold)
+
+    current = _Chunk()
+    held: Optional[_Chunk] = None  # the last finished chunk, kept back in case the tail is tiny
+
+    def finish(chunk: _Chunk) -> Iterator[str]:
+        nonlocal held
+        if held is not None:
+            text = held.text()
+            if text and not dedupe.seen(text):
+                yield text
+        held = chunk
+
+    for unit in _iter_units(pages, max_tokens):
+        boundary = unit.section_start and current.tokens >= max(min_tokens, target_tokens * 3 // 4)
+        if current.units and (current.tokens + unit.tokens > target_tokens or boundary):
+            if current.tokens > _overlap_tokens(current):
+                yield from finish(current)
+                current = _carry_over(current, 0 if unit.section_start else overlap_tokens)
+            else:
+                current = _Chunk()  # nothing new since the overlap; start fresh
+        current.add(unit)
+
+    if current.tokens > _overlap_tokens(current):
+        if held is not None and current.tokens - _overlap_tokens(current) < min_tokens:
+            # Fold a small tail (minus the overlap it shares) into the previous chunk
+            new_units = current.units[current.overlap :]
+            if held.tokens + sum(u.tokens for u in new_units) <= max_tokens:
+                for unit in new_units:
+                    held.add(unit)
+                current = _Chunk()
+        if current.units:
+            yield from finish(current)
+    if held is not None:
+        text = held.text()
+        if text and not dedupe.seen(text):
+            yield text
+
+
+def _overlap_tokens(chunk: _Chunk) -> float:
+    return sum(u.tokens for u in chunk.units[: chunk.overlap])
+
+
+def _carry_over(chunk: _Chunk, overlap_tokens: int) -> _Chunk:
+    """New chunk starting with the trailing units of chunk, up to overlap_tokens."""
+    carried: List[_Unit] = []
+    used = 0
+    for unit in reversed(chunk.units):
+        if used + unit.tokens > overlap_tokens:
+            break
+        carried.append(unit)
+        used += unit.tokens
+    carried.reverse()
+    nxt = _Chunk(overlap=len(carried))
+    for unit in carried:
+        nxt.add(unit)
+    return nxt
+
+
+def _iter_units(pages: Iterable[str], max_tokens: int) -> Iterator[_Unit]:
+    """Sentences, table rows and headings, in reading order, with page boilerplate removed."""
+    seen_edges: Set[str] = set()
+    for page in pages:
+        paragraph: List[str] = []
+        for line in _strip_page_boilerplate(page, seen_edges):
+            stripped = line.strip()
+            if not stripped:
+                yield from _paragraph_units(paragraph, max_tokens)
+                paragraph = []
+                continue
+            if _TABLE_ROW.search(stripped):
+                yield from _paragraph_units(paragraph, max_tokens)
+                paragraph = []
+                yield _Unit(_SPACES.sub(" ", stripped), sep="\n")
+                continue
+            if _is_heading(stripped):
+                yield from _paragraph_units(paragraph, max_tokens)
+                paragraph = []
+                yield _Unit(stripped, sep="\n\n", section_start=True)
+                continue
+            paragraph.append(stripped)
+        yield from _paragraph_units(paragraph, max_tokens)
+
+
+def _paragraph_units(lines: List[str], max_tokens: int) -> Iterator[_Unit]:
+    if not lines:
+        return
+    # PDF text breaks lines mid-sentence; rejoin the paragraph before splitting sentences
+    paragraph = _SPACES.sub(" ", " ".join(lines)).strip()
+    sep = "\n"
+    for sentence in _SENTENCE_END.split(paragraph):
+        for piece in _split_long(sentence, max_tokens):
+            yield _Unit(piece, sep=sep)
+            sep = " "
+
+
+def _split_long(sentence: str, max_tokens: int) -> Iterator[str]:
+    """A sentence longer than max_tokens is cut into word runs that fit."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(sentence) <= max_chars:
+        yield sentence
+        return
+    words: List[str] = []
+    used = 0
+    for word in sentence.split(" "):
+        cost = len(word) + 1
+        if words and used + cost > max_chars:
+            yield " ".join(words)
+            words, used = [], 0
+        words.append(word)
+        used += cost
+    if words:
+        yield " ".join(words)
+
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    if len(words) > _HEADING_MAX_WORDS:
+        return False
+    if line.endswith(":"):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 3 and all(c.isupper() for c in letters)
+
+
+def _strip_page_boilerplate(page: str, seen_edges: Set[str]) -> Iterator[str]:
+    """
+    Drop short lines near the top/bottom of a page that already appeared, word
+    for word, near the edge of an earlier page (letterheads, lab footers), and
+    page-number lines. Table rows and other lines with numbers are always kept:
+    "Hemoglobin 11.0" at the top of page 2 is a result, not a repeated header.
+    """
+    lines = page.splitlines()
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    edges = set(content[:_EDGE_LINES] + content[-_EDGE_LINES:])
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if i in edges and len(stripped.split()) <= _EDGE_MAX_WORDS:
+            if _PAGE_NUMBER.match(stripped):
+                continue
+            if not _TABLE_ROW.search(stripped) and not _DIGITS.search(stripped):
+                key = _SPACES.sub(" ", stripped.lower())
+                if key in seen_edges:
+                    continue
+                seen_edges.add(key)
+        yield line
+
+
+class _Deduper:
+    """Skips chunks that repeat an earlier one (exact, or by word-trigram Jaccard)."""
+
+    def __init__(self, threshold: float) -> None:
+        self.threshold = threshold
+        self._hashes: Set[str] = set()
+        self._shingles: List[Set[int]] = []
+
+    def seen(self, text: str) -> bool:
+        words = [w.lower() for w in _WORD.findall(text)]
+        digest = hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+        if digest in self._hashes:
+            return True
+        self._hashes.add(digest)
+        if self.threshold >= 1.0:
+            return False
+        shingles = {hash(tuple(words[i : i + _SHINGLE])) for i in range(max(1, len(words) - _SHINGLE + 1))}
+        for other in self._shingles:
+            union = len(shingles | other)
+            if union and len(shingles & other) / union >= self.threshold:
+                return True
+        self._shingles.append(shingles)
+        return False
@@ -0,0 +1,196 @@
+"""
+Lightweight request tracing with OpenTelemetry-compatible ids.
+
+span("name") opens a child of the current span (a contextvar), so nested
+work in the same thread or task needs no plumbing. Code that continues
+elsewhere passes the context along explicitly: the chat stream generator and
+the background agent turn take it from the request; executor jobs are run
+with in_current_context(). Trace ids follow W3C Trace Context: an incoming
+`traceparent` header continues the caller's trace and every response carries
+one back.
+
+Finished spans go to TRACING_EXPORTER: "file" appends one JSON object per
+line to TRACING_FILE_PATH, "console" logs them, "none" (default) drops them.
+Ids are generated either way, so agent_execution_logs rows always carry the
+trace id of the chat message that caused them.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str  # 32 hex chars
+    span_id: str  # 16 hex chars
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_span_id: Optional[str]
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    status: str = "OK"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+_current: contextvars.ContextVar[Optional[SpanContext]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def current_context() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    ctx = _current.get()
+    return ctx.trace_id if ctx else None
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """SpanContext from a W3C traceparent ("00-<trace>-<span>-<flags>"), or None if malformed."""
+    parts = (header or "").strip().lower().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+
+@contextmanager
+def span(name: str, *, parent: Optional[SpanContext] = None, **attributes: Any) -> Iterator[Span]:
+    """Child of parent (default: the current span), or a new trace; exported when the block exits."""
+    parent = parent or _current.get()
+    ctx = SpanContext(parent.trace_id if parent else os.urandom(16).hex(), os.urandom(8).hex())
+    current = Span(name, ctx, parent.span_id if parent else None, attributes)
+    token = _current.set(ctx)
+    try:
+        yield current
+    except BaseException as exc:
+        current.status = "ERROR"
+        current.attributes["exception.type"] = type(exc).__name__
+        current.attributes["exception.message"] = str(exc)[:200]
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Generator spans can be resumed in another context (e.g. threadpool iteration)
+            _current.set(parent)
+        exporter.export(current)
+
+
+def in_current_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """fn bound to a copy of the caller's context, for running on executor threads."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+class _NoopExporter:
+    def export(self, span: Span) -> None:
+        return None
+
+
+class ConsoleExporter:
+    def export(self, span: Span) -> None:
+        logger.info("span %s", json.dumps(span.to_dict(), default=str))
+
+
+class FileExporter:
+    """Appends spans as JSON lines; one write per span, so lines from several processes do not interleave."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.debug("Span export failed: %s", e)
+
+
+def _build_exporter() -> Any:
+    kind = (settings.tracing_exporter or "none").lower()
+    if kind == "file":
+        return FileExporter(settings.tracing_file_path)
+    if kind == "console":
+        return ConsoleExporter()
+    return _NoopExporter()
+
+
+exporter = _build_exporter()
+
+
+class TracingMiddleware:
+    """ASGI middleware: a root span per HTTP request, continuing an incoming traceparent."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        method = scope.get("method", "")
+        with span(f"HTTP {method}", parent=parent, **{"http.method": method, "http.target": scope.get("path", "")}) as root:
+
+            async def send_wrapper(message: Dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    root.set_attribute("http.status_code", message["status"])
+                    message["headers"] = list(message.get("headers") or []) + [
+                        (b"traceparent", root.context.traceparent.encode("latin-1"))
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    root.name = f"HTTP {method} {route}"
+                    root.set_attribute("http.route", route)
@@ -0,0 +1,311 @@
+"""
+Per-user similarity search over patient_documents for chat RAG.
+
+SupabaseVectorIndex calls the match_patient_documents RPC for every query.
+LocalVectorIndex (RAG_VECTOR_INDEX=local) keeps each active user's documents
+in process: loaded from patient_documents on the user's first query, appended
+to by store_patient_document, reloaded after RAG_LOCAL_INDEX_TTL_SECONDS
+(picks up rows written by other processes) and evicted LRU beyond
+RAG_LOCAL_INDEX_MAX_USERS. Search is exact cosine top-k over the user's (or
+member's) rows, as a float32 matrix-vector product when NumPy is installed.
+Users with more than RAG_EXACT_SCAN_LIMIT documents are left to the RPC.
+Concurrent first queries for a user share one load.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.supabase_client import supabase
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python dot products instead
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_SELF = "self"  # member key for the user's own documents (member_id NULL)
+_LOAD_PAGE = 500
+
+
+def _member_key(member_id: Optional[str]) -> str:
+    return member_id if member_id not in (None, "", "me", "null") else _SELF
+
+
+def _parse_embedding(value: Any) -> Optional[List[float]]:
+    """pgvector columns come back from PostgREST as "[0.1,0.2,...]" strings."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    if isinstance(value, (list, tuple)) and value:
+        return value
+    return None
+
+
+class SupabaseVectorIndex:
+    """match_patient_documents RPC per query. Never raises."""
+
+    def search(self, user_id: str, member_id: Optional[str], embedding: List[float], k: int) -> List[Dict[str, Any]]:
+        try:
+            payload = {
+                "query_embedding": embedding,
+                "match_count": k,
+                "user_id": user_id,
+                "member_id": member_id,
+                "ef_search": settings.rag_ef_search,
+                "exact_scan_limit": settings.rag_exact_scan_limit,
+            }
+            res = supabase.rpc("match_patient_documents", payload).execute()
+            return res.data or []
+        except Exception:
+            return []
+
+    def add(self, user_id: str, member_id: Optional[str], row: Dict[str, Any]) -> None:
+        return None
+
+    def invalidate(self, user_id: str) -> None:
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "supabase"}
+
+
+class _Segment:
+    """
+    Unit-length embeddings of one (user, member) plus their rows, in insertion
+    order. With NumPy the vectors live in one float32 matrix that grows in
+    chunks (the first len(rows) rows are used); without it, one array("f") per row.
+    """
+
+    _GROW_ROWS = 64
+
+    def __init__(self) -> None:
+        self.rows: List[Dict[str, Any]] = []
+        self.matrix: Any = None
+        self.vectors: List[array] = []
+
+    def append(self, row: Dict[str, Any], vector: Any) -> None:
+        if np is not None:
+            n = len(self.rows)
+            if self.matrix is None:
+                self.matrix = np.empty((self._GROW_ROWS, len(vector)), dtype=np.float32)
+            elif len(vector) != self.matrix.shape[1]:
+                return  # another embedding model; not comparable with the rest
+            elif n == len(self.matrix):
+                grown = np.empty((n + max(self._GROW_ROWS, n // 2), self.matrix.shape[1]), dtype=np.float32)
+                grown[:n] = self.matrix
+                self.matrix = grown
+            self.matrix[n] = vector
+        else:
+            if self.vectors and len(vector) != len(self.vectors[0]):
+                return
+            self.vectors.append(vector)
+        self.rows.append(row)
+
+    def top_k(self, query: Any, k: int) -> List[Dict[str, Any]]:
+        if not self.rows:
+            return []
+        if np is not None:
+            if len(query) != self.matrix.shape[1]:
+                return []
+            scores = self.matrix[: len(self.rows)] @ query
+            if k < len(scores):
+                best = np.argpartition(-scores, k)[:k]
+                best = best[np.argsort(-scores[best])]
+            else:
+                best = np.argsort(-scores)
+            return [{**self.rows[i], "similarity": float(scores[i])} for i in best]
+        if len(query) != len(self.vectors[0]):
+            return []
+        scored = [(sum(a * b for a, b in zip(vector, query)), i) for i, vector in enumerate(self.vectors)]
+        scored.sort(reverse=True)
+        return [{**self.rows[i], "similarity": score} for score, i in scored[:k]]
+
+
+class _UserEntry:
+    def __init__(self) -> None:
+        self.segments: Dict[str, _Segment] = {}
+        self.loaded_at = time.monotonic()
+        self.documents = 0
+        self.too_large = False
+
+
+class _Load:
+    """A user's load in progress; other first queries wait on it instead of loading again."""
+
+    def __init__(self) -> None:
+        self.future: "Future[_UserEntry]" = Future()
+        self.stale = False  # documents changed while loading: serve this result but do not cache it
+
+
+class LocalVectorIndex:
+    """In-process exact index for warm users; falls back to the RPC (never raises)."""
+
+    def __init__(self, *, max_users: int, ttl_seconds: float, max_documents: int, fallback: Any) -> None:
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.max_documents = max_documents
+        self.fallback = fallback
+        self._users: "OrderedDict[str, _UserEntry]" = OrderedDict()
+        self._loading: Dict[str, _Load] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.fallbacks = 0
+
+    def search(self, user_id: str, member_id: Optional[str], embedding: List[float], k: int) -> List[Dict[str, Any]]:
+        try:
+            entry = self._entry(user_id)
+        except Exception as e:
+            logger.warning("Local vector index load failed for %s: %s", user_id, e)
+            entry = None
+        if entry is None or entry.too_large:
+            self.fallbacks += 1
+            return self.fallback.search(user_id, member_id, embedding, k)
+        self.hits += 1
+        query = _unit_vector(embedding)
+        if query is None:
+            return []
+        with self._lock:
+            segment = entry.segments.get(_member_key(member_id))
+            return segment.top_k(query, k) if segment else []
+
+    def add(self, user_id: str, member_id: Optional[str], row: Dict[str, Any]) -> None:
+        """Append a newly stored document if the user is loaded (otherwise the next load sees it)."""
+        vector = _unit_vector(_parse_embedding(row.get("embedding")))
+        if vector is None:
+            return
+        with self._lock:
+            load = self._loading.get(user_id)
+            if load is not None:
+                load.stale = True  # the load may have read before this insert
+            entry = self._users.get(user_id)
+            if entry is None or entry.too_large:
+                return
+            entry.segments.setdefault(_member_key(member_id), _Segment()).append(_public_row(row), vector)
+            entry.documents += 1
+            if entry.documents > self.max_documents:
+                entry.too_large = True
+                entry.segments.clear()
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop the user's cached documents (after deletes or member changes); the next query reloads."""
+        with self._lock:
+            self._users.pop(user_id, None)
+            load = self._loading.get(user_id)
+            if load is not None:
+                load.stale = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "local",
+                "numpy": np is not None,
+                "users": len(self._users),
+                "documents": sum(e.documents for e in self._users.values()),
+                "hits": self.hits,
+                "loads": self.loads,
+                "fallbacks": self.fallbacks,
+            }
+
+    def _entry(self, user_id: str) -> _UserEntry:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and now - entry.loaded_at < self.ttl_seconds:
+                self._users.move_to_end(user_id)
+                return entry
+            load = self._loading.get(user_id)
+            owner = load is None
+            if owner:
+                load = self._loading[user_id] = _Load()
+        if not owner:
+            return load.future.result()
+        try:
+            entry = self._load(user_id)  # outside the lock: Supabase round trips
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(user_id, None)
+            load.future.set_exception(e)
+            raise
+        with self._lock:
+            self._loading.pop(user_id, None)
+            if not load.stale:
+                self._users[user_id] = entry
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+        load.future.set_result(entry)
+        return entry
+
+    def _load(self, user_id: str) -> _UserEntry:
+        self.loads += 1
+        entry = _UserEntry()
+        offset = 0
+        while True:
+            res = (
+                supabase.table("patient_documents")
+                .select("id, member_id, content, metadata, embedding")
+                .eq("user_id", user_id)
+                .order("created_at")
+                .range(offset, offset + _LOAD_PAGE - 1)
+                .execute()
+            )
+            rows = res.data or []
+            for row in rows:
+                vector = _unit_vector(_parse_embedding(row.get("embedding")))
+                if vector is None:
+                    continue
+                key = _member_key(row.get("member_id"))
+                entry.segments.setdefault(key, _Segment()).append(_public_row(row), vector)
+                entry.documents += 1
+            if entry.documents > self.max_documents:
+                entry.too_large = True
+                entry.segments.clear()
+                return entry
+            if len(rows) < _LOAD_PAGE:
+                return entry
+            offset += _LOAD_PAGE
+
+
+def _public_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields match_patient_documents returns."""
+    return {"id": row.get("id"), "content": row.get("content"), "metadata": row.get("metadata") or {}}
+
+
+def _unit_vector(vector: Optional[List[float]]) -> Any:
+    """vector scaled to length 1: a float32 ndarray with NumPy, else array("f"); None if empty or zero."""
+    if not vector:
+        return None
+    if np is not None:
+        values = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(values))
+        return values / norm if norm else None
+    norm = math.sqrt(sum(float(x) * float(x) for x in vector))
+    if norm == 0:
+        return None
+    return array("f", (float(x) / norm for x in vector))
+
+
+def _build_vector_index() -> Any:
+    rpc = SupabaseVectorIndex()
+    if settings.rag_vector_index.lower() == "local":
+        return LocalVectorIndex(
+            max_users=settings.rag_local_index_max_users,
+            ttl_seconds=settings.rag_local_index_ttl_seconds,
+            max_documents=settings.rag_exact_scan_limit,
+            fallback=rpc,
+        )
+    return rpc
+
+
+vector_index = _build_vector_index()
@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the MediSaathi backend.
+Run from backend/: python -m benchmarks.<name> --help
+"""
@@ -0,0 +1,163 @@
+"""
+Micro-benchmark for HealthDataAgent text helpers: the previous per-call
+re.match/search/split/sub with string patterns and per-keyword symptom scans
+versus the precompiled patterns and single-pass keyword matcher.
+
+    cd backend
+    python -m benchmarks.agent_helpers_bench --messages 5000 --repeat 5
+"""
+import argparse
+import random
+import re
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.fakes import ensure_env
+
+ensure_env()
+
+from app import agent  # noqa: E402
+from app.agent_patterns import (  # noqa: E402
+    CODE_FENCE_END,
+    CODE_FENCE_START,
+    SYMPTOM_KEYWORDS,
+    KeywordMatcher,
+    symptom_matcher,
+)
+
+TEMPLATES = [
+    "I have a headache and fever since yesterday",
+    "My BP this morning was {sys}/{dia} and I take Metformin 500mg twice daily",
+    "feeling dizzy and a bit of nausea for 2 days",
+    "Book an appointment with Dr. Rao on {day} at 10:30",
+    "My weight is {w} kg and height {h} cm",
+    "What is a healthy breakfast for diabetics? I often get fatigue after lunch.",
+    "Cough, cold & sore throat; also some body ache",
+    "Sugar level fasting {sugar} mg/dl, post meal {post}",
+    "```json\n{{\"action\": \"finish\", \"confidence_score\": 0.8}}\n```",
+    "member 123e4567-e89b-12d3-a456-426614174000 has stomach pain and chills",
+]
+
+
+# ---- previous implementations (baseline) ----
+def legacy_is_uuid(value: Any) -> bool:
+    if not value or not isinstance(value, str):
+        return False
+    return bool(re.match(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[1-5][0-9a-fA-F]{3}-[89abAB][0-9a-fA-F]{3}-[0-9a-fA-F]{12}$", value))
+
+
+def legacy_parse_bp(value: Any):
+    s = str(value)
+    match = re.search(r"(\d{2,3})\s*/\s*(\d{2,3})", s)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = re.search(r"(\d{2,3})", s)
+    if match:
+        return float(match.group(1)), None
+    return None, None
+
+
+def legacy_source_has_number(text: str) -> bool:
+    return bool(re.search(r"\d", text))
+
+
+def legacy_strip_fences(text: str) -> str:
+    cleaned = re.sub(r"^```(?:json)?", "", text.strip(), flags=re.IGNORECASE).strip()
+    return re.sub(r"```$", "", cleaned).strip()
+
+
+def legacy_keyword_scan(vocabulary: List[str]) -> Callable[[str], List[str]]:
+    def scan(text: str) -> List[str]:
+        lowered = text.lower()
+        return [keyword for keyword in vocabulary if keyword in lowered]
+
+    return scan
+
+
+# ---- current implementations ----
+def current_strip_fences(text: str) -> str:
+    cleaned = CODE_FENCE_START.sub("", text.strip()).strip()
+    return CODE_FENCE_END.sub("", cleaned).strip()
+
+
+def build_corpus(n: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        template = rng.choice(TEMPLATES)
+        corpus.append(
+            template.format(
+                sys=rng.randint(100, 160),
+                dia=rng.randint(60, 100),
+                day=rng.choice(["Monday", "Friday"]),
+                w=rng.randint(50, 100),
+                h=rng.randint(150, 190),
+                sugar=rng.randint(80, 200),
+                post=rng.randint(100, 260),
+            )
+        )
+    return corpus
+
+
+def time_fn(fn: Callable[[str], Any], corpus: List[str], repeat: int) -> float:
+    """Best-of-repeat microseconds per message."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages)
+    # Warm the re module cache for the legacy side so it is measured at its best
+    for text in corpus[:50]:
+        legacy_is_uuid(text), legacy_parse_bp(text), legacy_source_has_number(text), legacy_strip_fences(text)
+
+    probe = agent.HealthDataAgent(user_id="bench-user")
+    cases: List[Dict[str, Any]] = [
+        {"helper": "is_uuid", "legacy": legacy_is_uuid, "current": agent._is_uuid},
+        {"helper": "parse_bp", "legacy": legacy_parse_bp, "current": agent._parse_bp},
+        {"helper": "source_has_number", "legacy": legacy_source_has_number, "current": agent._source_has_number},
+        {"helper": "strip_code_fences", "legacy": legacy_strip_fences, "current": current_strip_fences},
+        {"helper": "symptom_keywords", "legacy": legacy_keyword_scan(list(SYMPTOM_KEYWORDS)), "current": symptom_matcher.find},
+        {"helper": "heuristic_symptoms", "legacy": None, "current": probe._heuristic_symptom_extract},
+    ]
+
+    header = f"{'helper':<20} {'legacy us/msg':>14} {'current us/msg':>15} {'speedup':>8}"
+    print(f"{len(corpus)} messages, best of {args.repeat}\n")
+    print(header)
+    print("-" * len(header))
+    for case in cases:
+        current = time_fn(case["current"], corpus, args.repeat)
+        if case["legacy"] is None:
+            print(f"{case['helper']:<20} {'-':>14} {current:>15.2f} {'-':>8}")
+            continue
+        legacy = time_fn(case["legacy"], corpus, args.repeat)
+        print(f"{case['helper']:<20} {legacy:>14.2f} {current:>15.2f} {legacy / current:>7.1f}x")
+
+    # Per-keyword scans grow with the vocabulary; the single-pass matcher stays flat
+    rng = random.Random(11)
+    print(f"\n{'vocabulary':<20} {'per-keyword us':>14} {'matcher us':>15} {'speedup':>8}")
+    for size in (len(SYMPTOM_KEYWORDS), 50, 200, 1000):
+        vocabulary = list(SYMPTOM_KEYWORDS) + [
+            "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 12)))
+            for _ in range(size - len(SYMPTOM_KEYWORDS))
+        ]
+        legacy = time_fn(legacy_keyword_scan(vocabulary), corpus, args.repeat)
+        current = time_fn(KeywordMatcher(vocabulary).find, corpus, args.repeat)
+        print(f"{size:<20} {legacy:>14.2f} {current:>15.2f} {legacy / current:>7.1f}x")
+
+    sample = "I have a headache and fever since yesterday"
+    print(f"\nheuristic_symptoms({sample!r}) -> {probe._heuristic_symptom_extract(sample)}")
+
+
+if __name__ == "__main__":
+    main()
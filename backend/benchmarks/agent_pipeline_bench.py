@@ -0,0 +1,145 @@
+"""
+Compare HealthDataAgent pipeline modes: LLM calls per turn and wall time.
+
+The LLM is a scripted stand-in with a fixed latency (a well-behaved model that
+starts with extract_data and then answers "finish"; the agent's guards steer the
+ReAct loop through validate/dedupe/save as they do in production). Supabase is
+an in-memory fake with its own per-query latency.
+
+    cd backend
+    python -m benchmarks.agent_pipeline_bench --llm-latency-ms 400 --db-latency-ms 20 --repeat 3
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fakes import FakeSupabase, ensure_env
+
+ensure_env()
+
+from app.agent import HealthDataAgent  # noqa: E402
+from app.agent_log_sink import agent_log_sink  # noqa: E402
+
+# (user message, what a good extraction model would return for it)
+CORPUS: List[Dict[str, Any]] = [
+    {
+        "message": "My BP this morning was 130/85 and I take Metformin 500mg twice daily",
+        "extraction": {
+            "health_records": [
+                {"type": "blood_pressure", "value": "130/85", "unit": "mmHg", "confidence": 0.9,
+                 "source_text": "My BP this morning was 130/85"},
+            ],
+            "medicines": [
+                {"name": "Metformin", "dosage": "500mg", "frequency": "twice daily", "confidence": 0.9,
+                 "source_text": "I take Metformin 500mg twice daily"},
+            ],
+            "appointments": [],
+            "symptoms": [],
+        },
+    },
+    {
+        "message": "I have a headache and fever since yesterday",
+        "extraction": {
+            "health_records": [],
+            "medicines": [],
+            "appointments": [],
+            "symptoms": [
+                {"symptom": "headache", "severity": "mild", "confidence": 0.8,
+                 "source_text": "I have a headache and fever since yesterday"},
+                {"symptom": "fever", "severity": "mild", "confidence": 0.8,
+                 "source_text": "I have a headache and fever since yesterday"},
+            ],
+        },
+    },
+    {
+        "message": "My weight is 72 kg and height 175 cm",
+        "extraction": {
+            "health_records": [
+                {"type": "weight", "value": 72, "unit": "kg", "confidence": 0.9, "source_text": "My weight is 72 kg"},
+                {"type": "height", "value": 175, "unit": "cm", "confidence": 0.9, "source_text": "height 175 cm"},
+            ],
+            "medicines": [],
+            "appointments": [],
+            "symptoms": [],
+        },
+    },
+    {
+        "message": "What is a healthy breakfast for diabetics?",
+        "extraction": {"health_records": [], "medicines": [], "appointments": [], "symptoms": []},
+    },
+]
+
+
+class ScriptedLLMAgent(HealthDataAgent):
+    """HealthDataAgent whose LLM is replaced by canned answers with a fixed latency."""
+
+    def __init__(self, *, llm_latency_s: float, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.llm_latency_s = llm_latency_s
+        self.current_extraction: Dict[str, Any] = {}
+
+    def _call_llm(self, prompt: str, system_prompt: str, **_kwargs: Any) -> str:
+        self.turn_llm_calls += 1
+        time.sleep(self.llm_latency_s)
+        if "Extract ALL health-related data" in prompt:
+            return json.dumps(self.current_extraction)
+        action = "extract_data" if "Recent Actions: []" in prompt else "finish"
+        return json.dumps({"reasoning": "", "has_health_data": True, "confidence_score": 0.8, "action": action})
+
+
+def run_mode(mode: str, *, repeat: int, llm_latency_ms: float, db_latency_ms: float) -> Dict[str, Any]:
+    db = FakeSupabase(latency_ms=db_latency_ms)
+    agent = ScriptedLLMAgent(user_id="bench-user", pipeline_mode=mode, llm_latency_s=llm_latency_ms / 1000.0)
+    agent._supabase = db
+    agent_log_sink._client = db
+    calls: List[int] = []
+    wall_ms: List[float] = []
+    for _ in range(repeat):
+        db.tables.clear()  # fresh DB each pass so duplicates don't short-circuit saves
+        for sample in CORPUS:
+            agent.reset(full_reset=True)
+            agent.current_extraction = sample["extraction"]
+            start = time.perf_counter()
+            result = agent.process_conversation_turn(user_message=sample["message"], assistant_response="")
+            wall_ms.append((time.perf_counter() - start) * 1000)
+            calls.append(result.get("llm_calls", agent.turn_llm_calls))
+    return {
+        "mode": mode,
+        "turns": len(calls),
+        "llm_calls_per_turn": statistics.mean(calls),
+        "max_llm_calls": max(calls),
+        "wall_ms_mean": statistics.mean(wall_ms),
+        "wall_ms_max": max(wall_ms),
+        "db_round_trips": db.round_trips,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--db-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    rows = [
+        run_mode(mode, repeat=args.repeat, llm_latency_ms=args.llm_latency_ms, db_latency_ms=args.db_latency_ms)
+        for mode in ("react", "fast")
+    ]
+    header = f"{'mode':<6} {'turns':>5} {'llm/turn':>9} {'max llm':>8} {'ms/turn':>9} {'max ms':>9} {'db rt':>6}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['mode']:<6} {r['turns']:>5} {r['llm_calls_per_turn']:>9.2f} {r['max_llm_calls']:>8} "
+            f"{r['wall_ms_mean']:>9.1f} {r['wall_ms_max']:>9.1f} {r['db_round_trips']:>6}"
+        )
+    react, fast = rows
+    if fast["llm_calls_per_turn"]:
+        print(f"\nLLM calls reduced {react['llm_calls_per_turn'] / fast['llm_calls_per_turn']:.1f}x; "
+              f"wall time reduced {react['wall_ms_mean'] / max(fast['wall_ms_mean'], 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
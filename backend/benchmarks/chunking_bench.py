@@ -0,0 +1,164 @@
+"""
+Report embedding chunks: the previous 500-word / 100-overlap windows versus
+the sentence-aware, token-targeted chunker. Reports are synthetic multi-page
+lab reports with a letterhead and footer on every page, result tables,
+narrative notes and (for some) a trailing page repeated as an annex.
+
+    cd backend
+    python -m benchmarks.chunking_bench --reports 200 --pages 6
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from statistics import mean
+from typing import Any, Callable, Dict, Iterable, List
+
+from benchmarks.fakes import ensure_env
+
+ensure_env()
+
+from app.config import settings  # noqa: E402
+from app.prompt_builder import estimate_tokens  # noqa: E402
+from app.text_chunking import chunk_text, iter_chunks  # noqa: E402
+
+HEADER = [
+    "CITY DIAGNOSTICS LABORATORY",
+    "NABL accredited | 24 MG Road, Pune | Ph 020-5550{n}",
+    "Patient: Asha Kulkarni   Age/Sex: 54/F   Ref: Dr. S. Mehta",
+]
+FOOTER = [
+    "This is an electronically generated report and does not need a signature.",
+    "Page {page} of {pages}",
+]
+TESTS = [
+    ("Haemoglobin", "g/dL", 11.5, 16.0),
+    ("Total WBC count", "cells/uL", 4000, 11000),
+    ("Platelet count", "lakh/uL", 1.5, 4.5),
+    ("Fasting blood sugar", "mg/dL", 70, 100),
+    ("HbA1c", "%", 4.0, 5.6),
+    ("Serum creatinine", "mg/dL", 0.6, 1.2),
+    ("Total cholesterol", "mg/dL", 125, 200),
+    ("LDL cholesterol", "mg/dL", 50, 130),
+    ("TSH", "uIU/mL", 0.4, 4.0),
+    ("Vitamin D (25-OH)", "ng/mL", 30, 100),
+]
+NOTES = [
+    "The patient reports intermittent fatigue over the last three months.",
+    "Fasting glucose is above the reference range and HbA1c suggests poor glycaemic control.",
+    "Renal function is within normal limits.",
+    "Advised repeat lipid profile after twelve weeks of dietary modification.",
+    "No haemolysis was observed in the sample.",
+    "Clinical correlation is recommended; values flagged H or L are outside the reference range.",
+    "Thyroid function is normal; continue current dose of levothyroxine 50 mcg.",
+    "Vitamin D is insufficient; supplementation with cholecalciferol 60000 IU weekly was discussed.",
+]
+
+
+def build_report(rng: random.Random, pages: int) -> List[str]:
+    out = []
+    annex = rng.random() < 0.3
+    total = pages + (1 if annex else 0)
+    for page in range(1, pages + 1):
+        lines = [h.format(n=rng.randint(10, 99)) for h in HEADER]
+        lines.append("")
+        lines.append(rng.choice(["HAEMATOLOGY", "BIOCHEMISTRY", "LIPID PROFILE", "ENDOCRINOLOGY"]))
+        lines.append("Test    Result    Unit    Reference range")
+        for name, unit, low, high in rng.sample(TESTS, rng.randint(4, 8)):
+            value = round(rng.uniform(low * 0.8, high * 1.2), 1)
+            lines.append(f"{name}    {value}    {unit}    {low} - {high}")
+        lines.append("")
+        lines.append("Interpretation:")
+        # Narrative with PDF-style hard line breaks mid-sentence
+        note = " ".join(rng.sample(NOTES, rng.randint(3, 6)) * rng.randint(2, 4))
+        words = note.split()
+        for i in range(0, len(words), 11):
+            lines.append(" ".join(words[i : i + 11]))
+        lines.append("")
+        lines.extend(f.format(page=page, pages=total) for f in FOOTER)
+        out.append("\n".join(lines))
+    if annex:
+        out.append(out[-1].replace(f"Page {pages} of", f"Page {total} of"))
+    return out
+
+
+def old_chunks(pages: List[str]) -> List[str]:
+    return chunk_text("".join(pages))
+
+
+def new_chunks(pages: List[str]) -> List[str]:
+    return list(
+        iter_chunks(
+            pages,
+            target_tokens=settings.rag_chunk_target_tokens,
+            max_tokens=settings.rag_chunk_max_tokens,
+            overlap_tokens=settings.rag_chunk_overlap_tokens,
+            min_tokens=settings.rag_chunk_min_tokens,
+        )
+    )
+
+
+def table_rows(pages: Iterable[str]) -> List[str]:
+    return [" ".join(line.split()) for page in pages for line in page.splitlines() if "    " in line]
+
+
+def measure(name: str, fn: Callable[[List[str]], List[str]], reports: List[List[str]]) -> Dict[str, Any]:
+    counts, sizes, tiny, rows_cut, rows_total, boiler, dups = [], [], 0, 0, 0, 0, 0
+    start = time.perf_counter()
+    all_chunks = [fn(report) for report in reports]
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn(max(reports, key=lambda r: sum(map(len, r))))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for report, chunks in zip(reports, all_chunks):
+        counts.append(len(chunks))
+        tokens = [estimate_tokens(c) for c in chunks]
+        sizes.extend(tokens)
+        tiny += sum(1 for t in tokens if t < settings.rag_chunk_min_tokens)
+        flat = [" ".join(c.split()) for c in chunks]
+        for row in table_rows(report):
+            rows_total += 1
+            if not any(row in c for c in flat):
+                rows_cut += 1
+        boiler += sum(c.count("electronically generated report") for c in flat)
+        dups += len(flat) - len(set(flat))
+    n = len(reports)
+    return {
+        "chunker": name,
+        "chunks/report": mean(counts),
+        "avg tokens": mean(sizes),
+        "min tokens": min(sizes),
+        "tiny/report": tiny / n,
+        "rows cut %": 100 * rows_cut / max(1, rows_total),
+        "footers/report": boiler / n,
+        "dups/report": dups / n,
+        "ms/report": elapsed / n * 1000,
+        "peak KiB": peak / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    reports = [build_report(rng, rng.randint(1, args.pages)) for _ in range(args.reports)]
+    avg_tokens = mean(estimate_tokens("".join(r)) for r in reports)
+    print(f"{len(reports)} reports, 1-{args.pages} pages, ~{avg_tokens:.0f} tokens each\n")
+
+    rows = [measure("words 500/100", old_chunks, reports), measure("sentence/token", new_chunks, reports)]
+    columns = list(rows[0].keys())
+    print("  ".join(f"{c:>14}" for c in columns))
+    for row in rows:
+        print("  ".join(f"{v:>14.1f}" if isinstance(v, float) else f"{v:>14}" for v in row.values()))
+    before, after = rows[0]["chunks/report"], rows[1]["chunks/report"]
+    change = (1 - after / before) * 100
+    print(f"\nEmbeddings per report: {before:.2f} -> {after:.2f} ({abs(change):.0f}% {'fewer' if change >= 0 else 'more'})")
+
+
+if __name__ == "__main__":
+    main()
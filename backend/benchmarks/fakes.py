@@ -0,0 +1,152 @@
+"""
+In-process stand-ins used by the benchmarks: a Supabase client with in-memory
+tables (enough of the PostgREST query builder for the agent and routers) and
+env defaults so app.config can load without a real .env.
+"""
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+
+def ensure_env() -> None:
+    """Dummy settings so app.config.Settings() loads; call before importing app.*."""
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+    os.environ.setdefault("SUPABASE_KEY", "bench.anon.key")
+    os.environ.setdefault("JWT_SECRET", "bench-jwt-secret")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("REPORT_ENCRYPTION_KEY", "00" * 32)
+
+
+class _Result:
+    def __init__(self, data: Any) -> None:
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeSupabase", table: str) -> None:
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._payload: Any = None
+        self._filters: List[Any] = []
+        self._limit: Optional[int] = None
+        self._order: Optional[tuple] = None
+        self._single = False
+
+    # Operations
+    def select(self, *_args, **_kwargs):
+        self._op = "select"
+        return self
+
+    def insert(self, payload, **_kwargs):
+        self._op, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, **_kwargs):
+        self._op, self._payload = "upsert", payload
+        return self
+
+    def update(self, payload, **_kwargs):
+        self._op, self._payload = "update", payload
+        return self
+
+    def delete(self, **_kwargs):
+        self._op = "delete"
+        return self
+
+    # Filters
+    def eq(self, col, val):
+        self._filters.append(lambda r: r.get(col) == val)
+        return self
+
+    def neq(self, col, val):
+        self._filters.append(lambda r: r.get(col) != val)
+        return self
+
+    def in_(self, col, vals):
+        vals = list(vals)
+        self._filters.append(lambda r: r.get(col) in vals)
+        return self
+
+    def gte(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and str(r.get(col)) >= str(val))
+        return self
+
+    def lte(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and str(r.get(col)) <= str(val))
+        return self
+
+    def lt(self, col, val):
+        self._filters.append(lambda r: r.get(col) is not None and str(r.get(col)) < str(val))
+        return self
+
+    def is_(self, col, val):
+        expected = None if val in ("null", None) else val
+        self._filters.append(lambda r: r.get(col) is expected)
+        return self
+
+    def ilike(self, col, pattern):
+        needle = pattern.strip("%").lower()
+        self._filters.append(lambda r: needle in str(r.get(col) or "").lower())
+        return self
+
+    def order(self, col, desc=False):
+        self._order = (col, desc)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def maybe_single(self):
+        self._single = True
+        return self
+
+    single = maybe_single
+
+    def execute(self):
+        if self._db.latency_s:
+            time.sleep(self._db.latency_s)
+        self._db.round_trips += 1
+        rows = self._db.tables.setdefault(self._table, [])
+        if self._op in ("insert", "upsert"):
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            created = []
+            for row in payload:
+                row = dict(row)
+                row.setdefault("id", str(uuid.uuid4()))
+                rows.append(row)
+                created.append(row)
+            return _Result(created)
+        matched = [r for r in rows if all(f(r) for f in self._filters)]
+        if self._op == "update":
+            for r in matched:
+                r.update(self._payload)
+            return _Result(matched)
+        if self._op == "delete":
+            self._db.tables[self._table] = [r for r in rows if r not in matched]
+            return _Result(matched)
+        if self._order:
+            col, desc = self._order
+            matched.sort(key=lambda r: str(r.get(col) or ""), reverse=desc)
+        if self._limit is not None:
+            matched = matched[: self._limit]
+        if self._single:
+            return _Result(matched[0] if matched else None)
+        return _Result(matched)
+
+
+class FakeSupabase:
+    """Minimal in-memory Supabase client. latency_ms simulates a PostgREST round-trip."""
+
+    def __init__(self, latency_ms: float = 0.0) -> None:
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.latency_s = latency_ms / 1000.0
+        self.round_trips = 0
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, _fn: str, _params: Dict[str, Any]) -> FakeQuery:
+        return FakeQuery(self, "__rpc__")
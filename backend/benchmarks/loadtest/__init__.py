@@ -0,0 +1 @@
+"""Load test of the whole API against local HTTP stand-ins (see benchmarks.loadtest.run)."""
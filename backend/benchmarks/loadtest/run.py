@@ -0,0 +1,261 @@
+"""
+Load test the API against local stand-ins for Supabase, Ollama, OpenRouter and
+Gemini: starts the stand-ins (benchmarks.loadtest.servers), seeds patients,
+doctors and reports, runs the real app under uvicorn pointed at them, and
+drives it with closed-loop virtual users picking scenarios from a weighted mix
+(benchmarks.loadtest.scenarios). Prints count, errors, throughput and
+p50/p95/p99 per endpoint; --json saves the result and --compare diffs a run
+against a saved one.
+
+    cd backend
+    python -m benchmarks.loadtest.run --users 20 --duration 60 --mix default --json before.json
+    python -m benchmarks.loadtest.run --users 20 --duration 60 --mix default --compare before.json
+    python -m benchmarks.loadtest.run --mix chat --app-env AGENT_PIPELINE_MODE=react
+
+With --target the app is not started: run it yourself (e.g. under a
+profiler) with the printed environment, and the driver waits for it.
+Needs the backend requirements (the app itself runs unmodified).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.loadtest.scenarios import SCENARIOS, Recorder, Session, World, parse_mix, seed, upload_seed_reports
+from benchmarks.loadtest.servers import StandIns
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def start_app(port: int, env: Dict[str, str], workers: int) -> Tuple[subprocess.Popen, str]:
+    log_fd, log_path = tempfile.mkstemp(prefix="loadtest-app-", suffix=".log")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        stdout=log_fd,
+        stderr=subprocess.STDOUT,
+    )
+    os.close(log_fd)
+    return proc, log_path
+
+
+async def wait_for(base_url: str, timeout: float, proc: Optional[subprocess.Popen] = None) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"App exited with code {proc.returncode}")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"App at {base_url} did not answer within {timeout:.0f}s")
+
+
+async def drive(
+    base_url: str,
+    world: World,
+    mix: Dict[str, float],
+    *,
+    users: int,
+    duration: float,
+    warmup: float,
+    think_ms: float,
+    seed_reports: int,
+    rng_seed: int,
+) -> Tuple[Recorder, float]:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=users * 3, max_keepalive_connections=users * 3)
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(180.0), limits=limits) as client:
+        if seed_reports:
+            print(f"Uploading {seed_reports} seed reports...", flush=True)
+            await upload_seed_reports(client, world, seed_reports, users, random.Random(rng_seed))
+
+        names, weights = list(mix), list(mix.values())
+
+        async def user(index: int) -> None:
+            rng = random.Random(rng_seed * 1000 + index)
+            session = Session(client, recorder, world, rng)
+            while True:
+                scenario = SCENARIOS[rng.choices(names, weights)[0]]
+                await scenario(session)
+                if think_ms > 0:
+                    await asyncio.sleep(rng.expovariate(1000.0 / think_ms))
+
+        print(f"Running {users} users for {warmup:.0f}s warm-up + {duration:.0f}s...", flush=True)
+        tasks = [asyncio.ensure_future(user(i)) for i in range(users)]
+        await asyncio.sleep(warmup)
+        recorder.recording = True
+        started = time.monotonic()
+        await asyncio.sleep(duration)
+        recorder.recording = False
+        elapsed = time.monotonic() - started
+        # Requests still in flight at the deadline are counted as unfinished, not recorded late
+        unfinished = {label: n for label, n in recorder.in_flight.items() if n > 0}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        recorder.in_flight = unfinished
+    return recorder, elapsed
+
+
+def summarize(recorder: Recorder, elapsed: float) -> Dict[str, Dict[str, Any]]:
+    endpoints: Dict[str, Dict[str, Any]] = {}
+    everything: List[float] = []
+    for label in sorted(set(recorder.samples) | set(recorder.in_flight)):
+        values = sorted(recorder.samples.get(label, []))
+        if not label.endswith("(first byte)"):
+            everything.extend(values)
+        endpoints[label] = _stats(values, recorder.errors.get(label, 0), elapsed)
+        endpoints[label]["statuses"] = dict(recorder.statuses.get(label, {}))
+        endpoints[label]["unfinished"] = recorder.in_flight.get(label, 0)
+    total_errors = sum(n for label, n in recorder.errors.items() if not label.endswith("(first byte)"))
+    endpoints["TOTAL"] = _stats(sorted(everything), total_errors, elapsed)
+    endpoints["TOTAL"]["unfinished"] = sum(recorder.in_flight.values())
+    return endpoints
+
+
+def _stats(values: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "count": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        "max_ms": round((values[-1] if values else 0.0) * 1000, 1),
+    }
+
+
+def print_table(endpoints: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    width = max(len(label) for label in endpoints)
+    columns = ("count", "errors", "unfinished", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+    print(f"{'endpoint':<{width}}  " + "  ".join(f"{c:>10}" for c in columns))
+    for label, stats in endpoints.items():
+        if label == "TOTAL":
+            print("-" * (width + 12 * len(columns)))
+        print(f"{label:<{width}}  " + "  ".join(f"{stats.get(c, 0):>10}" for c in columns))
+        before = (baseline or {}).get(label)
+        if before:
+            deltas = []
+            for c in columns:
+                if c in ("count", "errors", "unfinished") or not before.get(c):
+                    deltas.append(f"{'':>10}")
+                else:
+                    deltas.append(f"{(stats[c] - before[c]) / before[c] * 100:>+9.0f}%")
+            print(f"{'  vs baseline':<{width}}  " + "  ".join(deltas))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds run before measuring")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between a user's actions")
+    parser.add_argument("--mix", default="default", help="default, chat, crud, reports, doctor, or scenario=weight,...")
+    parser.add_argument("--no-agent", action="store_true", help="Chat without the background agent (enable_agent=false)")
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--seed-reports", type=int, default=20, help="Reports uploaded before the run")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="Every Supabase request")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Ollama prompt read, OpenRouter/Gemini response")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="Per generated Ollama token (OpenRouter: half)")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="Tokens per Ollama reply")
+    parser.add_argument("--embed-latency-ms", type=float, default=15.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latencies vary uniformly by +/- this fraction")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="Extra app setting (repeatable)")
+    parser.add_argument("--target", help="Use an app already running at this URL (see --base-port)")
+    parser.add_argument("--base-port", type=int, default=0, help="Fixed stand-in ports base..base+3 (default with --target: 18000)")
+    parser.add_argument("--json", help="Save the results here")
+    parser.add_argument("--compare", help="Show deltas against results saved with --json")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    stand_ins = StandIns(
+        db_latency_ms=args.db_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        token_ms=args.token_ms,
+        reply_tokens=args.reply_tokens,
+        embed_latency_ms=args.embed_latency_ms,
+        jitter=args.jitter,
+        base_port=args.base_port or (18000 if args.target else 0),
+    ).start()
+    world = seed(stand_ins.supabase, patients=args.patients, doctors=args.doctors, rng=random.Random(args.seed))
+    world.enable_agent = not args.no_agent
+    env = dict(stand_ins.env(), **dict(kv.split("=", 1) for kv in args.app_env))
+
+    proc: Optional[subprocess.Popen] = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+            print("Start the app with:\n" + "\n".join(f"export {k}={v}" for k, v in env.items()), flush=True)
+            asyncio.run(wait_for(base_url, timeout=600))
+        else:
+            port = _free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            proc, log_path = start_app(port, env, args.workers)
+            print(f"App on {base_url} (log: {log_path})", flush=True)
+            asyncio.run(wait_for(base_url, timeout=60, proc=proc))
+
+        recorder, elapsed = asyncio.run(drive(
+            base_url, world, mix,
+            users=args.users, duration=args.duration, warmup=args.warmup, think_ms=args.think_ms,
+            seed_reports=args.seed_reports, rng_seed=args.seed,
+        ))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        stand_ins.stop()
+
+    endpoints = summarize(recorder, elapsed)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["endpoints"]
+    print(f"\nmix={args.mix} users={args.users} measured={elapsed:.1f}s "
+          f"db={args.db_latency_ms:g}ms llm={args.llm_latency_ms:g}ms token={args.token_ms:g}ms\n")
+    print_table(endpoints, baseline)
+    if endpoints["TOTAL"]["unfinished"]:
+        print("\nunfinished = still running at the end of the run (not in the percentiles)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "mix": mix, "measured_seconds": round(elapsed, 2), "endpoints": endpoints}, f, indent=2)
+        print(f"\nSaved {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""
+Seed data and user scenarios for the load test.
+
+seed() fills the fake Supabase with patients (profile, medicines, health
+records, RAG documents), doctors with onboarding done, and appointments
+linking them. Reports are uploaded through the API during setup, so they are
+encrypted and embedded the way the app does it.
+
+Each scenario is one user action as the frontend performs it (a dashboard
+fires its requests together). Requests are recorded by route template, e.g.
+"GET /medicines/{id}".
+"""
+import asyncio
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.loadtest.servers import FakeSupabase, embedding
+
+API = "/api/v1"
+
+CHAT_MESSAGES = [
+    "What does my latest blood sugar reading mean?",
+    "Can I take paracetamol with my current medicines?",
+    "My BP this morning was 130/85, is that okay?",
+    "I have been feeling dizzy after taking Metformin.",
+    "Summarise my recent health records.",
+    "What should I eat to keep my cholesterol down?",
+]
+MEDICINES = [("Metformin", "500mg", "Twice daily"), ("Amlodipine", "5mg", "Daily"), ("Atorvastatin", "10mg", "Daily"),
+             ("Levothyroxine", "50mcg", "Daily"), ("Pantoprazole", "40mg", "Before breakfast"), ("Vitamin D3", "60000 IU", "Weekly")]
+METRICS = [("blood_pressure", "128/82", "mmHg"), ("blood_sugar", "112", "mg/dL"), ("weight", "71.5", "kg"),
+           ("heart_rate", "76", "bpm"), ("cholesterol", "185", "mg/dL")]
+SPECIALIZATIONS = ["General Physician", "Cardiologist", "Endocrinologist", "Dermatologist", "Neurologist"]
+LAB_LINES = [
+    "Haemoglobin 13.8 g/dL (13.0 - 17.0)", "Total Leucocyte Count 7,200 /cumm (4,000 - 10,000)",
+    "Platelet Count 2.6 lakh/cumm (1.5 - 4.1)", "Fasting Blood Sugar 112 mg/dL (70 - 100) HIGH",
+    "HbA1c 6.4 % (4.0 - 5.6) HIGH", "Total Cholesterol 185 mg/dL (< 200)", "LDL Cholesterol 118 mg/dL (< 100) HIGH",
+    "HDL Cholesterol 42 mg/dL (> 40)", "Triglycerides 160 mg/dL (< 150) HIGH", "Serum Creatinine 0.9 mg/dL (0.7 - 1.3)",
+    "TSH 3.1 uIU/mL (0.4 - 4.0)", "Vitamin D 18 ng/mL (30 - 100) LOW", "Vitamin B12 310 pg/mL (211 - 911)",
+]
+
+
+@dataclass
+class Patient:
+    user_id: str
+    token: str
+    name: str
+    report_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Doctor:
+    user_id: str
+    token: str
+    doctor_id: str
+    patient_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class World:
+    patients: List[Patient]
+    doctors: List[Doctor]
+    enable_agent: bool = True
+
+    def patient(self, rng: random.Random, with_reports: bool = False) -> Optional[Patient]:
+        pool = [p for p in self.patients if p.report_ids] if with_reports else self.patients
+        return rng.choice(pool) if pool else None
+
+
+def seed(db: FakeSupabase, *, patients: int, doctors: int, rng: random.Random) -> World:
+    today = date.today()
+    world = World(patients=[], doctors=[])
+    for i in range(patients):
+        name = f"Patient {i + 1}"
+        user_id, token = db.add_user(f"patient{i + 1}@bench.local", name)
+        world.patients.append(Patient(user_id, token, name))
+        db.insert("profiles", {
+            "user_id": user_id, "full_name": name, "age": rng.randint(22, 78), "gender": rng.choice(["male", "female"]),
+            "location": "Pune", "health_profile": {"conditions": ["type 2 diabetes"], "allergies": []},
+            "onboarding_completed": True,
+        })
+        db.insert("user_profiles", {"user_id": user_id, "email": f"patient{i + 1}@bench.local", "onboarding_completed": True})
+        for med_name, dosage, frequency in rng.sample(MEDICINES, 4):
+            db.insert("medicines", {
+                "user_id": user_id, "member_id": None, "name": med_name, "dosage": dosage, "frequency": frequency,
+                "form": "tablet", "intake_times": ["morning"], "is_active": True,
+                "start_date": (today - timedelta(days=30)).isoformat(), "end_date": (today + timedelta(days=60)).isoformat(),
+            })
+        for day in range(20):
+            metric, value, unit = rng.choice(METRICS)
+            db.insert("health_records", {
+                "user_id": user_id, "member_id": None, "metric": metric, "value": value, "unit": unit,
+                "date": (today - timedelta(days=day)).isoformat(),
+            })
+        for line in rng.sample(LAB_LINES, 10):
+            content = f"Lab report for {name}: {line}."
+            db.insert("patient_documents", {
+                "user_id": user_id, "member_id": None, "content": content,
+                "embedding": list(embedding(content)), "metadata": {"source": "report"},
+            })
+    for i in range(doctors):
+        user_id, token = db.add_user(f"doctor{i + 1}@bench.local", f"Dr. Bench {i + 1}", role="doctor")
+        row = db.insert("doctors", {
+            "user_id": user_id, "full_name": f"Dr. Bench {i + 1}", "email": f"doctor{i + 1}@bench.local",
+            "specialization": SPECIALIZATIONS[i % len(SPECIALIZATIONS)], "fees_inr": 500 + 100 * i,
+            "bio": "Load-test doctor", "onboarding_completed": True,
+        })
+        world.doctors.append(Doctor(user_id, token, row["id"]))
+    for patient in world.patients:
+        for doctor in rng.sample(world.doctors, min(2, len(world.doctors))):
+            db.insert("appointments", {
+                "patient_id": patient.user_id, "doctor_id": doctor.doctor_id,
+                "date": (today + timedelta(days=rng.randint(0, 14))).isoformat(),
+                "time_slot": f"{rng.randint(9, 17):02d}:00", "status": rng.choice(["scheduled", "confirmed"]),
+                "reason": "Follow-up",
+            })
+            if patient.user_id not in doctor.patient_ids:
+                doctor.patient_ids.append(patient.user_id)
+    return world
+
+
+def report_pdf(title: str, rng: random.Random, pages: int = 2) -> bytes:
+    """A small text PDF (lab values) that PyMuPDF can parse."""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects: List[bytes] = []
+    page_ids = [3 + 2 * p for p in range(pages)]
+    font_id = 3 + 2 * pages
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{p} 0 R" for p in page_ids).encode(), pages))
+    for page in range(pages):
+        lines = [f"{title} - page {page + 1}", ""] + [rng.choice(LAB_LINES) for _ in range(30)]
+        text = "BT /F1 11 Tf 14 TL 50 760 Td " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = text.encode("latin-1")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (page_ids[page] + 1, font_id)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class Recorder:
+    """Latency samples (seconds), errors and status codes per endpoint label, plus requests in flight."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.recording = False
+
+    def begin(self, label: str) -> float:
+        self.in_flight[label] += 1
+        return time.perf_counter()
+
+    def end(self, label: str) -> None:
+        self.in_flight[label] -= 1
+
+    def add(self, label: str, seconds: float, status: Any, ok: bool) -> None:
+        if not self.recording:
+            return
+        self.samples[label].append(seconds)
+        self.statuses[label][str(status)] += 1
+        if not ok:
+            self.errors[label] += 1
+
+
+# Chat streams answer 200 and report failures in the text
+CHAT_FAILURES = ("Cannot reach the AI model", "The AI model", "AI service error", "Something went wrong", "[Error from model")
+
+
+class Session:
+    """One virtual user's view of the API: timed requests recorded under a label."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, world: World, rng: random.Random) -> None:
+        self.client = client
+        self.recorder = recorder
+        self.world = world
+        self.rng = rng
+
+    async def call(self, label: str, method: str, path: str, token: str, **kwargs: Any) -> Optional[httpx.Response]:
+        headers = {"Authorization": f"Bearer {token}"}
+        started = self.recorder.begin(label)
+        try:
+            response = await self.client.request(method, API + path, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.add(label, time.perf_counter() - started, type(e).__name__, False)
+            return None
+        finally:
+            self.recorder.end(label)
+        self.recorder.add(label, time.perf_counter() - started, response.status_code, response.status_code < 400)
+        return response
+
+    async def chat(self, token: str, message: str) -> None:
+        label = "POST /chat"
+        body = {"message": message, "enable_agent": self.world.enable_agent}
+        started = self.recorder.begin(label)
+        first: Optional[float] = None
+        text: List[str] = []
+        try:
+            async with self.client.stream(
+                "POST", API + "/chat", json=body, headers={"Authorization": f"Bearer {token}"}
+            ) as response:
+                async for chunk in response.aiter_text():
+                    if chunk and first is None:
+                        first = time.perf_counter() - started
+                    text.append(chunk)
+                status = response.status_code
+        except httpx.HTTPError as e:
+            self.recorder.add(label, time.perf_counter() - started, type(e).__name__, False)
+            return
+        finally:
+            self.recorder.end(label)
+        reply = "".join(text)
+        ok = status == 200 and bool(reply) and not reply.startswith(CHAT_FAILURES)
+        self.recorder.add(label, time.perf_counter() - started, status, ok)
+        if first is not None:
+            self.recorder.add(label + " (first byte)", first, status, ok)
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+
+async def chat(s: Session) -> None:
+    patient = s.world.patient(s.rng)
+    await s.chat(patient.token, s.rng.choice(CHAT_MESSAGES))
+
+
+async def medicines_list(s: Session) -> None:
+    await s.call("GET /medicines", "GET", "/medicines", s.world.patient(s.rng).token)
+
+
+async def medicines_crud(s: Session) -> None:
+    token = s.world.patient(s.rng).token
+    name, dosage, frequency = s.rng.choice(MEDICINES)
+    created = await s.call("POST /medicines", "POST", "/medicines", token, json={
+        "name": name, "dosage": dosage, "frequency": frequency, "intake_times": ["morning"],
+        "start_date": date.today().isoformat(), "notes": "load test",
+    })
+    if created is None or created.status_code >= 400:
+        return
+    medicine_id = created.json()["id"]
+    await s.call("GET /medicines/{id}", "GET", f"/medicines/{medicine_id}", token)
+    await s.call("PATCH /medicines/{id}", "PATCH", f"/medicines/{medicine_id}", token, json={"dosage": dosage, "notes": "updated"})
+    await s.call("DELETE /medicines/{id}", "DELETE", f"/medicines/{medicine_id}", token)
+
+
+async def medicine_info(s: Session) -> None:
+    await s.call("POST /medicines/info", "POST", "/medicines/info", s.world.patient(s.rng).token,
+                 json={"name": s.rng.choice(MEDICINES)[0]})
+
+
+async def reports_list(s: Session) -> None:
+    await s.call("GET /reports/list", "GET", "/reports/list", s.world.patient(s.rng).token)
+
+
+async def report_view(s: Session) -> None:
+    patient = s.world.patient(s.rng, with_reports=True)
+    if patient is None:
+        return
+    report_id = s.rng.choice(patient.report_ids)
+    await s.call("GET /reports/{id}/view", "GET", f"/reports/{report_id}/view", patient.token)
+
+
+async def report_upload(s: Session, label: str = "POST /reports/upload", patient: Optional[Patient] = None) -> None:
+    patient = patient or s.world.patient(s.rng)
+    pdf = report_pdf(f"Lab report for {patient.name}", s.rng)
+    response = await s.call(label, "POST", "/reports/upload", patient.token,
+                            files={"file": ("lab-report.pdf", pdf, "application/pdf")})
+    if response is not None and response.status_code == 200:
+        patient.report_ids.append(response.json()["report_id"])
+
+
+async def doctor_dashboard(s: Session) -> None:
+    token = s.rng.choice(s.world.doctors).token
+    await asyncio.gather(
+        s.call("GET /doctors/me", "GET", "/doctors/me", token),
+        s.call("GET /doctors/me/appointments", "GET", "/doctors/me/appointments", token),
+        s.call("GET /doctors/me/patients", "GET", "/doctors/me/patients", token),
+    )
+
+
+async def doctor_patient(s: Session) -> None:
+    doctor = s.rng.choice(s.world.doctors)
+    if not doctor.patient_ids:
+        return
+    patient_id = s.rng.choice(doctor.patient_ids)
+    detail = await s.call("GET /doctors/me/patients/{id}", "GET", f"/doctors/me/patients/{patient_id}", doctor.token)
+    if detail is None or detail.status_code >= 400:
+        return
+    reports = detail.json().get("reports") or []
+    if reports:
+        await s.call(
+            "GET /doctors/me/patients/{id}/report-summary", "GET", f"/doctors/me/patients/{patient_id}/report-summary",
+            doctor.token, params={"report_id": s.rng.choice(reports)["report_id"]},
+        )
+
+
+async def doctors_browse(s: Session) -> None:
+    await s.call("GET /doctors", "GET", "/doctors", s.world.patient(s.rng).token,
+                 params={"specialization": s.rng.choice(SPECIALIZATIONS + [""])})
+
+
+SCENARIOS: Dict[str, Callable[[Session], Awaitable[None]]] = {
+    "chat": chat,
+    "medicines_list": medicines_list,
+    "medicines_crud": medicines_crud,
+    "medicine_info": medicine_info,
+    "reports_list": reports_list,
+    "report_view": report_view,
+    "report_upload": report_upload,
+    "doctor_dashboard": doctor_dashboard,
+    "doctor_patient": doctor_patient,
+    "doctors_browse": doctors_browse,
+}
+
+# Relative weights: how often a virtual user picks each scenario
+MIXES: Dict[str, Dict[str, float]] = {
+    "default": {
+        "chat": 3, "medicines_list": 4, "medicines_crud": 2, "medicine_info": 1, "reports_list": 2,
+        "report_view": 1, "report_upload": 0.5, "doctor_dashboard": 2, "doctor_patient": 1, "doctors_browse": 1,
+    },
+    "chat": {"chat": 1},
+    "crud": {"medicines_list": 3, "medicines_crud": 2, "reports_list": 1, "doctors_browse": 1},
+    "reports": {"reports_list": 2, "report_view": 2, "report_upload": 1},
+    "doctor": {"doctor_dashboard": 3, "doctor_patient": 2},
+}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """A MIXES name, or "scenario=weight,..." (e.g. "chat=1,medicines_list=4")."""
+    if spec in MIXES:
+        return MIXES[spec]
+    mix: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def upload_seed_reports(client: httpx.AsyncClient, world: World, count: int, concurrency: int, rng: random.Random) -> None:
+    """Upload count reports through the API before the run (not recorded)."""
+    session = Session(client, Recorder(), world, rng)
+    targets = [world.patients[i % len(world.patients)] for i in range(count)]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(patient: Patient) -> None:
+        async with semaphore:
+            await report_upload(session, patient=patient)
+
+    await asyncio.gather(*(one(p) for p in targets))
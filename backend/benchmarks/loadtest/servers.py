@@ -0,0 +1,740 @@
+"""
+Local HTTP stand-ins for the services the API calls, so the real app (and its
+real clients: supabase-py, requests, openai, google-generativeai) can be load
+tested offline:
+
+- FakeSupabase: PostgREST (/rest/v1: filters, order, limit, single-object
+  responses, insert/upsert/update/delete, RPCs), GoTrue (/auth/v1/user) and
+  Storage (/storage/v1/object) over in-memory tables;
+- FakeOllama: /api/tags, /api/generate (NDJSON streaming, one token per
+  line with a per-token delay), /api/embeddings and /api/embed;
+- FakeOpenRouter: OpenAI-compatible /chat/completions and /embeddings;
+- FakeGemini: the REST generateContent endpoint.
+
+Requests wait latency_ms (+/- jitter) before answering; for Ollama that is
+the time to read the prompt, and embeddings have their own latency.
+Generation also waits token_ms per output token. Embeddings are
+deterministic per text.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Pattern, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+# A JWT-shaped key: supabase-py rejects keys that do not look like one
+SUPABASE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.bench"
+
+REPLY_WORDS = (
+    "Based on your recent records, your blood pressure readings look stable. Keep taking "
+    "your medicines as prescribed, stay hydrated, and note any dizziness or headaches. "
+    "Please consult your doctor before changing a dose or if symptoms get worse."
+).split()
+
+AGENT_JSON = json.dumps({"health_records": [], "medicines": [], "appointments": [], "symptoms": []})
+
+MEDICINE_INFO_JSON = json.dumps({
+    "uses": ["Type 2 diabetes"],
+    "side_effects": ["Nausea", "Upset stomach"],
+    "warnings": "Avoid with severe kidney disease.",
+    "dietary_restrictions": "Limit alcohol.",
+    "usage_instructions": "Take with meals.",
+})
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@lru_cache(maxsize=4096)
+def embedding(text: str, dims: int = 768) -> Tuple[float, ...]:
+    """Unit vector seeded by the text, so equal texts embed equally."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dims)]
+    norm = sum(v * v for v in vec) ** 0.5 or 1.0
+    return tuple(round(v / norm, 6) for v in vec)
+
+
+def reply_tokens(count: int) -> List[str]:
+    return [(" " if i else "") + REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(count)]
+
+
+class Request:
+    def __init__(self, handler: BaseHTTPRequestHandler, body: bytes) -> None:
+        parts = urlsplit(handler.path)
+        self.handler = handler
+        self.method = handler.command
+        self.path = unquote(parts.path)
+        self.query: List[Tuple[str, str]] = parse_qsl(parts.query, keep_blank_values=True)
+        self.headers = handler.headers
+        self.body = body
+        self.params: Dict[str, str] = {}
+
+    def arg(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        for key, value in self.query:
+            if key == name:
+                return value
+        return default
+
+    def json(self) -> Any:
+        return json.loads(self.body or b"null")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real services
+    # Headers and body are separate writes; with Nagle each response would stall on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def _dispatch(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = self.rfile.read(length)
+        elif "chunked" in (self.headers.get("Transfer-Encoding") or "").lower():
+            body = self._read_chunked()
+        else:
+            body = b""
+        self.server.fake.dispatch(Request(self, body))  # type: ignore[attr-defined]
+
+    def _read_chunked(self) -> bytes:
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+            if not size:
+                self.rfile.readline()
+                return b"".join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _dispatch
+
+    def log_message(self, *_args: Any) -> None:
+        return None
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients dropping keep-alive connections (or a cancelled run) are not errors here
+        return None
+
+
+class FakeServer:
+    """One stand-in service on its own port; subclasses register routes in __init__."""
+
+    name = "fake"
+    # Whether every request waits latency_ms before its handler runs
+    pause_per_request = True
+
+    def __init__(self, latency_ms: float = 0.0, jitter: float = 0.2, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._routes: List[Tuple[str, Pattern[str], Callable[[Request], None]]] = []
+        self._server: Optional[_Server] = None
+        self._counter_lock = threading.Lock()
+
+    def route(self, method: str, pattern: str, fn: Callable[[Request], None]) -> None:
+        self._routes.append((method, re.compile(pattern + "$"), fn))
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "FakeServer":
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.fake = self  # type: ignore[attr-defined]
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name=f"{self.name}-server", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def pause(self, ms: Optional[float] = None) -> None:
+        ms = self.latency_ms if ms is None else ms
+        if ms > 0:
+            time.sleep(ms * random.uniform(1 - self.jitter, 1 + self.jitter) / 1000.0)
+
+    def dispatch(self, req: Request) -> None:
+        with self._counter_lock:
+            self.requests += 1
+        for method, pattern, fn in self._routes:
+            match = pattern.match(req.path)
+            if match and method in (req.method, "*"):
+                req.params = match.groupdict()
+                if self.pause_per_request:
+                    self.pause()
+                try:
+                    fn(req)
+                except Exception as e:
+                    self.send_json(req, 500, {"message": f"{type(e).__name__}: {e}"})
+                return
+        self.send_json(req, 404, {"message": f"{self.name}: no route for {req.method} {req.path}"})
+
+    # Responses
+    def send(self, req: Request, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        h = req.handler
+        h.send_response(status)
+        h.send_header("Content-Type", content_type)
+        h.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            h.send_header(key, value)
+        h.end_headers()
+        if req.method != "HEAD":
+            h.wfile.write(body)
+
+    def send_json(self, req: Request, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send(req, status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def send_stream(self, req: Request, content_type: str, chunks: Any) -> None:
+        """Chunked response; each item of chunks (bytes) is flushed as it is produced."""
+        h = req.handler
+        h.send_response(200)
+        h.send_header("Content-Type", content_type)
+        h.send_header("Transfer-Encoding", "chunked")
+        h.end_headers()
+        for chunk in chunks:
+            h.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            h.wfile.flush()
+        h.wfile.write(b"0\r\n\r\n")
+
+
+# ---------------------------------------------------------------------------
+# Supabase: PostgREST + GoTrue + Storage
+# ---------------------------------------------------------------------------
+
+_RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _field(row: Dict[str, Any], column: str) -> Any:
+    """Row value for a column, including JSON paths like metadata->>embed_model."""
+    parts = re.split(r"->>?", column)
+    value: Any = row.get(parts[0])
+    for key in parts[1:]:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def _compare(value: Any, arg: str) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        a, b = float(value), float(arg)
+    except (TypeError, ValueError):
+        a, b = _text(value), arg  # type: ignore[assignment]
+    return (a > b) - (a < b)
+
+
+def _like(pattern: str, case_insensitive: bool) -> Pattern[str]:
+    regex = "".join(".*" if c in "*%" else re.escape(c) for c in pattern)
+    return re.compile(f"^{regex}$", re.IGNORECASE | re.DOTALL if case_insensitive else re.DOTALL)
+
+
+def _condition(column: str, expr: str) -> Callable[[Dict[str, Any]], bool]:
+    """PostgREST filter "[not.]op.arg" on column as a row predicate (unknown operators match everything)."""
+    negate = expr.startswith("not.")
+    if negate:
+        expr = expr[4:]
+    op, _, arg = expr.partition(".")
+
+    def test(row: Dict[str, Any]) -> bool:
+        value = _field(row, column)
+        if op == "eq":
+            return _text(value) == arg
+        if op == "neq":
+            return _text(value) != arg
+        if op in ("gt", "gte", "lt", "lte"):
+            cmp = _compare(value, arg)
+            if cmp is None:
+                return False
+            return {"gt": cmp > 0, "gte": cmp >= 0, "lt": cmp < 0, "lte": cmp <= 0}[op]
+        if op == "is":
+            return _text(value) == arg.lower()
+        if op == "in":
+            items = [v.strip().strip('"') for v in arg.strip("()").split(",")]
+            return _text(value) in items
+        if op in ("like", "ilike"):
+            return value is not None and bool(_like(arg, op == "ilike").match(_text(value)))
+        return True
+
+    return (lambda row: not test(row)) if negate else test
+
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, current = [], 0, ""
+    for c in text:
+        if c == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += c == "("
+        depth -= c == ")"
+        current += c
+    return parts + [current] if current else parts
+
+
+def _logical(expr: str, any_of: bool) -> Callable[[Dict[str, Any]], bool]:
+    """or=(a.eq.1,b.is.null) / and=(...)"""
+    tests = []
+    for part in _split_top_level(expr.strip()[1:-1]):
+        column, _, rest = part.partition(".")
+        tests.append(_condition(column, rest))
+    combine = any if any_of else all
+    return lambda row: combine(t(row) for t in tests)
+
+
+class FakeSupabase(FakeServer):
+    name = "supabase"
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.files: Dict[str, bytes] = {}
+        self.users: Dict[str, Dict[str, Any]] = {}  # access token -> GoTrue user
+        self.rpcs: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "match_patient_documents": self._match_patient_documents,
+            "search_patient_documents_text": self._search_patient_documents_text,
+        }
+        self.lock = threading.Lock()
+        self.route("GET", r"/auth/v1/user", self._get_user)
+        self.route("POST", r"/rest/v1/rpc/(?P<fn>[^/]+)", self._rpc)
+        self.route("*", r"/rest/v1/(?P<table>[^/]+)", self._rest)
+        self.route("POST", r"/storage/v1/object/(?P<path>.+)", self._upload)
+        self.route("PUT", r"/storage/v1/object/(?P<path>.+)", self._upload)
+        self.route("GET", r"/storage/v1/object/(?:authenticated/|public/)?(?P<path>.+)", self._download)
+
+    # Seeding
+    def add_user(self, email: str, name: str = "", role: str = "patient") -> Tuple[str, str]:
+        """Create a GoTrue user; returns (user_id, bearer token)."""
+        user_id = str(uuid.uuid4())
+        token = f"bench-{uuid.uuid4().hex}"
+        self.users[token] = {
+            "id": user_id,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": email,
+            "created_at": now_iso(),
+            "app_metadata": {"provider": "email"},
+            "user_metadata": {"name": name, "role": role},
+        }
+        return user_id, token
+
+    def insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        row = dict(row)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", now_iso())
+        with self.lock:
+            self.tables.setdefault(table, []).append(row)
+        return row
+
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            return list(self.tables.get(table, []))
+
+    # GoTrue
+    def _get_user(self, req: Request) -> None:
+        token = (req.headers.get("Authorization") or "").replace("Bearer ", "", 1)
+        user = self.users.get(token)
+        if user is None:
+            self.send_json(req, 401, {"code": 401, "error_code": "bad_jwt", "msg": "invalid JWT"})
+            return
+        self.send_json(req, 200, user)
+
+    # PostgREST
+    def _filters(self, req: Request) -> List[Callable[[Dict[str, Any]], bool]]:
+        tests = []
+        for key, value in req.query:
+            if key in _RESERVED_PARAMS:
+                continue
+            if key in ("or", "and"):
+                tests.append(_logical(value, key == "or"))
+            else:
+                tests.append(_condition(key, value))
+        return tests
+
+    @staticmethod
+    def _project(rows: List[Dict[str, Any]], select: Optional[str]) -> List[Dict[str, Any]]:
+        if not select or "*" in select or "(" in select:
+            return [dict(r) for r in rows]
+        columns = [c.strip() for c in select.split(",") if c.strip()]
+        return [{c: r.get(c) for c in columns} for r in rows]
+
+    @staticmethod
+    def _order(rows: List[Dict[str, Any]], req: Request) -> List[Dict[str, Any]]:
+        keys = []
+        for key, value in req.query:
+            if key == "order":
+                keys.extend(v for v in value.split(",") if v)
+        # Stable sorts, least significant key first
+        for spec in reversed(keys):
+            column, *mods = spec.split(".")
+            rows.sort(key=lambda r: (_field(r, column) is None, _text(_field(r, column))), reverse="desc" in mods)
+        return rows
+
+    def _respond_rows(self, req: Request, rows: List[Dict[str, Any]], status: int = 200, total: Optional[int] = None) -> None:
+        prefer = req.headers.get("Prefer") or ""
+        total = len(rows) if total is None else total
+        headers = {"Content-Range": f"0-{len(rows) - 1}/{total}" if rows else f"*/{total}"}
+        if req.method != "GET" and "return=representation" not in prefer:
+            self.send(req, 204 if status == 200 else status, b"", "application/json", headers)
+            return
+        rows = self._project(rows, req.arg("select"))
+        if "vnd.pgrst.object" in (req.headers.get("Accept") or ""):
+            if len(rows) != 1:
+                self.send_json(req, 406, {
+                    "code": "PGRST116",
+                    "details": f"The result contains {len(rows)} rows",
+                    "hint": None,
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                })
+                return
+            self.send_json(req, status, rows[0], headers)
+            return
+        self.send_json(req, status, rows, headers)
+
+    def _rest(self, req: Request) -> None:
+        table = req.params["table"]
+        if req.method == "POST":
+            self._write(req, table)
+            return
+        tests = self._filters(req)
+        with self.lock:
+            rows = self.tables.setdefault(table, [])
+            matched = [r for r in rows if all(t(r) for t in tests)]
+            if req.method == "PATCH":
+                patch = req.json() or {}
+                for r in matched:
+                    r.update(patch)
+                matched = [dict(r) for r in matched]
+            elif req.method == "DELETE":
+                ids = {id(r) for r in matched}
+                self.tables[table] = [r for r in rows if id(r) not in ids]
+            else:
+                matched = [dict(r) for r in matched]
+        if req.method in ("PATCH", "DELETE"):
+            self._respond_rows(req, matched)
+            return
+        total = len(matched)
+        matched = self._order(matched, req)
+        offset = int(req.arg("offset") or 0)
+        limit = req.arg("limit")
+        matched = matched[offset: offset + int(limit)] if limit is not None else matched[offset:]
+        self._respond_rows(req, matched, total=total)
+
+    def _write(self, req: Request, table: str) -> None:
+        payload = req.json()
+        items = payload if isinstance(payload, list) else [payload]
+        upsert = "merge-duplicates" in (req.headers.get("Prefer") or "")
+        conflict = (req.arg("on_conflict") or "id").split(",")
+        written = []
+        with self.lock:
+            rows = self.tables.setdefault(table, [])
+            for item in items:
+                existing = None
+                if upsert and all(c in item for c in conflict):
+                    existing = next((r for r in rows if all(_text(r.get(c)) == _text(item[c]) for c in conflict)), None)
+                if existing is not None:
+                    existing.update(item)
+                    written.append(dict(existing))
+                    continue
+                row = dict(item)
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", now_iso())
+                rows.append(row)
+                written.append(dict(row))
+        self._respond_rows(req, written, status=201)
+
+    def _rpc(self, req: Request) -> None:
+        fn = self.rpcs.get(req.params["fn"])
+        if fn is None:
+            self.send_json(req, 404, {"code": "PGRST202", "message": f"Could not find the function {req.params['fn']}"})
+            return
+        self.send_json(req, 200, fn(req.json() or {}))
+
+    def _user_documents(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        user_id, member_id = params.get("user_id"), params.get("member_id")
+        return [
+            d for d in self.rows("patient_documents")
+            if d.get("user_id") == user_id and (member_id is None or d.get("member_id") == member_id)
+        ]
+
+    def _match_patient_documents(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        query = params.get("query_embedding") or []
+        if isinstance(query, str):
+            query = json.loads(query)
+        scored = []
+        for doc in self._user_documents(params):
+            vec = doc.get("embedding") or []
+            score = sum(a * b for a, b in zip(query, vec)) if vec else 0.0
+            scored.append((score, doc))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        count = int(params.get("match_count") or 4)
+        return [
+            {"id": d["id"], "content": d.get("content"), "metadata": d.get("metadata"), "similarity": round(s, 6)}
+            for s, d in scored[:count]
+        ]
+
+    def _search_patient_documents_text(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        terms = {t for t in re.findall(r"\w+", str(params.get("query_text") or "").lower()) if len(t) > 2}
+        scored = []
+        for doc in self._user_documents(params):
+            words = re.findall(r"\w+", str(doc.get("content") or "").lower())
+            hits = sum(1 for w in words if w in terms)
+            if hits:
+                scored.append((hits / (len(words) or 1), doc))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        count = int(params.get("match_count") or 20)
+        return [
+            {"id": d["id"], "content": d.get("content"), "metadata": d.get("metadata"), "rank": round(s, 6)}
+            for s, d in scored[:count]
+        ]
+
+    # Storage
+    @staticmethod
+    def _file_body(req: Request) -> bytes:
+        content_type = req.headers.get("Content-Type") or ""
+        if not content_type.startswith("multipart/form-data"):
+            return req.body
+        boundary = content_type.split("boundary=", 1)[1].strip('"').encode()
+        for part in req.body.split(b"--" + boundary):
+            head, sep, data = part.partition(b"\r\n\r\n")
+            if sep and (b'name="file"' in head or b"filename=" in head):
+                return data[:-2] if data.endswith(b"\r\n") else data
+        return b""
+
+    def _upload(self, req: Request) -> None:
+        path = req.params["path"]
+        with self.lock:
+            self.files[path] = self._file_body(req)
+        self.send_json(req, 200, {"Key": path, "Id": str(uuid.uuid4())})
+
+    def _download(self, req: Request) -> None:
+        data = self.files.get(req.params["path"])
+        if data is None:
+            self.send_json(req, 400, {"statusCode": "404", "error": "not_found", "message": "Object not found"})
+            return
+        self.send(req, 200, data, "application/octet-stream")
+
+
+# ---------------------------------------------------------------------------
+# LLM providers
+# ---------------------------------------------------------------------------
+
+
+class FakeOllama(FakeServer):
+    """latency_ms stands in for loading/reading the prompt; token_ms is paid per generated token."""
+
+    name = "ollama"
+    pause_per_request = False
+
+    def __init__(
+        self,
+        *,
+        models: Tuple[str, ...] = ("mistral", "nomic-embed-text"),
+        token_ms: float = 20.0,
+        reply_tokens: int = 120,
+        embed_latency_ms: float = 15.0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.models = models
+        self.token_ms = token_ms
+        self.reply_tokens = reply_tokens
+        self.embed_latency_ms = embed_latency_ms
+        self.route("GET", r"/api/tags", self._tags)
+        self.route("POST", r"/api/generate", self._generate)
+        self.route("POST", r"/api/embeddings", self._embeddings)
+        self.route("POST", r"/api/embed", self._embed)
+
+    def _tags(self, req: Request) -> None:
+        self.send_json(req, 200, {"models": [{"name": f"{m}:latest", "model": f"{m}:latest", "size": 0} for m in self.models]})
+
+    def _generate(self, req: Request) -> None:
+        payload = req.json() or {}
+        model = payload.get("model") or self.models[0]
+        tokens = [AGENT_JSON] if payload.get("format") else reply_tokens(self.reply_tokens)
+        prompt_tokens = len(str(payload.get("prompt") or "")) // 4
+        started = time.perf_counter()
+        self.pause()
+        prompt_ns = int((time.perf_counter() - started) * 1e9)
+
+        def final(eval_ns: int) -> Dict[str, Any]:
+            return {
+                "model": model,
+                "created_at": now_iso(),
+                "response": "",
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": prompt_ns,
+                "eval_count": len(tokens),
+                "eval_duration": eval_ns,
+                "load_duration": 0,
+                "total_duration": prompt_ns + eval_ns,
+            }
+
+        if payload.get("stream", True):
+            def lines():
+                generating = time.perf_counter()
+                for token in tokens:
+                    self.pause(self.token_ms)
+                    yield json.dumps({"model": model, "created_at": now_iso(), "response": token, "done": False}).encode() + b"\n"
+                yield json.dumps(final(int((time.perf_counter() - generating) * 1e9))).encode() + b"\n"
+
+            self.send_stream(req, "application/x-ndjson", lines())
+            return
+        generating = time.perf_counter()
+        for _ in tokens:
+            self.pause(self.token_ms)
+        body = final(int((time.perf_counter() - generating) * 1e9))
+        body["response"] = "".join(tokens)
+        self.send_json(req, 200, body)
+
+    def _embeddings(self, req: Request) -> None:
+        payload = req.json() or {}
+        self.pause(self.embed_latency_ms)
+        self.send_json(req, 200, {"embedding": list(embedding(str(payload.get("prompt") or "")))})
+
+    def _embed(self, req: Request) -> None:
+        payload = req.json() or {}
+        texts = payload.get("input") or []
+        texts = [texts] if isinstance(texts, str) else texts
+        self.pause(self.embed_latency_ms)
+        self.send_json(req, 200, {"model": payload.get("model"), "embeddings": [list(embedding(str(t))) for t in texts]})
+
+
+class FakeOpenRouter(FakeServer):
+    """OpenAI-compatible API under any base path (the app uses .../api/v1)."""
+
+    name = "openrouter"
+
+    def __init__(self, *, token_ms: float = 10.0, reply_tokens: int = 80, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.token_ms = token_ms
+        self.reply_tokens = reply_tokens
+        self.route("POST", r".*/chat/completions", self._chat)
+        self.route("POST", r".*/embeddings", self._embeddings)
+
+    def _chat(self, req: Request) -> None:
+        payload = req.json() or {}
+        prompt = " ".join(str(m.get("content") or "") for m in payload.get("messages") or [])
+        tokens = reply_tokens(self.reply_tokens)
+        for _ in tokens:
+            self.pause(self.token_ms)
+        self.send_json(req, 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(tokens), "total_tokens": len(prompt) // 4 + len(tokens)},
+        })
+
+    def _embeddings(self, req: Request) -> None:
+        payload = req.json() or {}
+        texts = payload.get("input") or []
+        texts = [texts] if isinstance(texts, str) else texts
+        dims = int(payload.get("dimensions") or 1536)
+        self.send_json(req, 200, {
+            "object": "list",
+            "model": payload.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": list(embedding(str(t), dims))} for i, t in enumerate(texts)],
+            "usage": {"prompt_tokens": sum(len(str(t)) // 4 for t in texts), "total_tokens": sum(len(str(t)) // 4 for t in texts)},
+        })
+
+
+class FakeGemini(FakeServer):
+    """generateContent as served by generativelanguage.googleapis.com (REST transport)."""
+
+    name = "gemini"
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.route("POST", r"/v1beta/models/(?P<model>[^/:]+):generateContent", self._generate)
+
+    def _generate(self, req: Request) -> None:
+        payload = req.json() or {}
+        prompt = json.dumps(payload.get("contents") or "")
+        self.send_json(req, 200, {
+            "candidates": [{
+                "content": {"parts": [{"text": MEDICINE_INFO_JSON}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": len(prompt) // 4,
+                "candidatesTokenCount": len(MEDICINE_INFO_JSON) // 4,
+                "totalTokenCount": (len(prompt) + len(MEDICINE_INFO_JSON)) // 4,
+            },
+        })
+
+
+class StandIns:
+    """All four stand-ins, started together; env() is what the app needs to use them."""
+
+    def __init__(
+        self,
+        *,
+        db_latency_ms: float = 5.0,
+        llm_latency_ms: float = 300.0,
+        token_ms: float = 20.0,
+        reply_tokens: int = 120,
+        embed_latency_ms: float = 15.0,
+        jitter: float = 0.2,
+        base_port: int = 0,
+    ) -> None:
+        port = (lambda offset: base_port + offset if base_port else 0)
+        self.supabase = FakeSupabase(latency_ms=db_latency_ms, jitter=jitter, port=port(0))
+        self.ollama = FakeOllama(
+            latency_ms=llm_latency_ms, token_ms=token_ms, reply_tokens=reply_tokens,
+            embed_latency_ms=embed_latency_ms, jitter=jitter, port=port(1),
+        )
+        self.openrouter = FakeOpenRouter(latency_ms=llm_latency_ms, token_ms=token_ms / 2, jitter=jitter, port=port(2))
+        self.gemini = FakeGemini(latency_ms=llm_latency_ms, jitter=jitter, port=port(3))
+        self.servers: List[FakeServer] = [self.supabase, self.ollama, self.openrouter, self.gemini]
+
+    def start(self) -> "StandIns":
+        for server in self.servers:
+            server.start()
+        return self
+
+    def stop(self) -> None:
+        for server in self.servers:
+            server.stop()
+
+    def env(self) -> Dict[str, str]:
+        return {
+            "SUPABASE_URL": self.supabase.url,
+            "SUPABASE_KEY": SUPABASE_KEY,
+            "SUPABASE_SERVICE_ROLE_KEY": SUPABASE_KEY,
+            "JWT_SECRET": "bench-jwt-secret",
+            "SECRET_KEY": "bench-secret",
+            "REPORT_ENCRYPTION_KEY": "00" * 32,
+            "OLLAMA_BASE_URL": self.ollama.url,
+            "OPENROUTER_BASE_URL": f"{self.openrouter.url}/api/v1",
+            "OPENROUTER_API_KEY": "sk-or-v1-bench",
+            "GEMINI_API_KEY": "bench",
+            "GEMINI_API_ENDPOINT": self.gemini.url,
+        }
+
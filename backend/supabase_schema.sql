@@ -271,8 +271,24 @@ COMMENT ON TABLE public.patient_documents IS 'RAG documents per user/member (emb
 
 CREATE INDEX IF NOT EXISTS idx_patient_documents_user_id ON public.patient_documents(user_id);
 CREATE INDEX IF NOT EXISTS idx_patient_documents_member_id ON public.patient_documents(member_id);
-CREATE INDEX IF NOT EXISTS idx_patient_documents_embedding ON public.patient_documents
-  USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+CREATE INDEX IF NOT EXISTS idx_patient_documents_user_member ON public.patient_documents(user_id, member_id);
+
+-- HNSW instead of ivfflat: ivfflat's lists = 100 was sized for an empty table, its recall
+-- drops as rows are added and it has to be rebuilt to re-cluster. HNSW needs no training
+-- and keeps recall as the table grows; recall/latency is tuned per query with ef_search.
+-- (Migration: drops the old ivfflat index. On a large table build the new one first with
+-- CREATE INDEX CONCURRENTLY, see docs/TABLES_AND_MIGRATION.md.)
+DROP INDEX IF EXISTS public.idx_patient_documents_embedding;
+CREATE INDEX IF NOT EXISTS idx_patient_documents_embedding_hnsw ON public.patient_documents
+  USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- Full-text leg of hybrid RAG search (medicine names, lab names and values that embeddings
+-- blur). Generated column, so existing rows are filled in when it is added.
+ALTER TABLE public.patient_documents
+  ADD COLUMN IF NOT EXISTS content_tsv tsvector
+  GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+CREATE INDEX IF NOT EXISTS idx_patient_documents_content_tsv ON public.patient_documents
+  USING gin (content_tsv);
 
 ALTER TABLE public.patient_documents ENABLE ROW LEVEL SECURITY;
 
@@ -297,12 +313,20 @@ CREATE POLICY "Users can delete own patient_documents"
   ON public.patient_documents FOR DELETE
   USING (auth.uid() = user_id);
 
--- Similarity search RPC for RAG
+-- Similarity search RPC for RAG (member_id NULL = the user themself).
+-- A tenant with at most exact_scan_limit documents is searched exactly: its rows are
+-- pre-filtered through idx_patient_documents_user_member and sorted by distance. Larger
+-- tenants go through the HNSW index with hnsw.ef_search = ef_search (higher = better
+-- recall, slower; at least match_count) and, on pgvector >= 0.8, iterative scans so the
+-- tenant filter cannot leave fewer than match_count rows.
+DROP FUNCTION IF EXISTS public.match_patient_documents(vector, int, uuid, uuid);
 CREATE OR REPLACE FUNCTION public.match_patient_documents(
   query_embedding vector(768),
   match_count int,
   user_id uuid,
-  member_id uuid DEFAULT NULL
+  member_id uuid DEFAULT NULL,
+  ef_search int DEFAULT 40,
+  exact_scan_limit int DEFAULT 5000
 )
 RETURNS TABLE (
   id uuid,
@@ -310,21 +334,108 @@ RETURNS TABLE (
   metadata jsonb,
   similarity float
 )
-LANGUAGE SQL
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+  tenant_rows int;
+BEGIN
+  SELECT count(*) INTO tenant_rows
+  FROM (
+    SELECT 1
+    FROM public.patient_documents d
+    WHERE d.user_id = match_patient_documents.user_id
+      AND (
+        (match_patient_documents.member_id IS NULL AND d.member_id IS NULL)
+        OR d.member_id = match_patient_documents.member_id
+      )
+    LIMIT exact_scan_limit + 1
+  ) t;
+
+  IF tenant_rows <= exact_scan_limit THEN
+    RETURN QUERY
+    WITH scoped AS MATERIALIZED (
+      SELECT d.id, d.content, d.metadata, d.embedding
+      FROM public.patient_documents d
+      WHERE d.user_id = match_patient_documents.user_id
+        AND (
+          (match_patient_documents.member_id IS NULL AND d.member_id IS NULL)
+          OR d.member_id = match_patient_documents.member_id
+        )
+        AND d.embedding IS NOT NULL
+    )
+    SELECT s.id, s.content, s.metadata, (1 - (s.embedding <=> query_embedding))::float
+    FROM scoped s
+    ORDER BY s.embedding <=> query_embedding
+    LIMIT match_count;
+    RETURN;
+  END IF;
+
+  PERFORM set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+  BEGIN
+    PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+  EXCEPTION WHEN OTHERS THEN
+    NULL;  -- pgvector < 0.8: no iterative scans
+  END;
+
+  -- relaxed_order may return rows slightly out of order; re-sort the final few
+  RETURN QUERY
+  WITH nearest AS MATERIALIZED (
+    SELECT d.id, d.content, d.metadata, d.embedding <=> query_embedding AS distance
+    FROM public.patient_documents d
+    WHERE d.user_id = match_patient_documents.user_id
+      AND (
+        (match_patient_documents.member_id IS NULL AND d.member_id IS NULL)
+        OR d.member_id = match_patient_documents.member_id
+      )
+    ORDER BY d.embedding <=> query_embedding
+    LIMIT match_count
+  )
+  SELECT n.id, n.content, n.metadata, (1 - n.distance)::float
+  FROM nearest n
+  ORDER BY n.distance;
+END;
+$$;
+
+-- Keyword search RPC for RAG (member_id NULL = the user themself). Any query term may
+-- match (the terms are OR-ed); rows are ranked by ts_rank_cd, which rewards documents
+-- containing more of the terms close together, normalised by document length.
+CREATE OR REPLACE FUNCTION public.search_patient_documents_text(
+  query_text text,
+  match_count int,
+  user_id uuid,
+  member_id uuid DEFAULT NULL
+)
+RETURNS TABLE (
+  id uuid,
+  content text,
+  metadata jsonb,
+  rank float
+)
+LANGUAGE plpgsql
+STABLE
 AS $$
-  SELECT
-    d.id,
-    d.content,
-    d.metadata,
-    1 - (d.embedding <=> query_embedding) AS similarity
+#variable_conflict use_column
+DECLARE
+  terms tsquery;
+BEGIN
+  terms := nullif(replace(plainto_tsquery('english', query_text)::text, ' & ', ' | '), '')::tsquery;
+  IF terms IS NULL THEN
+    RETURN;  -- only stop words
+  END IF;
+
+  RETURN QUERY
+  SELECT d.id, d.content, d.metadata, ts_rank_cd(d.content_tsv, terms, 1)::float
   FROM public.patient_documents d
-  WHERE d.user_id = match_patient_documents.user_id
+  WHERE d.user_id = search_patient_documents_text.user_id
     AND (
-      (match_patient_documents.member_id IS NULL AND d.member_id IS NULL)
-      OR d.member_id = match_patient_documents.member_id
+      (search_patient_documents_text.member_id IS NULL AND d.member_id IS NULL)
+      OR d.member_id = search_patient_documents_text.member_id
     )
-  ORDER BY d.embedding <=> query_embedding
+    AND d.content_tsv @@ terms
+  ORDER BY ts_rank_cd(d.content_tsv, terms, 1) DESC
   LIMIT match_count;
+END;
 $$;
 
 -- -----------------------------------------------------------------------------
@@ -610,6 +721,8 @@ CREATE TABLE IF NOT EXISTS public.agent_execution_logs (
 CREATE INDEX IF NOT EXISTS idx_agent_logs_user_session ON public.agent_execution_logs(user_id, session_id);
 CREATE INDEX IF NOT EXISTS idx_agent_logs_created ON public.agent_execution_logs(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_agent_logs_action ON public.agent_execution_logs(action);
+-- metadata.trace_id: the chat request trace the run belongs to (TRACING_EXPORTER spans)
+CREATE INDEX IF NOT EXISTS idx_agent_logs_trace_id ON public.agent_execution_logs((metadata->>'trace_id'));
 
 ALTER TABLE public.agent_execution_logs ENABLE ROW LEVEL SECURITY;
 
@@ -648,5 +761,202 @@ CREATE INDEX IF NOT EXISTS idx_health_records_member_id
 
 CREATE INDEX IF NOT EXISTS idx_medicines_user_active
   ON public.medicines(user_id, is_active) WHERE is_active = true;
+
+-- -----------------------------------------------------------------------------
+-- 12. agent_state_snapshots (evicted chat agent state, AGENT_STATE_STORE=supabase)
+-- -----------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS public.agent_state_snapshots (
+  user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+  state JSONB NOT NULL DEFAULT '{}',
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE public.agent_state_snapshots ENABLE ROW LEVEL SECURITY;
+-- No policies: only the service role (backend) reads/writes agent state.
+
+-- -----------------------------------------------------------------------------
+-- 13. chat_messages (chat history, CHAT_HISTORY_PERSIST=true)
+-- -----------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS public.chat_messages (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  conversation_id TEXT NOT NULL DEFAULT 'default',
+  role VARCHAR(20) NOT NULL,
+  content TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation
+  ON public.chat_messages(user_id, conversation_id, created_at DESC);
+
+ALTER TABLE public.chat_messages ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can read own chat messages" ON public.chat_messages;
+CREATE POLICY "Users can read own chat messages"
+  ON public.chat_messages FOR SELECT
+  USING (auth.uid() = user_id);
+
+-- -----------------------------------------------------------------------------
+-- 14. document_chunks (report embeddings for /reports/query, scoped per user/member)
+-- -----------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS public.document_chunks (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
+  member_id UUID REFERENCES public.members(id) ON DELETE SET NULL,
+  report_id TEXT,
+  filename TEXT,
+  content TEXT NOT NULL,
+  metadata JSONB NOT NULL DEFAULT '{}',
+  embedding vector(768),
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Tables created before tenant columns existed
+ALTER TABLE public.document_chunks
+  ADD COLUMN IF NOT EXISTS user_id UUID REFERENCES auth.users(id) ON DELETE CASCADE,
+  ADD COLUMN IF NOT EXISTS member_id UUID REFERENCES public.members(id) ON DELETE SET NULL,
+  ADD COLUMN IF NOT EXISTS report_id TEXT;
+
+-- Backfill tenant columns from metadata (report_id/member_id) and the owning medical_reports row
+UPDATE public.document_chunks c
+SET report_id = c.metadata->>'report_id'
+WHERE c.report_id IS NULL AND c.metadata ? 'report_id';
+
+UPDATE public.document_chunks c
+SET user_id = r.user_id,
+    member_id = r.member_id
+FROM public.medical_reports r
+WHERE c.user_id IS NULL AND r.report_id = c.report_id;
+
+COMMENT ON TABLE public.document_chunks IS 'Report chunks + embeddings; rows without user_id are never returned by match_document_chunks.';
+
+-- Tenant pre-filter: one user's (or member's) chunks are found through this index
+CREATE INDEX IF NOT EXISTS idx_document_chunks_user_member
+  ON public.document_chunks(user_id, member_id);
+CREATE INDEX IF NOT EXISTS idx_document_chunks_report_id
+  ON public.document_chunks(report_id);
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding
+  ON public.document_chunks USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+ALTER TABLE public.document_chunks ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can read own document_chunks" ON public.document_chunks;
+CREATE POLICY "Users can read own document_chunks"
+  ON public.document_chunks FOR SELECT
+  USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert own document_chunks" ON public.document_chunks;
+CREATE POLICY "Users can insert own document_chunks"
+  ON public.document_chunks FOR INSERT
+  WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can delete own document_chunks" ON public.document_chunks;
+CREATE POLICY "Users can delete own document_chunks"
+  ON public.document_chunks FOR DELETE
+  USING (auth.uid() = user_id);
+
+-- Similarity search over one user's (member_id NULL = the user themself) or one member's chunks,
+-- planned like match_patient_documents. A tenant with at most exact_scan_limit chunks is searched
+-- exactly: its rows are pre-filtered through idx_document_chunks_user_member (MATERIALIZED) and
+-- sorted by distance, so cost follows the tenant's size, not the table's. Larger tenants go
+-- through idx_document_chunks_embedding (HNSW) with hnsw.ef_search = ef_search and, on
+-- pgvector >= 0.8, iterative scans so the tenant filter cannot leave fewer than match_count rows.
+DROP FUNCTION IF EXISTS public.match_document_chunks(vector, int, uuid, uuid, float);
+CREATE OR REPLACE FUNCTION public.match_document_chunks(
+  query_embedding vector(768),
+  match_count int,
+  user_id uuid,
+  member_id uuid DEFAULT NULL,
+  match_threshold float DEFAULT 0,
+  ef_search int DEFAULT 40,
+  exact_scan_limit int DEFAULT 5000
+)
+RETURNS TABLE (
+  id uuid,
+  report_id text,
+  filename text,
+  content text,
+  metadata jsonb,
+  similarity float
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+  tenant_rows int;
+BEGIN
+  SELECT count(*) INTO tenant_rows
+  FROM (
+    SELECT 1
+    FROM public.document_chunks c
+    WHERE c.user_id = match_document_chunks.user_id
+      AND (
+        (match_document_chunks.member_id IS NULL AND c.member_id IS NULL)
+        OR c.member_id = match_document_chunks.member_id
+      )
+    LIMIT exact_scan_limit + 1
+  ) t;
+
+  IF tenant_rows <= exact_scan_limit THEN
+    RETURN QUERY
+    WITH scoped AS MATERIALIZED (
+      SELECT c.id, c.report_id, c.filename, c.content, c.metadata, c.embedding
+      FROM public.document_chunks c
+      WHERE c.user_id = match_document_chunks.user_id
+        AND (
+          (match_document_chunks.member_id IS NULL AND c.member_id IS NULL)
+          OR c.member_id = match_document_chunks.member_id
+        )
+        AND c.embedding IS NOT NULL
+    )
+    SELECT s.id, s.report_id, s.filename, s.content, s.metadata, (1 - (s.embedding <=> query_embedding))::float
+    FROM scoped s
+    WHERE 1 - (s.embedding <=> query_embedding) >= match_threshold
+    ORDER BY s.embedding <=> query_embedding
+    LIMIT match_count;
+    RETURN;
+  END IF;
+
+  PERFORM set_config('hnsw.ef_search', greatest(ef_search, match_count)::text, true);
+  BEGIN
+    PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+  EXCEPTION WHEN OTHERS THEN
+    NULL;  -- pgvector < 0.8: no iterative scans
+  END;
+
+  -- relaxed_order may return rows slightly out of order; re-sort the final few
+  RETURN QUERY
+  WITH nearest AS MATERIALIZED (
+    SELECT c.id, c.report_id, c.filename, c.content, c.metadata, c.embedding <=> query_embedding AS distance
+    FROM public.document_chunks c
+    WHERE c.user_id = match_document_chunks.user_id
+      AND (
+        (match_document_chunks.member_id IS NULL AND c.member_id IS NULL)
+        OR c.member_id = match_document_chunks.member_id
+      )
+    ORDER BY c.embedding <=> query_embedding
+    LIMIT match_count
+  )
+  SELECT n.id, n.report_id, n.filename, n.content, n.metadata, (1 - n.distance)::float
+  FROM nearest n
+  WHERE 1 - n.distance >= match_threshold
+  ORDER BY n.distance;
+END;
+$$;
+
+-- The old unscoped match_documents RPC searched every tenant's chunks; remove it
+DO $$
+DECLARE
+  fn regprocedure;
+BEGIN
+  FOR fn IN
+    SELECT p.oid::regprocedure
+    FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace
+    WHERE n.nspname = 'public' AND p.proname = 'match_documents'
+  LOOP
+    EXECUTE format('DROP FUNCTION %s', fn);
+  END LOOP;
+END $$;
+
 -- RLS is enabled for all tables with appropriate policies
 -- =============================================================================
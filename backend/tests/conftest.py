@@ -0,0 +1,12 @@
+import os
+
+# app.config requires these; tests never talk to Supabase, so placeholders are enough
+_PLACEHOLDERS = {
+    "SUPABASE_URL": "http://127.0.0.1:54321",
+    "SUPABASE_KEY": "test-anon-key",
+    "JWT_SECRET": "test",
+    "SECRET_KEY": "test",
+    "REPORT_ENCRYPTION_KEY": "test",
+}
+for _name, _value in _PLACEHOLDERS.items():
+    os.environ.setdefault(_name, _value)
@@ -0,0 +1,106 @@
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("supabase")
+
+from app.agent import HealthDataAgent  # noqa: E402
+
+
+def _msg(role, n):
+    return {"role": role, "content": f"{role} {n}"}
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = HealthDataAgent(user_id="u1", pipeline_mode="fast")
+    seen = {}
+
+    def fake_pipeline(member_id, session_id):
+        seen["turns"] = list(agent.conversation_turns)
+        seen["prompt"] = agent._build_extraction_prompt()
+
+    monkeypatch.setattr(agent, "_run_fast_pipeline", fake_pipeline)
+    agent.seen = seen
+    return agent
+
+
+def test_history_turn_ends_with_the_current_exchange(agent):
+    history = [_msg("user", 0), _msg("assistant", 0)]
+    result = agent.process_conversation_turn(
+        user_message="user 1", assistant_response="assistant 1", conversation_history=history
+    )
+    assert result["success"]
+    assert agent.seen["turns"] == history + [_msg("user", 1), _msg("assistant", 1)]
+
+
+def test_coalesced_turn_keeps_every_merged_exchange(agent):
+    # 20 entries; the last 3 exchanges were merged into this turn (the newest last)
+    history = [_msg(role, n) for n in range(10) for role in ("user", "assistant")]
+    result = agent.process_conversation_turn(
+        user_message="user 9",
+        assistant_response="assistant 9",
+        conversation_history=history,
+        coalesced_turns=2,
+    )
+    assert result["success"]
+    # 10 entries of context plus the 3 merged exchanges
+    assert agent.seen["turns"] == history[-16:]
+    assert "User: user 1\n" not in agent.seen["prompt"]
+    assert "User: user 2" in agent.seen["prompt"]
+    assert "Assistant: assistant 9" in agent.seen["prompt"]
+
+
+def test_plain_turn_after_coalesced_turn_returns_to_normal_window(agent):
+    history = [_msg(role, n) for n in range(8) for role in ("user", "assistant")]
+    agent.process_conversation_turn(
+        user_message="user 7", assistant_response="assistant 7", conversation_history=history, coalesced_turns=2
+    )
+    agent.process_conversation_turn(user_message="user 8", assistant_response="assistant 8")
+    assert len(agent.seen["turns"]) == 10
+    assert agent.seen["turns"][-1] == _msg("assistant", 8)
+
+
+class _FakeTable:
+    def __init__(self, db, name):
+        self.db, self.name, self.rows = db, name, None
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        self.db.requests.append((self.name, [dict(r) for r in self.rows]))
+        if any(r.get("value") == "bad" for r in self.rows):
+            raise ValueError("invalid input syntax for type numeric")
+        return type("Res", (), {"data": [dict(r, id=f"id-{len(self.db.requests)}") for r in self.rows]})()
+
+
+class _FakeSupabase:
+    def __init__(self):
+        self.requests = []
+
+    def table(self, name):
+        return _FakeTable(self, name)
+
+
+def test_bulk_insert_groups_by_keys_without_padding_nulls():
+    agent = HealthDataAgent(user_id="u1")
+    agent._supabase = db = _FakeSupabase()
+    rows = [{"metric": "weight", "value": 70, "status": None}, {"metric": "symptom", "value": 0}, {"metric": "bmi", "value": 22, "status": None}]
+    saved, errors = agent._bulk_insert("health_records", rows)
+    assert errors == [None, None, None]
+    assert all(saved)
+    assert len(db.requests) == 2
+    assert db.requests[1] == ("health_records", [{"metric": "symptom", "value": 0}])
+
+
+def test_bulk_insert_reports_failures_per_row():
+    agent = HealthDataAgent(user_id="u1")
+    agent._supabase = db = _FakeSupabase()
+    rows = [{"metric": "weight", "value": 70}, {"metric": "pulse", "value": "bad"}, {"metric": "bmi", "value": 22}]
+    saved, errors = agent._bulk_insert("health_records", rows)
+    assert saved[0]["metric"] == "weight" and saved[2]["metric"] == "bmi"
+    assert saved[1] is None
+    assert errors[0] is None and errors[2] is None
+    assert "numeric" in errors[1]
+    assert len(db.requests) == 4  # the batch, then each row
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.agent_jobs import DONE, QUEUED, RUNNING, SqliteAgentJobStore  # noqa: E402
+from app.agent_queue import AgentTurn  # noqa: E402
+
+
+def _store(tmp_path, **kwargs):
+    return SqliteAgentJobStore(str(tmp_path / "jobs.sqlite3"), **kwargs)
+
+
+def _status(store, job_id):
+    return store._conn().execute("SELECT status FROM agent_jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def test_stale_worker_cannot_ack_reclaimed_job(tmp_path):
+    store = _store(tmp_path, lease_seconds=0.05)
+    job_id = store.enqueue(AgentTurn(user_id="u1", member_id=None, user_message="hi", assistant_response="hello"))
+    assert store.claim("w1")[0] == job_id
+    time.sleep(0.1)
+    assert store.claim("w2")[0] == job_id  # w1's lease lapsed
+
+    assert store.ack(job_id, "w1", {"saved_items": 1}) is False
+    assert store.fail(job_id, "w1", "boom") is False
+    assert _status(store, job_id) == RUNNING
+
+    assert store.ack(job_id, "w2", {"saved_items": 1}) is True
+    assert _status(store, job_id) == DONE
+
+
+def test_heartbeat_keeps_job_leased(tmp_path):
+    store = _store(tmp_path, lease_seconds=0.2)
+    job_id = store.enqueue(AgentTurn(user_id="u1", member_id=None, user_message="hi", assistant_response="hello"))
+    store.claim("w1")
+    for _ in range(4):
+        time.sleep(0.1)
+        assert store.heartbeat(job_id, "w1") is True
+    store.enqueue(AgentTurn(user_id="u2", member_id=None, user_message="hi", assistant_response="hello"))
+    claimed = store.claim("w2")
+    assert claimed is not None and claimed[0] != job_id
+    assert store.heartbeat(job_id, "w2") is False
+
+
+def test_fail_requeues_with_backoff(tmp_path):
+    store = _store(tmp_path, retry_backoff_seconds=60)
+    job_id = store.enqueue(AgentTurn(user_id="u1", member_id=None, user_message="hi", assistant_response="hello"))
+    store.claim("w1")
+    assert store.fail(job_id, "w1", "boom") is True
+    assert _status(store, job_id) == QUEUED
+    assert store.claim("w1") is None
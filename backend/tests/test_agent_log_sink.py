@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.agent_log_sink import AgentLogSink  # noqa: E402
+
+
+class _FakeInsert:
+    def __init__(self, client, rows):
+        self.client = client
+        self.rows = rows
+
+    def execute(self):
+        self.client.calls += 1
+        # Mimic DECIMAL(3,2): any out-of-range score rejects the whole statement
+        if any((row.get("confidence_score") or 0) > 1 or row.get("bad") for row in self.rows):
+            raise RuntimeError("numeric field overflow")
+        self.client.rows.extend(self.rows)
+
+
+class _FakeClient:
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+
+    def table(self, name):
+        return self
+
+    def insert(self, rows):
+        return _FakeInsert(self, rows)
+
+
+def _row(n, **extra):
+    return {"iteration": n, "success": True, "confidence_score": 0.5, **extra}
+
+
+def test_confidence_is_scaled_and_clamped_before_buffering():
+    client = _FakeClient()
+    sink = AgentLogSink(client=client, batch_size=100, flush_interval_seconds=60)
+    for value in (85, 0.7, -3, 250, "high", None, float("nan")):
+        sink.submit(_row(0, confidence_score=value))
+    assert sink.flush() == 7
+    assert [row["confidence_score"] for row in client.rows] == [0.85, 0.7, 0.0, 1.0, None, None, None]
+
+
+def test_one_bad_row_does_not_drop_its_batch():
+    client = _FakeClient()
+    sink = AgentLogSink(client=client, batch_size=64, flush_interval_seconds=60)
+    for n in range(50):
+        sink.submit(_row(n, bad=(n == 17)))
+    assert sink.flush() == 49
+    assert sorted(row["iteration"] for row in client.rows) == [n for n in range(50) if n != 17]
+    stats = sink.stats()
+    assert stats["written"] == 49
+    assert stats["failed"] == 1
+    # Bisection, not one request per row
+    assert client.calls < 20
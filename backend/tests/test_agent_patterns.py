@@ -0,0 +1,24 @@
+from app.agent_patterns import KeywordMatcher, symptom_matcher
+
+
+def test_symptom_matcher_ignores_non_symptom_statements():
+    assert symptom_matcher.find("I have a question about my metformin dosage") == []
+    assert symptom_matcher.find("I have an appointment with Dr Rao on Friday") == []
+    assert symptom_matcher.find("what I have to eat?") == []
+
+
+def test_symptom_matcher_finds_terms_in_order_on_word_boundaries():
+    assert symptom_matcher.find("I have a Sore Throat and fever since Monday") == ["sore throat", "fever"]
+    assert symptom_matcher.find("mom will scold me") == []
+
+
+def test_symptom_matcher_accepts_inflected_forms():
+    assert symptom_matcher.find("I've been coughing all night") == ["cough"]
+    assert symptom_matcher.find("Frequent headaches lately") == ["headache"]
+    assert symptom_matcher.find("feeling feverish, with chills") == ["fever", "chills"]
+    assert symptom_matcher.find("sore throats and vomiting twice") == ["sore throat", "vomiting"]
+
+
+def test_keyword_matcher_prefers_longer_keyword():
+    matcher = KeywordMatcher(["pain", "pain relief"])
+    assert matcher.find("need pain relief") == ["pain relief"]
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.agent_queue import AgentTurn  # noqa: E402
+
+
+def _turn(n, history):
+    return AgentTurn(user_id="u1", user_message=f"user {n}", assistant_response=f"assistant {n}", conversation_history=history)
+
+
+def _msg(role, n):
+    return {"role": role, "content": f"{role} {n}"}
+
+
+def test_absorb_keeps_every_exchange_in_order_ending_with_the_newest():
+    first = _turn(1, [_msg("user", 0), _msg("assistant", 0)])
+    second = _turn(2, [_msg("user", 0), _msg("assistant", 0), _msg("user", 1), _msg("assistant", 1)])
+    third = _turn(3, second.conversation_history + [_msg("user", 2), _msg("assistant", 2)])
+    second.absorb(first)
+    third.absorb(second)
+    assert third.conversation_history == [_msg(role, n) for n in range(4) for role in ("user", "assistant")]
+    assert third.coalesced == 2
@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.agent_registry import AgentRegistry, MemoryAgentStateStore  # noqa: E402
+
+
+class _Agent:
+    def __init__(self, user_id, state):
+        self.user_id = user_id
+        self.state = state
+
+    def is_busy(self):
+        return False
+
+    def to_state(self):
+        return {"user_id": self.user_id}
+
+
+class _CountingStore(MemoryAgentStateStore):
+    def __init__(self):
+        super().__init__()
+        self.loads = 0
+
+    def load(self, user_id):
+        self.loads += 1
+        return super().load(user_id)
+
+
+def test_get_neither_creates_rehydrates_nor_refreshes_recency():
+    store = _CountingStore()
+    store.save("evicted", {"user_id": "evicted"})
+    registry = AgentRegistry(max_size=2, idle_ttl_seconds=0, state_store=store, factory=_Agent)
+    first = registry.get_or_create("a")
+    registry.get_or_create("b")
+    loads = store.loads
+
+    assert registry.get("missing") is None
+    assert registry.get("evicted") is None
+    assert store.loads == loads
+    assert registry.stats()["live_agents"] == 2
+
+    # Peeking at "a" must not save it from being the LRU victim
+    assert registry.get("a") is first
+    registry.get_or_create("c")
+    assert registry.get("a") is None
+    assert registry.get("b") is not None
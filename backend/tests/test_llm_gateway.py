@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("requests")
+
+from app.config import settings  # noqa: E402
+from app.llm_gateway import LLMUnavailableError, Provider, background_work  # noqa: E402
+
+
+@pytest.fixture
+def short_waits(monkeypatch):
+    monkeypatch.setattr(settings, "llm_acquire_timeout_seconds", 0.05)
+    monkeypatch.setattr(settings, "llm_background_acquire_timeout_seconds", 0.05)
+
+
+def test_background_work_cannot_take_chat_slots(short_waits):
+    provider = Provider("test", max_concurrency=3, background_concurrency=1)
+    with background_work():
+        held = provider.slot()
+        held.__enter__()
+        with pytest.raises(LLMUnavailableError):
+            with provider.slot():
+                pass
+    # Chat still gets the two reserved slots
+    with provider.slot(), provider.slot():
+        assert provider.stats()["in_flight"] == 3
+        assert provider.stats()["background_in_flight"] == 1
+    held.__exit__(None, None, None)
+    assert provider.stats()["in_flight"] == 0
+
+
+def test_background_slot_released_when_total_is_full(short_waits):
+    provider = Provider("test", max_concurrency=1, background_concurrency=1)
+    with provider.slot():
+        with pytest.raises(LLMUnavailableError):
+            with background_work(), provider.slot():
+                pass
+    with background_work(), provider.slot():
+        assert provider.stats()["background_in_flight"] == 1
+
+
+def test_background_flag_does_not_leak_to_other_threads(short_waits):
+    provider = Provider("test", max_concurrency=2, background_concurrency=1)
+    seen = []
+    with background_work(), provider.slot():
+        thread = threading.Thread(target=lambda: seen.append(provider.slot().__enter__() is None))
+        thread.start()
+        thread.join()
+    assert seen == [True]
+
+
+def test_cancelled_half_open_trial_does_not_wedge_the_breaker(monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(settings, "llm_breaker_failure_threshold", 1)
+    monkeypatch.setattr(settings, "llm_breaker_reset_seconds", 0.0)
+    provider = Provider("test", max_concurrency=2)
+    provider.breaker.record_failure()
+    assert provider.breaker.state == "open"
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(10)
+
+        trial = asyncio.ensure_future(provider.acall(hang, retries=0))
+        await started.wait()
+        assert provider.breaker.state == "half_open"
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        async def ok():
+            return "ok"
+
+        return await provider.acall(ok, retries=0)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert provider.breaker.state == "closed"
+    assert provider.stats()["in_flight"] == 0
@@ -0,0 +1,28 @@
+from app.prompt_builder import CHARS_PER_TOKEN, estimate_tokens, truncate_to_tokens
+
+
+def test_head_hard_cuts_long_first_line():
+    text = "x" * 3300 + "\ny"
+    out = truncate_to_tokens(text, 800)
+    assert out == "x" * (800 * CHARS_PER_TOKEN)
+
+
+def test_tail_hard_cuts_long_last_line():
+    history = "User: hi\nAssistant: " + "z" * 3300
+    out = truncate_to_tokens(history, 800, keep="tail")
+    assert out
+    assert out.endswith("z")
+    assert len(out) == 800 * CHARS_PER_TOKEN
+
+
+def test_keeps_whole_lines_within_budget():
+    text = "\n".join(f"line {i}" for i in range(100))
+    head = truncate_to_tokens(text, 20)
+    tail = truncate_to_tokens(text, 20, keep="tail")
+    assert head.startswith("line 0\n") and estimate_tokens(head) <= 20
+    assert tail.endswith("line 99") and estimate_tokens(tail) <= 20
+
+
+def test_short_text_unchanged():
+    assert truncate_to_tokens("short", 10) == "short"
+    assert truncate_to_tokens("short", 0) == ""
@@ -0,0 +1,27 @@
+from app.text_chunking import iter_chunks
+
+
+def test_keeps_lab_rows_at_page_edges():
+    pages = [
+        "CITY LAB\nHemoglobin  13.5  g/dL  13.0-17.0\nPatient fasted before the test.",
+        "CITY LAB\nHemoglobin  11.0  g/dL  13.0-17.0\nRepeat test after two weeks.",
+    ]
+    text = "\n".join(iter_chunks(pages, min_tokens=1))
+    assert "Hemoglobin 13.5" in text
+    assert "Hemoglobin 11.0" in text
+    assert text.count("CITY LAB") == 1
+
+
+def test_keeps_numeric_lines_that_differ_only_in_digits():
+    pages = ["Glucose 92 mg/dL\nNormal.", "Glucose 180 mg/dL\nHigh."]
+    text = "\n".join(iter_chunks(pages, min_tokens=1))
+    assert "Glucose 92 mg/dL" in text
+    assert "Glucose 180 mg/dL" in text
+
+
+def test_drops_repeated_footer_and_page_numbers():
+    pages = [f"Results for page {n}.\nCity Lab, confidential\nPage {n} of 3" for n in (1, 2, 3)]
+    text = "\n".join(iter_chunks("\f".join(pages), min_tokens=1))
+    assert text.count("City Lab, confidential") == 1
+    assert "of 3" not in text
+    assert "Results for page 3." in text
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+pytest.importorskip("supabase")
+
+from app import vector_index as vi  # noqa: E402
+
+
+class _NoFallback:
+    def search(self, *args):
+        raise AssertionError("fallback used")
+
+
+def _index(**kwargs):
+    options = {"max_users": 10, "ttl_seconds": 60, "max_documents": 1000, "fallback": _NoFallback()}
+    options.update(kwargs)
+    return vi.LocalVectorIndex(**options)
+
+
+def _row(i, vector):
+    return {"id": i, "content": f"doc {i}", "metadata": {}, "embedding": vector}
+
+
+def test_segment_grows_past_initial_capacity_and_ranks_by_cosine():
+    segment = vi._Segment()
+    for i in range(150):
+        segment.append({"id": i}, vi._unit_vector([1.0, i / 150]))
+    segment.append({"id": "other-model"}, vi._unit_vector([1.0, 0.0, 0.0]))
+    assert len(segment.rows) == 150
+    best = segment.top_k(vi._unit_vector([0.0, 1.0]), 3)
+    assert [r["id"] for r in best] == [149, 148, 147]
+    assert best[0]["similarity"] == pytest.approx(0.7046, abs=1e-3)
+
+
+def test_concurrent_first_queries_share_one_load(monkeypatch):
+    index = _index()
+    calls = []
+
+    def slow_load(user_id):
+        calls.append(user_id)
+        time.sleep(0.1)
+        entry = vi._UserEntry()
+        entry.segments[vi._SELF] = vi._Segment()
+        entry.segments[vi._SELF].append({"id": 1}, vi._unit_vector([1.0, 0.0]))
+        return entry
+
+    monkeypatch.setattr(index, "_load", slow_load)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(index.search("u1", None, [1.0, 0.0], 5)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["u1"]
+    assert all(r and r[0]["id"] == 1 for r in results)
+
+
+def test_invalidate_during_load_keeps_result_out_of_cache(monkeypatch):
+    index = _index()
+    loads = []
+
+    def load(user_id):
+        loads.append(user_id)
+        if len(loads) == 1:
+            index.invalidate(user_id)
+        return vi._UserEntry()
+
+    monkeypatch.setattr(index, "_load", load)
+    index.search("u1", None, [1.0, 0.0], 5)
+    index.search("u1", None, [1.0, 0.0], 5)
+    assert loads == ["u1", "u1"]
+    index.search("u1", None, [1.0, 0.0], 5)
+    assert len(loads) == 2
+
+
+def test_add_appends_to_loaded_user(monkeypatch):
+    index = _index()
+    monkeypatch.setattr(index, "_load", lambda user_id: vi._UserEntry())
+    assert index.search("u1", None, [1.0, 0.0], 5) == []
+    index.add("u1", None, _row(7, "[0.6, 0.8]"))
+    hits = index.search("u1", None, [0.6, 0.8], 5)
+    assert [h["id"] for h in hits] == [7]
+    assert hits[0]["similarity"] == pytest.approx(1.0, abs=1e-5)